@@ -20,9 +20,12 @@ import subprocess
 from testtools.matchers import (
     DirExists,
     EndsWith,
+    Is,
     Not
 )
 
+from snapcraft.internal import states
+
 import integration_tests
 
 
@@ -34,24 +37,18 @@ class CleanDependentsTestCase(integration_tests.TestCase):
         self.project_dir = 'dependencies'
         self.run_snapcraft('prime', self.project_dir)
 
-        # Need to use the state directory here instead of partdir due to
-        # bug #1567054.
-        self.part_dirs = {
-            'p1': os.path.join(self.project_dir, 'parts', 'p1', 'state'),
-            'p2': os.path.join(self.project_dir, 'parts', 'p2', 'state'),
-            'p3': os.path.join(self.project_dir, 'parts', 'p3', 'state'),
-            'p4': os.path.join(self.project_dir, 'parts', 'p4', 'state'),
-        }
-
         self.partsdir = os.path.join(self.project_dir, 'parts')
         self.stagedir = os.path.join(self.project_dir, 'stage')
         self.snapdir = os.path.join(self.project_dir, 'prime')
 
     def assert_clean(self, parts, common=False):
+        # Need to use the state of the parts here instead of partdir due to
+        # bug #1567054.
+        store = states.get_store(self.partsdir)
         for part in parts:
             self.expectThat(
-                self.part_dirs[part], Not(DirExists()),
-                'Expected part directory for {!r} to be cleaned'.format(part))
+                store.get_last_step(part), Is(None),
+                'Expected part {!r} to be cleaned'.format(part))
 
         if common:
             self.expectThat(self.partsdir, Not(DirExists()),
@@ -62,11 +59,11 @@ class CleanDependentsTestCase(integration_tests.TestCase):
                             'Expected snap/ directory to be cleaned')
 
     def assert_not_clean(self, parts, common=False):
+        store = states.get_store(self.partsdir)
         for part in parts:
             self.expectThat(
-                self.part_dirs[part], DirExists(),
-                'Expected part directory for {!r} to be uncleaned'.format(
-                    part))
+                store.get_last_step(part), Not(Is(None)),
+                'Expected part {!r} to be uncleaned'.format(part))
 
         if common:
             self.expectThat(self.partsdir, DirExists(),
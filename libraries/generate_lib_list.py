@@ -6,8 +6,7 @@ import subprocess
 import sys
 import tempfile
 
-from snapcraft.config import load_config
-from snapcraft.storeapi import download
+import snapcraft
 
 
 def generate_list(file_path):
@@ -27,11 +26,12 @@ def main():
         sys.exit(1)
     target_file = sys.argv[1]
 
-    config = load_config()
-    with tempfile.NamedTemporaryFile() as temp:
+    # The download is written next to the snap, then moved into place.
+    with tempfile.TemporaryDirectory() as temp_dir:
+        snap_path = os.path.join(temp_dir, 'ubuntu-core.snap')
         print('Downloading')
-        download('ubuntu-core', 'stable', temp.name, config, 'amd64')
-        lib_list = generate_list(temp.name)
+        snapcraft.download('ubuntu-core', 'stable', snap_path, 'amd64')
+        lib_list = generate_list(snap_path)
 
     lib_list = ('{}\n'.format(l) for l in lib_list)
 
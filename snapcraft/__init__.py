@@ -223,6 +223,13 @@ of the choice of plugin.
 
 """
 
+import os as _os
+
+# Before anything else is imported, so that it is reported.
+if _os.environ.get('SNAPCRAFT_IMPORT_TIME'):
+    from snapcraft import _importtime
+    _importtime.enable()
+
 from snapcraft._baseplugin import BasePlugin        # noqa
 from snapcraft._options import ProjectOptions       # noqa
 from snapcraft._help import topic_help              # noqa
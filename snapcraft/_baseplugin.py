@@ -19,7 +19,7 @@ import glob
 import os
 import shutil
 
-from snapcraft.internal import common, sources
+from snapcraft.internal import common, jobserver, sources, sync
 
 
 class BasePlugin:
@@ -94,6 +94,8 @@ class BasePlugin:
         self.installdir = os.path.join(self.partdir, 'install')
 
         self.build_basedir = os.path.join(self.partdir, 'build')
+        # What was synced from sourcedir into build_basedir.
+        self._build_manifest = os.path.join(self.partdir, 'build-manifest')
         source_subdir = getattr(self.options, 'source_subdir', None)
         if source_subdir:
             self.builddir = os.path.join(self.build_basedir, source_subdir)
@@ -139,10 +141,12 @@ class BasePlugin:
         The base implementation only copies sourcedir to build_basedir.
         Override this method if you need to process the source code to make it
         runnable.
-        """
 
-        if os.path.exists(self.build_basedir):
-            shutil.rmtree(self.build_basedir)
+        What is left in build_basedir from a previous build is kept: only
+        the files that changed in sourcedir are copied again (keeping their
+        modification time) and files removed from sourcedir are removed, so
+        build tools can do incremental builds.
+        """
 
         # FIXME: It's not necessary to ignore here anymore since it's now done
         # in the Local source. However, it's left here so that it continues to
@@ -158,8 +162,10 @@ class BasePlugin:
             else:
                 return []
 
-        shutil.copytree(
-            self.sourcedir, self.build_basedir, symlinks=True, ignore=ignore)
+        # Hard links would let the build change the source, use reflinks.
+        sync.sync_tree(self.sourcedir, self.build_basedir, ignore=ignore,
+                       manifest=self._build_manifest,
+                       copy_function=common.clone_or_copy)
 
     def clean_build(self):
         """Clean the artifacts that resulted from building this part.
@@ -172,6 +178,9 @@ class BasePlugin:
         if os.path.exists(self.build_basedir):
             shutil.rmtree(self.build_basedir)
 
+        if os.path.exists(self._build_manifest):
+            os.remove(self._build_manifest)
+
         if os.path.exists(self.installdir):
             shutil.rmtree(self.installdir)
 
@@ -215,6 +224,16 @@ class BasePlugin:
             '{!r} plugin'.format(self.name))
 
     # Helpers
+    def parallel_make_args(self):
+        """Return the arguments make needs to run parallel jobs.
+
+        When snapcraft runs a jobserver, make takes its jobs from it through
+        MAKEFLAGS, and passing -j would make it ignore the jobserver.
+        """
+        if jobserver.get():
+            return []
+        return ['-j{}'.format(self.project.parallel_build_count)]
+
     def run(self, cmd, cwd=None, **kwargs):
         if cwd is None:
             cwd = self.builddir
@@ -17,12 +17,12 @@
 
 import importlib
 
-import snapcraft
-from snapcraft.internal import sources
+from snapcraft.internal import pluginindex
 
+# The modules documenting each topic, only imported to show their help.
 _TOPICS = {
-    'sources': sources,
-    'plugins': snapcraft,
+    'sources': 'snapcraft.internal.sources',
+    'plugins': 'snapcraft',
 }
 
 
@@ -37,23 +37,25 @@ def topic_help(topic, show_devel, list_topics):
 
 
 def _topic_help(module_name, devel):
+    module = importlib.import_module(_TOPICS[module_name])
     if devel:
-        help(_TOPICS[module_name])
+        help(module)
     else:
-        print(_TOPICS[module_name].__doc__)
+        print(module.__doc__)
 
 
 def _module_help(module_name, devel):
     try:
-        module = importlib.import_module(
-            'snapcraft.plugins.{}'.format(module_name))
-        if module.__doc__ and devel:
-            help(module)
-        elif module.__doc__:
-            print(module.__doc__)
-        else:
-            print('The plugin has no documentation')
-    except ImportError:
+        doc = pluginindex.get_plugin_doc(module_name)
+    except KeyError:
         raise EnvironmentError(
             'The plugin does not exist. Run `snapcraft list-plugins` '
             'to see the available plugins.')
+
+    if doc and devel:
+        help(importlib.import_module(
+            'snapcraft.plugins.{}'.format(module_name)))
+    elif doc:
+        print(doc)
+    else:
+        print('The plugin has no documentation')
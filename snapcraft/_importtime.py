@@ -0,0 +1,110 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Report how long importing each module takes, like python3 -X importtime.
+
+It is enabled by setting SNAPCRAFT_IMPORT_TIME in the environment, and
+prints to stderr, for every module imported, the time spent importing it
+without and with the modules it imports, in microseconds, indented by how
+deeply it was imported. Only standard library modules are used here, as
+what this imports is not reported.
+"""
+
+import builtins
+import importlib
+import importlib.util
+import sys
+import threading
+import time
+
+
+_local = threading.local()
+_enabled = False
+
+
+def enable(stream=None):
+    """Report the imports done from now on to stream, stderr by default."""
+    global _enabled
+    if _enabled:
+        return
+    _enabled = True
+
+    if not stream:
+        stream = sys.stderr
+    stream.write('import time: self [us] | cumulative | imported package\n')
+
+    original_import = builtins.__import__
+    original_import_module = importlib.import_module
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        if level:
+            package = (globals or {}).get('__package__') or ''
+            try:
+                absolute = importlib.util.resolve_name(
+                    '.' * level + name, package)
+            except (ImportError, ValueError):
+                absolute = name
+        else:
+            absolute = name
+        return _time(stream, _get_new_module(absolute, fromlist),
+                     original_import, name, globals, locals, fromlist, level)
+
+    def timed_import_module(name, package=None):
+        absolute = name
+        if name.startswith('.'):
+            absolute = importlib.util.resolve_name(name, package)
+        return _time(stream, _get_new_module(absolute, ()),
+                     original_import_module, name, package)
+
+    builtins.__import__ = timed_import
+    importlib.import_module = timed_import_module
+
+
+def _get_new_module(name, fromlist):
+    # The module this import loads, if it loads one.
+    if name not in sys.modules:
+        return name
+    for item in fromlist or ():
+        submodule = '{}.{}'.format(name, item)
+        if item != '*' and submodule not in sys.modules:
+            return submodule
+    return None
+
+
+def _time(stream, module_name, function, *args):
+    if not module_name:
+        return function(*args)
+
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+
+    # The time spent importing the modules this one imports is added to
+    # its last entry.
+    stack.append(0)
+    start = time.perf_counter()
+    try:
+        return function(*args)
+    finally:
+        elapsed = time.perf_counter() - start
+        nested = stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        # Names in fromlist can be attributes rather than modules.
+        if module_name in sys.modules:
+            stream.write('import time: {:>9} | {:>10} | {}{}\n'.format(
+                int((elapsed - nested) * 1e6), int(elapsed * 1e6),
+                '  ' * len(stack), module_name))
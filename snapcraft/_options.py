@@ -87,6 +87,14 @@ class ProjectOptions:
 
         return build_count
 
+    @property
+    def parallel_part_count(self):
+        return self.__parallel_part_count
+
+    @property
+    def use_build_cache(self):
+        return self.__use_build_cache
+
     @property
     def is_cross_compiling(self):
         return self.__target_machine != self.__host_machine
@@ -137,12 +145,15 @@ class ProjectOptions:
         return os.path.join(self.__project_dir, 'prime')
 
     def __init__(self, use_geoip=False, parallel_builds=True,
-                 target_deb_arch=None):
+                 target_deb_arch=None, parallel_part_count=1,
+                 use_build_cache=False):
         # TODO: allow setting a different project dir and check for
         #       snapcraft.yaml
         self.__project_dir = os.getcwd()
         self.__use_geoip = use_geoip
         self.__parallel_builds = parallel_builds
+        self.__parallel_part_count = max(parallel_part_count, 1)
+        self.__use_build_cache = use_build_cache
         self._set_machine(target_deb_arch)
 
     def _set_machine(self, target_deb_arch):
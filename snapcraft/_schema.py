@@ -15,7 +15,9 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import json
 import os
+import threading
 
 import jsonschema
 import yaml
@@ -58,8 +60,7 @@ class Validator:
         schema_file = os.path.abspath(os.path.join(
             common.get_schemadir(), 'snapcraft.yaml'))
         try:
-            with open(schema_file) as fp:
-                self._schema = yaml.load(fp)
+            self._schema = _load_schema(schema_file)
         except FileNotFoundError:
             raise SnapcraftSchemaError(
                 'snapcraft validation file is missing from installation path')
@@ -67,8 +68,8 @@ class Validator:
     def validate(self):
         format_check = jsonschema.FormatChecker()
         try:
-            jsonschema.validate(
-                self._snapcraft, self._schema, format_checker=format_check)
+            validate(self._snapcraft, self._schema,
+                     format_checker=format_check)
         except jsonschema.ValidationError as e:
             messages = [e.message]
             if e.path:
@@ -78,3 +79,42 @@ class Validator:
                 messages.append('({})'.format(e.cause))
 
             raise SnapcraftSchemaError(' '.join(messages))
+
+
+_schemas = {}
+_checked_schemas = {}
+_schemas_lock = threading.Lock()
+
+
+def _load_schema(schema_file):
+    # Parsing the schema is slow, only do it again if it changed.
+    st = os.stat(schema_file)
+    key = (schema_file, st.st_mtime_ns, st.st_size)
+    with _schemas_lock:
+        if key not in _schemas:
+            with open(schema_file) as fp:
+                _schemas[key] = yaml.load(fp)
+        return _schemas[key]
+
+
+def validate(instance, schema, format_checker=None):
+    """Validate instance against schema, like jsonschema.validate.
+
+    Checking that a schema is itself valid costs more than most validations
+    it is used for, so each schema is only checked once.
+
+    :raises jsonschema.ValidationError: if instance is invalid.
+    """
+    # Schemas are dicts, key them on their contents.
+    key = json.dumps(schema, sort_keys=True, default=repr)
+    with _schemas_lock:
+        cls = _checked_schemas.get(key)
+        if not cls:
+            cls = jsonschema.validators.validator_for(schema)
+            cls.check_schema(schema)
+            _checked_schemas[key] = cls
+
+    error = jsonschema.exceptions.best_match(
+        cls(schema, format_checker=format_checker).iter_errors(instance))
+    if error is not None:
+        raise error
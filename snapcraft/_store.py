@@ -20,10 +20,10 @@ import subprocess
 import tempfile
 import os
 
-from tabulate import tabulate
 import yaml
 
-from snapcraft import storeapi
+# The store API, and requests which it uses, are only imported by the
+# commands talking to the store, as they take long to import.
 
 
 logger = logging.getLogger(__name__)
@@ -45,6 +45,7 @@ def _get_name_from_snap_file(snap_path):
 
 
 def login():
+    from snapcraft import storeapi
     print('Enter your Ubuntu One SSO credentials.')
     email = input('Email: ')
     password = getpass.getpass('Password: ')
@@ -67,6 +68,7 @@ def login():
 
 
 def logout():
+    from snapcraft import storeapi
     logger.info('Clearing credentials for Ubuntu One SSO.')
     store = storeapi.StoreClient()
     store.logout()
@@ -74,6 +76,7 @@ def logout():
 
 
 def register(snap_name):
+    from snapcraft import storeapi
     logger.info('Registering {}.'.format(snap_name))
     store = storeapi.StoreClient()
     try:
@@ -87,6 +90,7 @@ def register(snap_name):
 
 
 def upload(snap_filename):
+    from snapcraft import storeapi
     if not os.path.exists(snap_filename):
         raise FileNotFoundError(
             'The file {!r} does not exist.'.format(snap_filename))
@@ -140,6 +144,8 @@ def _get_text_for_channel(channel):
 
 
 def release(snap_name, revision, channel):
+    from snapcraft import storeapi
+    from tabulate import tabulate
     try:
         store = storeapi.StoreClient()
         channels = store.release(snap_name, revision, [channel])
@@ -161,6 +167,7 @@ def release(snap_name, revision, channel):
 
 def download(snap_name, channel, download_path, arch):
     """Download snap from the store to download_path"""
+    from snapcraft import storeapi
     try:
         store = storeapi.StoreClient()
         store.download(snap_name, channel, download_path, arch)
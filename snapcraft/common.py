@@ -18,6 +18,7 @@ from snapcraft.internal.common import get_python2_path      # noqa
 from snapcraft.internal.common import isurl                 # noqa
 from snapcraft.internal.common import link_or_copy          # noqa
 from snapcraft.internal.common import replace_in_file       # noqa
+from snapcraft.internal.common import search_and_replace_contents  # noqa
 from snapcraft.internal.common import get_include_paths     # noqa
 from snapcraft.internal.common import get_library_paths     # noqa
 from snapcraft.internal.common import combine_paths         # noqa
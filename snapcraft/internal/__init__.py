@@ -15,4 +15,10 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from snapcraft.internal import states            # noqa
-from snapcraft.internal.yaml import load_config  # noqa
+
+
+def load_config(project_options=None):
+    # Loading the configuration needs most of snapcraft, import it only
+    # when a command needs a project.
+    from snapcraft.internal import yaml
+    return yaml.load_config(project_options)
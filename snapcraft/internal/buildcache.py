@@ -0,0 +1,398 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A content-addressed cache of built parts.
+
+The result of building a part (its installdir) is stored under a key made
+from everything that goes into the build: the plugin code and the part
+options, the pulled source tree, the target architecture, where the part
+is installed and the files the part's dependencies put in the staging area.
+Building a part whose key is already in the cache restores the installdir
+from there instead of running the plugin.
+
+Entries are kept in the user's cache directory and restored as clones
+where the file system supports it, copies otherwise: never hard links,
+which changes made later to the installdir would write through to.
+
+Setting SNAPCRAFT_BUILD_CACHE_URL adds a remote cache behind the local one,
+shared by every machine using the same URL. Entries missing locally are
+fetched from it, and entries built locally are uploaded to it, as gzipped
+tarballs. An http(s) URL is expected to accept GET and PUT requests for
+<url>/<key>.tar.gz.
+"""
+
+import concurrent.futures
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import sys
+import tarfile
+import threading
+import tempfile
+import urllib.parse
+
+import requests
+from xdg import BaseDirectory
+
+from snapcraft.internal import common
+
+
+logger = logging.getLogger(__name__)
+
+# Options that only matter after the build step.
+_IGNORED_OPTIONS = ('stage', 'snap', 'organize')
+
+_BUFFER_SIZE = 1024 * 1024
+
+# The number of entries fetched from a remote cache at the same time.
+_FETCH_JOBS = 4
+
+# Seconds to wait for a connection to a remote cache, and then for data.
+_TIMEOUT = (30, 60)
+
+
+class BuildCacheError(Exception):
+    pass
+
+
+def _get_default_cache_dir():
+    return os.path.join(BaseDirectory.xdg_cache_home, 'snapcraft', 'build')
+
+
+class HTTPBackend:
+    """A remote cache on an HTTP server supporting GET and PUT."""
+
+    def __init__(self, url):
+        self._url = url.rstrip('/') + '/'
+
+    @contextlib.contextmanager
+    def get(self, key):
+        """Stream the tarball for key, yields None if there is none."""
+        response = requests.get(self._entry_url(key), stream=True,
+                                timeout=_TIMEOUT)
+        try:
+            if response.status_code == 404:
+                yield None
+            else:
+                response.raise_for_status()
+                yield response.raw
+        finally:
+            response.close()
+
+    def put(self, key, chunks):
+        """Upload the tarball for key, given as an iterable of chunks."""
+        requests.put(self._entry_url(key), data=chunks,
+                     timeout=_TIMEOUT).raise_for_status()
+
+    def _entry_url(self, key):
+        return urllib.parse.urljoin(self._url, '{}.tar.gz'.format(key))
+
+
+_BACKENDS = {
+    'http': HTTPBackend,
+    'https': HTTPBackend,
+}
+
+
+def get_cache():
+    """Return the BuildCache configured for this environment."""
+    remote = None
+    url = os.environ.get('SNAPCRAFT_BUILD_CACHE_URL')
+    if url:
+        scheme = urllib.parse.urlparse(url).scheme
+        try:
+            remote = _BACKENDS[scheme](url)
+        except KeyError:
+            raise BuildCacheError(
+                'Unsupported build cache URL {!r}: the scheme must be one '
+                'of {}'.format(url, ', '.join(sorted(_BACKENDS))))
+
+    return BuildCache(remote=remote)
+
+
+class BuildCache:
+
+    def __init__(self, cache_dir=None, remote=None):
+        if not cache_dir:
+            cache_dir = _get_default_cache_dir()
+        self.cache_dir = cache_dir
+        self.remote = remote
+
+    def fetch(self, keys):
+        """Fetch the entries for keys from the remote cache, if any.
+
+        Entries already in the local cache are skipped, the others are
+        fetched concurrently.
+        """
+        keys = [k for k in set(keys) if not os.path.isdir(self._entry_path(k))]
+        if not self.remote or not keys:
+            return
+
+        with concurrent.futures.ThreadPoolExecutor(_FETCH_JOBS) as executor:
+            list(executor.map(self._fetch, keys))
+
+    def restore(self, key, installdir):
+        """Replace installdir with the cached build for key.
+
+        :returns: True if key was found in the cache, False otherwise.
+        """
+        entry = self._entry_path(key)
+        if not os.path.isdir(entry):
+            if not self.remote or not self._fetch(key):
+                return False
+
+        logger.debug('Restoring {!r} from build cache entry {}'.format(
+            installdir, key))
+        if os.path.exists(installdir):
+            shutil.rmtree(installdir)
+        shutil.copytree(entry, installdir, symlinks=True,
+                        copy_function=common.clone_or_copy)
+        return True
+
+    def save(self, key, installdir):
+        """Store the contents of installdir in the cache under key."""
+        entry = self._entry_path(key)
+        if os.path.isdir(entry):
+            return
+
+        with self._new_entry(key) as temp_entry:
+            shutil.copytree(installdir, temp_entry, symlinks=True,
+                            copy_function=common.clone_or_copy)
+        logger.debug('Saved {!r} as build cache entry {}'.format(
+            installdir, key))
+
+        if self.remote:
+            self._upload(key)
+
+    def _fetch(self, key):
+        try:
+            with self.remote.get(key) as stream:
+                if not stream:
+                    return False
+                with self._new_entry(key) as temp_entry:
+                    _extract(stream, temp_entry)
+        except (requests.RequestException, tarfile.TarError, OSError) as e:
+            logger.warning(
+                'Cannot fetch build cache entry {}: {}'.format(key, e))
+            return False
+
+        logger.debug('Fetched build cache entry {}'.format(key))
+        return True
+
+    def _upload(self, key):
+        try:
+            with _TarballStream(self._entry_path(key)) as stream:
+                self.remote.put(key, stream)
+        except (requests.RequestException, OSError) as e:
+            logger.warning(
+                'Cannot upload build cache entry {}: {}'.format(key, e))
+            return
+
+        logger.debug('Uploaded build cache entry {}'.format(key))
+
+    @contextlib.contextmanager
+    def _new_entry(self, key):
+        # Fill a temporary directory and move it in place, so an entry is
+        # either complete or missing even if snapcraft is interrupted or
+        # another snapcraft is saving the same entry.
+        os.makedirs(self.cache_dir, exist_ok=True)
+        temp_dir = tempfile.mkdtemp(prefix='.tmp-', dir=self.cache_dir)
+        try:
+            temp_entry = os.path.join(temp_dir, 'install')
+            yield temp_entry
+            try:
+                os.rename(temp_entry, self._entry_path(key))
+            except OSError:
+                if not os.path.isdir(self._entry_path(key)):
+                    raise
+        finally:
+            shutil.rmtree(temp_dir)
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+
+class _TarballStream:
+    """Iterate over the chunks of a gzipped tarball of directory.
+
+    The tarball is written by another thread as it is sent, rather than
+    written to disk in full first.
+    """
+
+    def __init__(self, directory):
+        self._directory = directory
+        self._error = None
+        read_fd, write_fd = os.pipe()
+        self._reader = open(read_fd, 'rb')
+        self._writer = open(write_fd, 'wb')
+        self._thread = threading.Thread(target=self._write)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        # The writer stops when it cannot write anymore.
+        self._reader.close()
+        self._thread.join()
+
+    def __iter__(self):
+        for chunk in iter(lambda: self._reader.read(_BUFFER_SIZE), b''):
+            yield chunk
+        self._thread.join()
+        if self._error:
+            # Failing the request rather than uploading a partial tarball.
+            raise self._error
+
+    def _write(self):
+        try:
+            with self._writer:
+                with tarfile.open(fileobj=self._writer, mode='w|gz') as tar:
+                    for name in sorted(os.listdir(self._directory)):
+                        tar.add(os.path.join(self._directory, name),
+                                arcname=name)
+        except OSError as e:
+            self._error = e
+
+
+def _extract(stream, directory):
+    os.mkdir(directory)
+    with tarfile.open(fileobj=stream, mode='r|gz') as tar:
+        tar.extractall(directory, members=_checked_members(tar))
+
+
+def _checked_members(tar):
+    # Paths are checked against the symlinks extracted before them, as
+    # going through one could lead out of the directory.
+    symlinks = set()
+    for member in tar:
+        names = [member.name]
+        if member.islnk():
+            names.append(member.linkname)
+        elif member.issym():
+            if os.path.isabs(member.linkname):
+                raise tarfile.TarError('unexpected symlink {!r} to {!r} in '
+                                       'tarball'.format(member.name,
+                                                        member.linkname))
+            names.append(os.path.join(
+                os.path.dirname(member.name), member.linkname))
+        for name in names:
+            if os.path.isabs(name) or not _is_inside(name, symlinks):
+                raise tarfile.TarError(
+                    'unexpected path {!r} in tarball'.format(name))
+        if member.issym():
+            symlinks.add(os.path.normpath(member.name))
+        yield member
+
+
+def _is_inside(path, symlinks):
+    """Whether the relative path stays inside the directory it is in,
+    without going through any of symlinks."""
+    parts = []
+    for part in path.split('/'):
+        if part in ('', '.'):
+            continue
+        if parts and '/'.join(parts) in symlinks:
+            return False
+        if part == '..':
+            if not parts:
+                return False
+            parts.pop()
+        else:
+            parts.append(part)
+    return True
+
+
+def compute_key(plugin, options, sourcedir, project_options,
+                dependency_files):
+    """Return the build cache key for a part.
+
+    :param plugin: the plugin instance building the part.
+    :param options: the part options as given to the plugin.
+    :param str sourcedir: the directory holding the pulled source.
+    :param project_options: the ProjectOptions for the project.
+    :param list dependency_files: the staged files of the parts this part
+                                  builds after, relative to the staging area.
+    """
+    digest = hashlib.sha256()
+
+    for cls in type(plugin).__mro__:
+        digest.update(cls.__qualname__.encode())
+        module = sys.modules.get(cls.__module__)
+        module_file = getattr(module, '__file__', None)
+        if module_file and os.path.isfile(module_file):
+            _update_with_file(digest, module_file)
+
+    properties = {k: v for k, v in vars(options).items()
+                  if k not in _IGNORED_OPTIONS}
+    digest.update(json.dumps(
+        properties, sort_keys=True, default=repr).encode())
+
+    # Builds routinely embed where they are installed and what they are
+    # built against, in pkg-config files, rpaths or shebangs: another
+    # checkout of the project has builds of its own.
+    digest.update(os.path.abspath(plugin.installdir).encode())
+    digest.update(os.path.abspath(project_options.stage_dir).encode())
+
+    digest.update(project_options.deb_arch.encode())
+    if project_options.is_cross_compiling:
+        digest.update(project_options.cross_compiler_prefix.encode())
+
+    _update_with_tree(digest, sourcedir)
+
+    for path in sorted(dependency_files):
+        digest.update(path.encode())
+        _update_with_path(
+            digest, os.path.join(project_options.stage_dir, path))
+
+    return digest.hexdigest()
+
+
+def _update_with_tree(digest, directory):
+    for root, directories, files in os.walk(directory):
+        directories.sort()
+        for name in sorted(directories + files):
+            path = os.path.join(root, name)
+            digest.update(os.path.relpath(path, directory).encode())
+            _update_with_path(digest, path)
+
+
+def _update_with_path(digest, path):
+    try:
+        st = os.lstat(path)
+    except FileNotFoundError:
+        digest.update(b'\0missing')
+        return
+
+    digest.update(str(stat.S_IMODE(st.st_mode)).encode())
+    if stat.S_ISLNK(st.st_mode):
+        digest.update(b'\0link\0')
+        digest.update(os.readlink(path).encode())
+    elif stat.S_ISREG(st.st_mode):
+        digest.update(b'\0file\0')
+        _update_with_file(digest, path)
+    else:
+        digest.update(b'\0dir')
+
+
+def _update_with_file(digest, path):
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_BUFFER_SIZE), b''):
+            digest.update(chunk)
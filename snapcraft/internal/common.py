@@ -16,7 +16,10 @@
 
 # Data/methods shared between plugins and snapcraft
 
-from contextlib import suppress
+import collections
+from contextlib import contextmanager, suppress
+import errno
+import fcntl
 import glob
 import logging
 import math
@@ -25,12 +28,31 @@ import shutil
 import subprocess
 import sys
 import tempfile
+import threading
 import urllib
 
+from snapcraft.internal import jobserver
+
 
 SNAPCRAFT_FILES = ['snapcraft.yaml', '.snapcraft.yaml', 'parts', 'stage',
                    'prime', 'snap']
 COMMAND_ORDER = ['pull', 'build', 'stage', 'prime']
+# The ioctl making a file share the data of another (a reflink), see
+# ioctl_ficlone(2).
+_FICLONE = 0x40049409
+# The ways link_or_copy can copy a file, from the cheapest to the most
+# expensive. A way found not to work from a filesystem to another is not
+# tried again for the files copied between them.
+_LINK = 'hard link'
+_CLONE = 'reflink'
+_COPY_RANGE = 'in-kernel copy'
+_COPY = 'copy'
+_COPY_TIERS = (_LINK, _CLONE, _COPY_RANGE, _COPY)
+# The errors telling a way of copying does not work between two
+# filesystems, rather than for a given file, like EINVAL for some special
+# files.
+_UNSUPPORTED_ERRNOS = (errno.EXDEV, errno.EOPNOTSUPP, errno.ENOTTY,
+                       errno.ENOSYS)
 _DEFAULT_PLUGINDIR = '/usr/share/snapcraft/plugins'
 _plugindir = _DEFAULT_PLUGINDIR
 _DEFAULT_SCHEMADIR = '/usr/share/snapcraft/schema'
@@ -43,27 +65,76 @@ _tourdir = _DEFAULT_TOURDIR
 MAX_CHARACTERS_WRAP = 120
 
 env = []
+_thread_local = threading.local()
+_copy_lock = threading.Lock()
+_copy_stats = collections.Counter()
+_devices = {}
+_unsupported_tiers = {}
 
 logger = logging.getLogger(__name__)
 
 
 def assemble_env():
-    return '\n'.join(['export ' + e for e in env])
+    current_env = getattr(_thread_local, 'env', env)
+    return '\n'.join(['export ' + e for e in current_env])
+
+
+@contextmanager
+def thread_context(thread_env, output=None):
+    """Give the calling thread its own environment and output.
+
+    Within this context set_env() and reset_env() only affect the calling
+    thread, and commands started through run() and run_output() write to
+    output instead of inheriting stdout.
+
+    :param list thread_env: the environment to start with.
+    :param output: a file-like object with a fileno().
+    """
+    _thread_local.env = thread_env
+    _thread_local.output = output
+    try:
+        yield
+    finally:
+        del _thread_local.env
+        del _thread_local.output
+
+
+def get_thread_output():
+    return getattr(_thread_local, 'output', None)
 
 
 def run(cmd, **kwargs):
     assert isinstance(cmd, list), 'run command must be a list'
+    output = get_thread_output()
+    if output:
+        kwargs.setdefault('stdout', output)
+        kwargs.setdefault('stderr', subprocess.STDOUT)
+    job_server = jobserver.get()
+    if job_server:
+        kwargs.setdefault('pass_fds', job_server.fds)
     # FIXME: This is gross to keep writing this, even when env is the same
     with tempfile.NamedTemporaryFile(mode='w+') as f:
         f.write(assemble_env())
         f.write('\n')
+        if job_server:
+            f.write('export MAKEFLAGS="{}"\n'.format(job_server.makeflags))
         f.write('exec "$@"')
         f.flush()
-        subprocess.check_call(['/bin/sh', f.name] + cmd, **kwargs)
+        with _job_token(job_server):
+            subprocess.check_call(['/bin/sh', f.name] + cmd, **kwargs)
+
+
+def _job_token(job_server):
+    if job_server:
+        return job_server.token()
+    return suppress()
 
 
 def run_output(cmd, **kwargs):
     assert isinstance(cmd, list), 'run command must be a list'
+    output = get_thread_output()
+    if output:
+        kwargs.setdefault('stderr', output)
     # FIXME: This is gross to keep writing this, even when env is the same
     with tempfile.NamedTemporaryFile(mode='w+') as f:
         f.write(assemble_env())
@@ -159,34 +230,185 @@ def isurl(url):
 
 
 def reset_env():
+    set_env([])
+
+
+def set_env(new_env):
     global env
-    env = []
+    if hasattr(_thread_local, 'env'):
+        _thread_local.env = new_env
+    else:
+        env = new_env
 
 
 def link_or_copy(source, destination, follow_symlinks=False):
     """Hard-link source and destination files. Copy if it fails to link.
 
     Hard-linking may fail (e.g. a cross-device link, or permission denied), so
-    as a backup plan we just copy it.
+    as a backup plan the file is copied the way clone_or_copy does.
 
     :param str source: The source to which destination will be linked.
     :param str destination: The destination to be linked to source.
     :param bool follow_symlinks: Whether or not symlinks should be followed.
     """
 
-    try:
-        # Note that follow_symlinks doesn't seem to work for os.link, so we'll
-        # implement this logic ourselves using realpath.
-        source_path = source
-        if follow_symlinks:
-            source_path = os.path.realpath(source)
+    _copy_file(source, destination, follow_symlinks, _COPY_TIERS)
+
+
+def clone_or_copy(source, destination, follow_symlinks=False):
+    """Copy source to destination, sharing its data if possible.
 
-        # Setting follow_symlinks=False in case this bug is ever fixed
-        # upstream-- we want this function to continue supporting NOT following
-        # symlinks.
-        os.link(source_path, destination, follow_symlinks=False)
-    except OSError:
-        shutil.copy2(source, destination, follow_symlinks=follow_symlinks)
+    On filesystems supporting it (e.g. btrfs or xfs) the copy is a reflink:
+    it shares the data of source until either file is modified, making it
+    about as cheap as a hard link without tying the two files together.
+    Elsewhere the data is copied within the kernel if possible, and read and
+    written back otherwise. Metadata is copied like shutil.copy2 does.
+
+    :param str source: The file to copy.
+    :param str destination: The copy to create.
+    :param bool follow_symlinks: Whether or not symlinks should be followed.
+    """
+
+    _copy_file(source, destination, follow_symlinks, _COPY_TIERS[1:])
+
+
+def get_copy_stats():
+    """Return how many files were copied so far using each copy method.
+
+    The methods are the ones link_or_copy and clone_or_copy go through, from
+    the cheapest to the most expensive: 'hard link', 'reflink',
+    'in-kernel copy' and 'copy'.
+    """
+    with _copy_lock:
+        return collections.Counter(_copy_stats)
+
+
+def format_copy_stats(stats):
+    """Return a summary of the stats returned by get_copy_stats."""
+    return ', '.join('{}: {}'.format(tier, stats[tier])
+                     for tier in _COPY_TIERS if stats[tier])
+
+
+def reset_copy_cache():
+    """Forget which ways of copying work between which filesystems."""
+    with _copy_lock:
+        _devices.clear()
+        _unsupported_tiers.clear()
+
+
+def _copy_file(source, destination, follow_symlinks, tiers):
+    filesystems = (_get_device(os.path.dirname(source)),
+                   _get_device(os.path.dirname(destination)))
+    unsupported = _unsupported_tiers.get(filesystems, ())
+    copy_symlink = None
+    for tier in tiers:
+        if tier in unsupported:
+            continue
+        if tier != _LINK and copy_symlink is None:
+            copy_symlink = not follow_symlinks and os.path.islink(source)
+            if not copy_symlink:
+                destination = _get_copy_destination(source, destination)
+        # A symlink is either hard-linked or created again.
+        if copy_symlink and tier != _COPY:
+            continue
+
+        try:
+            _COPY_FUNCTIONS[tier](source, destination,
+                                  follow_symlinks=follow_symlinks)
+        except OSError as e:
+            if tier == _COPY:
+                raise
+            if e.errno in _UNSUPPORTED_ERRNOS:
+                logger.debug('Not using {} to copy from {!r} to {!r}: '
+                             '{}'.format(tier, os.path.dirname(source),
+                                         os.path.dirname(destination), e))
+                with _copy_lock:
+                    _unsupported_tiers.setdefault(
+                        filesystems, set()).add(tier)
+            continue
+
+        with _copy_lock:
+            _copy_stats[tier] += 1
+        return
+
+
+def _get_device(directory):
+    # Only directories are looked up, there are far fewer of them than files.
+    try:
+        return _devices[directory]
+    except KeyError:
+        pass
+    try:
+        device = os.stat(directory or os.curdir).st_dev
+    except FileNotFoundError:
+        # Let copying report the missing file.
+        return None
+    _devices[directory] = device
+    return device
+
+
+def _get_copy_destination(source, destination):
+    # Like shutil.copy2, copy into destination if it is a directory.
+    if os.path.isdir(destination):
+        destination = os.path.join(destination, os.path.basename(source))
+    # Copying a file onto itself would truncate it.
+    if os.path.exists(destination) and os.path.samefile(source, destination):
+        raise shutil.SameFileError(
+            '{!r} and {!r} are the same file'.format(source, destination))
+    return destination
+
+
+def _link_file(source, destination, follow_symlinks):
+    # Note that follow_symlinks doesn't seem to work for os.link, so we'll
+    # implement this logic ourselves using realpath.
+    if follow_symlinks:
+        source = os.path.realpath(source)
+
+    # Setting follow_symlinks=False in case this bug is ever fixed
+    # upstream-- we want this function to continue supporting NOT following
+    # symlinks.
+    os.link(source, destination, follow_symlinks=False)
+
+
+def _clone_file(source, destination, follow_symlinks):
+    with open(source, 'rb') as source_file:
+        with open(destination, 'wb') as destination_file:
+            fcntl.ioctl(destination_file.fileno(), _FICLONE,
+                        source_file.fileno())
+    shutil.copystat(source, destination)
+
+
+def _copy_file_in_kernel(source, destination, follow_symlinks):
+    with open(source, 'rb') as source_file:
+        with open(destination, 'wb') as destination_file:
+            source_fd = source_file.fileno()
+            destination_fd = destination_file.fileno()
+            size = os.fstat(source_fd).st_size
+            offset = 0
+            while offset < size:
+                if hasattr(os, 'copy_file_range'):
+                    copied = os.copy_file_range(
+                        source_fd, destination_fd, size - offset)
+                else:
+                    copied = os.sendfile(
+                        destination_fd, source_fd, offset, size - offset)
+                if not copied:
+                    break
+                offset += copied
+            if offset < size:
+                # Left to the next way of copying, rather than leaving a
+                # truncated copy.
+                raise OSError(errno.EIO, 'copied {} of {} bytes'.format(
+                    offset, size))
+    shutil.copystat(source, destination)
+
+
+_COPY_FUNCTIONS = {
+    _LINK: _link_file,
+    _CLONE: _clone_file,
+    _COPY_RANGE: _copy_file_in_kernel,
+    _COPY: shutil.copy2,
+}
 
 
 def replace_in_file(directory, file_pattern, search_pattern, replacement):
@@ -201,11 +423,16 @@ def replace_in_file(directory, file_pattern, search_pattern, replacement):
     for root, directories, files in os.walk(directory):
         for file_name in files:
             if file_pattern.match(file_name):
-                _search_and_replace_contents(os.path.join(root, file_name),
-                                             search_pattern, replacement)
+                search_and_replace_contents(os.path.join(root, file_name),
+                                            search_pattern, replacement)
+
 
+def search_and_replace_contents(file_path, search_pattern, replacement):
+    """Replace search_pattern with replacement in the file at file_path.
 
-def _search_and_replace_contents(file_path, search_pattern, replacement):
+    Files hard-linked elsewhere are replaced rather than changed, leaving
+    their other links alone.
+    """
     with open(file_path, 'r+') as f:
         try:
             original = f.read()
@@ -214,10 +441,21 @@ def _search_and_replace_contents(file_path, search_pattern, replacement):
             return
 
         replaced = search_pattern.sub(replacement, original)
-        if replaced != original:
+        if replaced == original:
+            return
+        if os.fstat(f.fileno()).st_nlink == 1:
             f.seek(0)
             f.truncate()
             f.write(replaced)
+            return
+
+    # What a symlink points to is replaced, not the symlink.
+    real_path = os.path.realpath(file_path)
+    temp_path = '{}.{}.tmp'.format(real_path, os.getpid())
+    with open(temp_path, 'w') as f:
+        f.write(replaced)
+    shutil.copystat(real_path, temp_path)
+    os.rename(temp_path, real_path)
 
 
 def get_terminal_width(max_width=MAX_CHARACTERS_WRAP):
@@ -0,0 +1,142 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A cache of validated project configurations.
+
+Loading a project parses snapcraft.yaml, the schema and the remote parts,
+validates snapcraft.yaml and the properties of every part, and composes the
+part definitions. The result only depends on those files and on the local
+plugins, so it is kept, for each project, under a key made from them. As
+long as none of them changes, the next snapcraft command running in the
+project loads the part definitions from the cache and skips validation.
+"""
+
+import hashlib
+import logging
+import os
+import pickle
+
+from xdg import BaseDirectory
+
+import snapcraft
+from snapcraft.internal import common, parts
+
+
+logger = logging.getLogger(__name__)
+
+_BUFFER_SIZE = 1024 * 1024
+
+_CODE_FILES = [
+    '_schema.py',
+    os.path.join('internal', 'parts.py'),
+    os.path.join('internal', 'pluginhandler.py'),
+    os.path.join('internal', 'yaml.py'),
+]
+
+
+def _get_cache_dir():
+    return os.path.join(BaseDirectory.xdg_cache_home, 'snapcraft', 'config')
+
+
+def compute_key(snapcraft_yaml, local_plugins_dir):
+    """Return the key of the configuration of the project in the cwd.
+
+    :param str snapcraft_yaml: the path to the project's snapcraft.yaml.
+    :param str local_plugins_dir: the directory of the project's plugins.
+    """
+    digest = hashlib.sha256()
+
+    # The code validating and composing parts, including the schemas of the
+    # plugins, changes when snapcraft is updated.
+    package_dir = os.path.dirname(snapcraft.__file__)
+    code_files = [os.path.join(package_dir, f) for f in _CODE_FILES]
+    plugins_dir = os.path.join(package_dir, 'plugins')
+    code_files.extend(os.path.join(plugins_dir, f)
+                      for f in sorted(os.listdir(plugins_dir)))
+    for path in code_files:
+        st = os.stat(path)
+        digest.update('{} {} {}\0'.format(
+            path, st.st_mtime_ns, st.st_size).encode())
+
+    for path in (snapcraft_yaml,
+                 os.path.abspath(os.path.join(
+                     common.get_schemadir(), 'snapcraft.yaml')),
+                 parts.get_remote_parts_file()):
+        digest.update(b'\0' + os.fsencode(path))
+        _update_with_file(digest, path)
+
+    for root, directories, files in os.walk(local_plugins_dir):
+        directories.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            digest.update(b'\0' + os.fsencode(path))
+            _update_with_file(digest, path)
+
+    return digest.hexdigest()
+
+
+def _update_with_file(digest, path):
+    try:
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(_BUFFER_SIZE), b''):
+                digest.update(chunk)
+    except FileNotFoundError:
+        digest.update(b'\0missing')
+
+
+def load(key):
+    """Return the configuration saved for the project under key, or None."""
+    try:
+        with open(_get_entry_path(), 'rb') as f:
+            entry = pickle.load(f)
+    except FileNotFoundError:
+        return None
+    except (pickle.UnpicklingError, EOFError, AttributeError, ImportError,
+            ValueError) as e:
+        logger.debug('Ignoring invalid config cache entry: {}'.format(e))
+        return None
+
+    if entry.get('key') != key:
+        return None
+
+    # Validation also checks that the icon exists, which the key does not
+    # cover.
+    icon = entry['configuration'].get('data', {}).get('icon')
+    if icon and not os.path.exists(icon):
+        return None
+
+    return entry['configuration']
+
+
+def save(key, configuration):
+    """Save configuration for the project under key.
+
+    :param dict configuration: the validated configuration, it must be
+                               picklable.
+    """
+    entry_path = _get_entry_path()
+    os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+    temp_file = '{}.{}.tmp'.format(entry_path, os.getpid())
+    with open(temp_file, 'wb') as f:
+        pickle.dump({'key': key, 'configuration': configuration}, f,
+                    protocol=pickle.HIGHEST_PROTOCOL)
+    os.rename(temp_file, entry_path)
+
+
+def _get_entry_path():
+    # One entry per project, replaced whenever its configuration changes.
+    project = hashlib.sha256(os.fsencode(os.getcwd())).hexdigest()
+    return os.path.join(_get_cache_dir(), project)
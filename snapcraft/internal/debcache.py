@@ -0,0 +1,277 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A cache of the .deb archives of stage packages, shared by all projects.
+
+Archives are kept in the user's cache directory under the SHA256 the apt
+indexes give them, and linked into the download directory of the parts
+staging them, so a package is only downloaded once per machine whatever
+the part, the project or the cleans in between. The trees they extract
+to are kept along them, and copied from, so a package is only extracted
+once too.
+
+The cache is kept under SNAPCRAFT_DEB_CACHE_SIZE megabytes, 2048 by
+default, by removing the archives and trees used the least recently.
+Setting it to 0 disables the cache.
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import shutil
+import stat
+import threading
+
+from xdg import BaseDirectory
+
+from snapcraft.internal import common
+
+
+logger = logging.getLogger(__name__)
+
+_BUFFER_SIZE = 1024 * 1024
+
+_DEFAULT_MAX_SIZE = 2048 * 1024 * 1024
+
+
+def _get_default_cache_dir():
+    return os.path.join(BaseDirectory.xdg_cache_home, 'snapcraft', 'debs')
+
+
+def get_cache():
+    """Return the DebCache configured for this environment, or None."""
+    size = os.environ.get('SNAPCRAFT_DEB_CACHE_SIZE')
+    if size is None:
+        max_size = _DEFAULT_MAX_SIZE
+    else:
+        try:
+            max_size = int(size) * 1024 * 1024
+        except ValueError:
+            raise EnvironmentError(
+                'SNAPCRAFT_DEB_CACHE_SIZE must be a number of megabytes, '
+                'not {!r}'.format(size))
+    if max_size <= 0:
+        return None
+    return DebCache(max_size=max_size)
+
+
+class DebCache:
+
+    def __init__(self, cache_dir=None, max_size=_DEFAULT_MAX_SIZE):
+        if not cache_dir:
+            cache_dir = _get_default_cache_dir()
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    def restore(self, sha256, destination):
+        """Link the archive with sha256 to destination.
+
+        :returns: True if the archive was in the cache, False otherwise.
+        """
+        entry = self._entry_path(sha256)
+        if not os.path.exists(entry):
+            return False
+        try:
+            common.link_or_copy(entry, destination)
+        except FileNotFoundError:
+            return False
+        _touch(_get_used_path(entry))
+        logger.debug('Restored {!r} from the deb cache'.format(
+            os.path.basename(destination)))
+        return True
+
+    def save(self, sha256, path):
+        """Keep the archive at path in the cache, if its SHA256 is sha256.
+        """
+        entry = self._entry_path(sha256)
+        if os.path.exists(entry):
+            return
+        if _get_sha256(path) != sha256:
+            logger.warning('Not caching {!r}, its SHA256 is not {}'.format(
+                path, sha256))
+            return
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        # Link to a temporary name and move it in place, so an entry is
+        # either complete or missing.
+        temp_entry = '{}.{}.{}.tmp'.format(
+            entry, os.getpid(), threading.get_ident())
+        common.link_or_copy(path, temp_entry)
+        os.rename(temp_entry, entry)
+        _touch(_get_used_path(entry))
+
+    def get_tree(self, sha256, extract):
+        """Return the tree the archive with sha256 extracts to.
+
+        :param extract: called with the directory to extract the archive to
+                        when it is not in the cache, returning the paths it
+                        extracted, relative to that directory.
+        :returns: the directory of the tree and the paths in it, in the
+                  order they were extracted.
+        :raises FileNotFoundError: if the tree is removed from the cache
+                                   while it is used.
+        """
+        entry = self._tree_path(sha256)
+        manifest_path = os.path.join(entry, 'manifest.json')
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            manifest = None
+        if manifest:
+            with contextlib.suppress(FileNotFoundError):
+                os.utime(manifest_path)
+            return os.path.join(entry, 'tree'), manifest['paths']
+
+        # Extract to a temporary directory and move it in place, so a tree
+        # is either complete or missing.
+        temp_entry = '{}.{}.{}.tmp'.format(
+            entry, os.getpid(), threading.get_ident())
+        try:
+            os.makedirs(os.path.join(temp_entry, 'tree'))
+            paths = extract(os.path.join(temp_entry, 'tree'))
+            with open(os.path.join(temp_entry, 'manifest.json'), 'w') as f:
+                json.dump({'paths': paths,
+                           'size': _get_tree_size(temp_entry)}, f)
+            try:
+                os.rename(temp_entry, entry)
+            except OSError:
+                # Another part extracted it in the meantime.
+                if not os.path.exists(manifest_path):
+                    raise
+        finally:
+            if os.path.exists(temp_entry):
+                _remove_tree(temp_entry)
+        return os.path.join(entry, 'tree'), paths
+
+    def trim(self):
+        """Remove what was used the least recently, down to max_size."""
+        with self._lock:
+            entries = []
+            try:
+                scanned = list(os.scandir(self.cache_dir))
+            except FileNotFoundError:
+                return
+            for entry in scanned:
+                if (entry.name.endswith(('.tmp', '.used')) or
+                        not entry.is_file(follow_symlinks=False)):
+                    continue
+                with contextlib.suppress(FileNotFoundError):
+                    st = entry.stat()
+                    entries.append((_get_last_used(entry.path, st),
+                                    st.st_size, entry.path, _remove_entry))
+            entries.extend(self._scan_trees())
+
+            size = sum(entry[1] for entry in entries)
+            for mtime, entry_size, path, remove in sorted(entries):
+                if size <= self.max_size:
+                    break
+                with contextlib.suppress(FileNotFoundError):
+                    remove(path)
+                    logger.debug('Removed {!r} from the deb cache'.format(
+                        os.path.basename(path)))
+                size -= entry_size
+
+    def _scan_trees(self):
+        entries = []
+        try:
+            scanned = list(os.scandir(self._tree_path('')))
+        except FileNotFoundError:
+            return entries
+        for entry in scanned:
+            if entry.name.endswith('.tmp'):
+                continue
+            manifest_path = os.path.join(entry.path, 'manifest.json')
+            try:
+                with open(manifest_path) as f:
+                    size = json.load(f)['size']
+                # The modification time of the manifest is when the tree
+                # was last used.
+                mtime = os.stat(manifest_path).st_mtime
+            except (OSError, ValueError, KeyError):
+                continue
+            entries.append((mtime, size, entry.path, _remove_tree_entry))
+        return entries
+
+    def _entry_path(self, sha256):
+        return os.path.join(self.cache_dir, sha256)
+
+    def _tree_path(self, sha256):
+        return os.path.join(self.cache_dir, 'trees', sha256)
+
+
+def _get_used_path(entry):
+    # Archives are linked into the parts, their own modification time
+    # belongs to the parts too. When an archive was last used is the
+    # modification time of a file along it instead.
+    return entry + '.used'
+
+
+def _touch(path):
+    with contextlib.suppress(FileNotFoundError):
+        with open(path, 'a'):
+            pass
+        os.utime(path)
+
+
+def _get_last_used(entry, st):
+    try:
+        return os.stat(_get_used_path(entry)).st_mtime
+    except FileNotFoundError:
+        return st.st_mtime
+
+
+def _remove_entry(path):
+    os.remove(path)
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(_get_used_path(path))
+
+
+def _get_tree_size(path):
+    size = 0
+    for root, dirs, files in os.walk(path):
+        for name in files:
+            size += os.lstat(os.path.join(root, name)).st_size
+    return size
+
+
+def _remove_tree_entry(path):
+    # Move it out of the way first, so it is never used half removed.
+    temp_path = '{}.{}.{}.tmp'.format(
+        path, os.getpid(), threading.get_ident())
+    os.rename(path, temp_path)
+    _remove_tree(temp_path)
+
+
+def _remove_tree(path):
+    def make_writable(function, failed_path, exc_info):
+        # Packages can hold directories their owner cannot write to.
+        parent = os.path.dirname(failed_path)
+        os.chmod(parent, stat.S_IMODE(os.stat(parent).st_mode) | 0o700)
+        function(failed_path)
+
+    shutil.rmtree(path, onerror=make_writable)
+
+
+def _get_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_BUFFER_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,401 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Download files over HTTP, resuming and retrying when connections drop.
+
+Every download goes through one session, so connections to a server are
+kept open and reused. Data is written to a partial file next to the
+destination, which is renamed into place once complete. When a connection
+drops, or a previous run was interrupted, the download is retried after a
+growing delay, asking the server only for the data the partial file is
+missing. Digests of the data can be computed as it arrives, saving a pass
+over the downloaded file, and are kept next to it so that checking it later
+does not read it again either.
+"""
+
+import collections
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+_CHUNK_SIZE = 1024 * 1024
+
+# Downloads are attempted this many times, waiting for the backoff delay,
+# doubled after every attempt, between them.
+_ATTEMPTS = 5
+_BACKOFF = 1
+_MAX_BACKOFF = 30
+
+# Seconds to wait for a connection, and then for data, before retrying.
+_TIMEOUT = (30, 60)
+
+# The number of connections kept open to each server.
+_JOBS = 4
+
+_session = None
+_session_lock = threading.Lock()
+
+_active = 0
+_active_lock = threading.Lock()
+
+
+DownloadResult = collections.namedtuple(
+    'DownloadResult', ['headers', 'digests'])
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DigestMismatchError(DownloadError):
+
+    def __init__(self, url, hash_name, expected, actual):
+        super().__init__(
+            'The {} digest of {!r} is {}, expected {}'.format(
+                hash_name, url, actual, expected))
+        self.hash_name = hash_name
+        self.expected = expected
+        self.actual = actual
+
+
+class _RetryableError(DownloadError):
+    pass
+
+
+def get_session():
+    """Return the requests session all downloads share."""
+    global _session
+    # requests takes long to import, and is seldom needed.
+    import requests
+    import requests.adapters
+
+    with _session_lock:
+        if not _session:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=_JOBS, pool_maxsize=_JOBS)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+        return _session
+
+
+def download(url, destination, message=None, headers=None, hash_names=(),
+             expected_digests=None):
+    """Download url to destination, showing its progress.
+
+    :param str message: the message shown along the progress.
+    :param dict headers: more headers to send along the request. If some
+                         make it conditional and the server answers that
+                         destination is up to date, it is left untouched.
+    :param hash_names: the names of the hashlib algorithms to compute
+                       digests of the data with.
+    :param dict expected_digests: the hex digests the data must have, by
+                                  algorithm name.
+    :returns: a DownloadResult with the headers of the response and the
+              hex digests of the data by algorithm name, or None if the
+              server answered 304 Not Modified.
+    :raises DownloadError: if the download keeps failing.
+    :raises DigestMismatchError: if the data does not have the expected
+                                 digests, destination is then left as it
+                                 was.
+    :raises requests.HTTPError: if the server answers with a client error.
+    """
+    import requests
+
+    if not message:
+        message = 'Downloading {!r}'.format(os.path.basename(destination))
+    expected_digests = expected_digests or {}
+    hash_names = sorted(set(hash_names) | set(expected_digests))
+
+    delay = _BACKOFF
+    for attempt in range(1, _ATTEMPTS + 1):
+        try:
+            return _download(url, destination, message, headers or {},
+                             hash_names, expected_digests)
+        except (_RetryableError, requests.ConnectionError, requests.Timeout,
+                requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == _ATTEMPTS:
+                raise DownloadError(
+                    'Failed to download {!r} after {} attempts: {}'.format(
+                        url, attempt, e)) from e
+            logger.warning('Download of {!r} failed ({}), retrying in {} '
+                           'seconds.'.format(url, e, delay))
+            time.sleep(delay)
+            delay = min(delay * 2, _MAX_BACKOFF)
+
+
+def get_digests(path, hash_names):
+    """Return the hex digests of the file at path, by algorithm name.
+
+    The digests are saved next to the file, and only computed again when
+    its size or modification time change.
+
+    :raises FileNotFoundError: if there is no file at path.
+    """
+    st = os.stat(path)
+    stamp = [st.st_size, st.st_mtime_ns]
+    try:
+        with open(_get_digests_path(path)) as f:
+            saved = json.load(f)
+    except (OSError, ValueError):
+        saved = {}
+    digests = saved.get('digests', {}) if saved.get('stamp') == stamp else {}
+
+    missing = [name for name in hash_names if name not in digests]
+    if missing:
+        hashes = [hashlib.new(name) for name in missing]
+        with open(path, 'rb') as f:
+            _update_hashes(hashes, f, st.st_size)
+        digests.update(zip(missing, (h.hexdigest() for h in hashes)))
+        _save_digests(path, digests, st)
+    return {name: digests[name] for name in hash_names}
+
+
+def _get_digests_path(path):
+    return path + '.digests'
+
+
+def _save_digests(path, digests, st=None):
+    if not st:
+        st = os.stat(path)
+    digests_path = _get_digests_path(path)
+    try:
+        temp_file = '{}.{}.tmp'.format(digests_path, os.getpid())
+        with open(temp_file, 'w') as f:
+            json.dump({'stamp': [st.st_size, st.st_mtime_ns],
+                       'digests': digests}, f)
+        os.rename(temp_file, digests_path)
+    except OSError as e:
+        logger.debug('Cannot save the digests of {!r}: {}'.format(path, e))
+
+
+def _get_partial_path(destination):
+    return destination + '.partial'
+
+
+def _get_validator_path(destination):
+    return destination + '.partial.json'
+
+
+def _load_validator(destination, url):
+    # Only data from the same version of the same file can be resumed, and
+    # the validator of that version is what tells them apart.
+    try:
+        with open(_get_validator_path(destination)) as f:
+            partial = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if partial.get('url') != url:
+        return None
+    return partial.get('validator')
+
+
+def _save_validator(destination, url, validator):
+    with open(_get_validator_path(destination), 'w') as f:
+        json.dump({'url': url, 'validator': validator}, f)
+
+
+def _get_validator(response_headers):
+    etag = response_headers.get('ETag')
+    # Weak entity tags cannot be used to resume a download.
+    if etag and not etag.startswith('W/'):
+        return etag
+    return response_headers.get('Last-Modified')
+
+
+def _download(url, destination, message, headers, hash_names,
+              expected_digests):
+    partial_path = _get_partial_path(destination)
+    offset, headers = _get_resume_headers(destination, url, headers)
+
+    response = get_session().get(
+        url, headers=headers, stream=True, timeout=_TIMEOUT)
+    with contextlib.closing(response):
+        if response.status_code == 304:
+            return None
+        _check_status(response, partial_path)
+        offset = _get_resumed_offset(response, destination, url, offset)
+        # Ranges of encoded content do not match what was written.
+        encoded = response.headers.get(
+            'Content-Encoding', 'identity') != 'identity'
+        validator = _get_validator(response.headers)
+        if validator and not encoded:
+            _save_validator(destination, url, validator)
+
+        hashes = [hashlib.new(name) for name in hash_names]
+        _write_partial(response, partial_path, offset, encoded, hashes,
+                       message)
+
+    digests = {name: h.hexdigest() for name, h in zip(hash_names, hashes)}
+    _check_digests(url, destination, digests, expected_digests, offset)
+
+    os.rename(partial_path, destination)
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(_get_validator_path(destination))
+    if digests:
+        _save_digests(destination, digests)
+    return DownloadResult(response.headers, digests)
+
+
+def _get_resume_headers(destination, url, headers):
+    """Return where to resume the download from, and the headers asking
+    for the rest of the file."""
+    validator = _load_validator(destination, url)
+    try:
+        offset = (os.path.getsize(_get_partial_path(destination))
+                  if validator else 0)
+    except FileNotFoundError:
+        offset = 0
+
+    headers = dict(headers)
+    if offset:
+        headers['Range'] = 'bytes={}-'.format(offset)
+        headers['If-Range'] = validator
+    return offset, headers
+
+
+def _get_resumed_offset(response, destination, url, offset):
+    """Return where the data of response starts."""
+    if response.status_code != 206:
+        # The server sends the whole file when it changed since, or when it
+        # does not support ranges.
+        return 0
+    if not offset or not _range_starts_at(response, offset):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(_get_partial_path(destination))
+        raise _RetryableError('received an unexpected range')
+    logger.debug('Resuming download of {!r} at byte {}'.format(url, offset))
+    return offset
+
+
+def _check_status(response, partial_path):
+    if response.status_code == 416:
+        # The partial file is not part of what is there now.
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(partial_path)
+        raise _RetryableError('requested range not satisfiable')
+    if response.status_code >= 500:
+        raise _RetryableError('{} {}'.format(
+            response.status_code, response.reason))
+    response.raise_for_status()
+
+
+def _write_partial(response, partial_path, offset, encoded, hashes,
+                   message):
+    """Write the data of response to partial_path from offset, hashing it.
+    """
+    mode = 'r+b' if offset else 'wb'
+    with open(partial_path, mode, buffering=_CHUNK_SIZE) as f:
+        if offset:
+            _update_hashes(hashes, f, offset)
+            f.seek(offset)
+            f.truncate()
+        length = response.headers.get('Content-Length')
+        total_length = offset + int(length) if length else 0
+        if encoded:
+            total_length = 0
+        with _progress(message, total_length, offset) as progress:
+            read = offset
+            for chunk in response.iter_content(_CHUNK_SIZE):
+                f.write(chunk)
+                for h in hashes:
+                    h.update(chunk)
+                read += len(chunk)
+                progress.update(read)
+
+    if total_length and read != total_length:
+        raise _RetryableError('received {} of {} bytes'.format(
+            read, total_length))
+
+
+def _check_digests(url, destination, digests, expected_digests, offset):
+    for name, expected in sorted(expected_digests.items()):
+        if digests[name] == expected:
+            continue
+        _remove_partial(destination)
+        if offset:
+            # The data resumed from may not be what the server has, the
+            # whole file is downloaded again.
+            raise _RetryableError('the resumed download is corrupted')
+        raise DigestMismatchError(url, name, expected, digests[name])
+
+
+def _remove_partial(destination):
+    for path in (_get_partial_path(destination),
+                 _get_validator_path(destination)):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+
+def _range_starts_at(response, offset):
+    # Content-Range: bytes <first>-<last>/<length>
+    content_range = response.headers.get('Content-Range', '')
+    return content_range.startswith('bytes {}-'.format(offset))
+
+
+def _update_hashes(hashes, f, length):
+    if not hashes:
+        return
+    while length > 0:
+        chunk = f.read(min(_CHUNK_SIZE, length))
+        if not chunk:
+            break
+        for h in hashes:
+            h.update(chunk)
+        length -= len(chunk)
+
+
+@contextlib.contextmanager
+def _progress(message, total_length, initial):
+    # Progress bars of downloads running at the same time would draw over
+    # one another, only the first one gets one.
+    global _active
+    with _active_lock:
+        _active += 1
+        show_bar = _active == 1
+    try:
+        if show_bar:
+            from snapcraft.internal import indicators
+            progress = indicators.DownloadProgress(message, total_length)
+        else:
+            logger.info(message)
+            progress = _NoProgress()
+        progress.start(initial)
+        yield progress
+        progress.finish()
+    finally:
+        with _active_lock:
+            _active -= 1
+
+
+class _NoProgress:
+
+    def start(self, initial):
+        pass
+
+    def update(self, read):
+        pass
+
+    def finish(self):
+        pass
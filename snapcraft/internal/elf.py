@@ -0,0 +1,376 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Read ELF files and find the libraries they need, the way ld.so does.
+
+Unlike running ldd, nothing is executed: the dynamic section of each file
+is read in place, which also works for binaries built for another
+architecture. A library is searched for in the same places and order as
+ld.so would (RPATH, LD_LIBRARY_PATH, RUNPATH, then the system library
+directories) and only libraries of the same architecture as the file
+needing them are considered.
+
+What is read from files and where sonames resolve to are cached for the
+duration of the process, as the same libraries are needed over and over.
+"""
+
+import collections
+import glob
+import logging
+import mmap
+import os
+import struct
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+_ELF_MAGIC = b'\x7fELF'
+_ELFCLASS32 = 1
+_ELFCLASS64 = 2
+_ELFDATA2LSB = 1
+
+_PT_LOAD = 1
+_PT_DYNAMIC = 2
+_PT_INTERP = 3
+
+_DT_NULL = 0
+_DT_NEEDED = 1
+_DT_STRTAB = 5
+_DT_SONAME = 14
+_DT_RPATH = 15
+_DT_RUNPATH = 29
+
+_EF_ARM_ABI_FLOAT_HARD = 0x400
+
+# The multiarch triplet of each machine, see elf(5) for the numbers.
+_TRIPLETS = {
+    3: 'i386-linux-gnu',
+    20: 'powerpc-linux-gnu',
+    22: 's390x-linux-gnu',
+    62: 'x86_64-linux-gnu',
+    183: 'aarch64-linux-gnu',
+}
+
+_DEFAULT_LIBRARY_DIRS = ('/lib', '/usr/lib')
+
+# Header layouts after e_ident, by class: the format and the indexes of
+# e_machine, e_phoff, e_flags, e_phentsize and e_phnum.
+_HEADERS = {
+    _ELFCLASS32: ('HHIIIIIHHH', (1, 4, 6, 8, 9)),
+    _ELFCLASS64: ('HHIQQQIHHH', (1, 4, 6, 8, 9)),
+}
+# Program header layouts by class: the format and the indexes of p_type,
+# p_offset, p_vaddr and p_filesz.
+_PROGRAM_HEADERS = {
+    _ELFCLASS32: ('IIIIIIII', (0, 1, 2, 4)),
+    _ELFCLASS64: ('IIQQQQQQ', (0, 2, 3, 5)),
+}
+_DYNAMIC_ENTRIES = {
+    _ELFCLASS32: 'iI',
+    _ELFCLASS64: 'qQ',
+}
+
+
+class ElfError(Exception):
+    pass
+
+
+ElfFile = collections.namedtuple('ElfFile', [
+    'path',
+    # What a library must match to be loaded along with this file:
+    # (class, data encoding, machine).
+    'arch',
+    'triplet',
+    'interpreter',
+    'soname',
+    'needed',
+    'rpath',
+    'runpath',
+])
+
+
+_lock = threading.Lock()
+_elf_files = {}
+_resolved = {}
+_system_dirs = None
+
+
+def read(path):
+    """Return the ElfFile for path.
+
+    :raises ElfError: if path is not a valid ELF file.
+    """
+    st = os.stat(path)
+    key = (path, st.st_ino, st.st_mtime_ns, st.st_size)
+    with _lock:
+        elf_file = _elf_files.get(key)
+    if not elf_file:
+        elf_file = _read(path, st.st_size)
+        with _lock:
+            _elf_files[key] = elf_file
+    return elf_file
+
+
+def _read(path, size):
+    if size < 16:
+        raise ElfError('{!r} is not an ELF file'.format(path))
+
+    with open(path, 'rb') as f:
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            if data[:4] != _ELF_MAGIC:
+                raise ElfError('{!r} is not an ELF file'.format(path))
+            try:
+                return _parse(path, data)
+            except (struct.error, IndexError, KeyError, ValueError) as e:
+                raise ElfError('{!r} is not a valid ELF file: {}'.format(
+                    path, e))
+
+
+def _parse(path, data):
+    elf_class = data[4]
+    encoding = data[5]
+    endian = '<' if encoding == _ELFDATA2LSB else '>'
+
+    header_format, indexes = _HEADERS[elf_class]
+    header = struct.unpack_from(endian + header_format, data, 16)
+    machine, phoff, flags, phentsize, phnum = (header[i] for i in indexes)
+
+    loads, dynamic, interpreter = _parse_program_headers(
+        data, elf_class, endian, phoff, phentsize, phnum)
+    entries = _parse_dynamic_section(data, elf_class, endian, dynamic)
+
+    strtab = next((v for t, v in entries if t == _DT_STRTAB), None)
+    if strtab is not None:
+        strtab = _vaddr_to_offset(strtab, loads)
+
+    def strings(wanted_tag):
+        if strtab is None:
+            return []
+        return [_read_string(data, strtab + v)
+                for t, v in entries if t == wanted_tag]
+
+    return ElfFile(
+        path=path,
+        arch=(elf_class, encoding, machine),
+        triplet=_get_triplet(machine, encoding, flags),
+        interpreter=interpreter,
+        soname=next(iter(strings(_DT_SONAME)), None),
+        needed=strings(_DT_NEEDED),
+        rpath=_split_paths(strings(_DT_RPATH), path),
+        runpath=_split_paths(strings(_DT_RUNPATH), path),
+    )
+
+
+def _parse_program_headers(data, elf_class, endian, phoff, phentsize,
+                           phnum):
+    """Return the loaded segments, the dynamic section and the interpreter.
+    """
+    ph_format, ph_indexes = _PROGRAM_HEADERS[elf_class]
+    loads = []
+    dynamic = None
+    interpreter = None
+    for i in range(phnum):
+        program_header = struct.unpack_from(
+            endian + ph_format, data, phoff + i * phentsize)
+        p_type, p_offset, p_vaddr, p_filesz = (
+            program_header[i] for i in ph_indexes)
+        if p_type == _PT_LOAD:
+            loads.append((p_vaddr, p_offset, p_filesz))
+        elif p_type == _PT_DYNAMIC:
+            dynamic = (p_offset, p_filesz)
+        elif p_type == _PT_INTERP:
+            interpreter = _decode(
+                data[p_offset:p_offset + p_filesz].rstrip(b'\0'))
+    return loads, dynamic, interpreter
+
+
+def _parse_dynamic_section(data, elf_class, endian, dynamic):
+    """Return the (tag, value) entries of the dynamic section."""
+    entries = []
+    if not dynamic:
+        return entries
+    entry_format = endian + _DYNAMIC_ENTRIES[elf_class]
+    entry_size = struct.calcsize(entry_format)
+    offset, filesz = dynamic
+    for offset in range(offset, offset + filesz, entry_size):
+        tag, value = struct.unpack_from(entry_format, data, offset)
+        if tag == _DT_NULL:
+            break
+        entries.append((tag, value))
+    return entries
+
+
+def _vaddr_to_offset(vaddr, loads):
+    for p_vaddr, p_offset, p_filesz in loads:
+        if p_vaddr <= vaddr < p_vaddr + p_filesz:
+            return vaddr - p_vaddr + p_offset
+    raise ValueError('address {:#x} is not in any segment'.format(vaddr))
+
+
+def _read_string(data, offset):
+    end = data.find(b'\0', offset)
+    if end < 0:
+        raise ValueError('unterminated string')
+    return _decode(data[offset:end])
+
+
+def _decode(value):
+    return value.decode('utf-8', 'surrogateescape')
+
+
+def _split_paths(values, path):
+    origin = os.path.dirname(os.path.abspath(path))
+    paths = []
+    for value in values:
+        for directory in value.split(':'):
+            if directory:
+                paths.append(directory.replace('${ORIGIN}', origin).replace(
+                    '$ORIGIN', origin))
+    return paths
+
+
+def _get_triplet(machine, encoding, flags):
+    little_endian = encoding == _ELFDATA2LSB
+    if machine == 40:
+        if flags & _EF_ARM_ABI_FLOAT_HARD:
+            return 'arm-linux-gnueabihf'
+        return 'arm-linux-gnueabi'
+    if machine == 21:
+        if little_endian:
+            return 'powerpc64le-linux-gnu'
+        return 'powerpc64-linux-gnu'
+    return _TRIPLETS.get(machine)
+
+
+def get_dependencies(path, library_path=()):
+    """Return the paths of the libraries loaded along with path.
+
+    Like ldd, this includes the libraries needed by those libraries, and
+    leaves out the interpreter and libraries that cannot be found.
+
+    :param str path: the ELF file.
+    :param library_path: the directories in LD_LIBRARY_PATH.
+    :raises ElfError: if path is not a valid ELF file.
+    """
+    executable = read(path)
+    library_path = tuple(library_path)
+
+    loaded = set()
+    if executable.interpreter:
+        loaded.add(os.path.basename(executable.interpreter))
+    dependencies = []
+
+    # Libraries are loaded breadth first, each with the RPATHs of the
+    # chain of objects which needed it.
+    queue = collections.deque([(executable, ())])
+    while queue:
+        elf_file, loader_rpaths = queue.popleft()
+        if elf_file.runpath:
+            rpath = ()
+        else:
+            rpath = (tuple(elf_file.rpath),) + loader_rpaths
+        for name in elf_file.needed:
+            if name in loaded:
+                continue
+            loaded.add(name)
+
+            library = _find_library(name, executable, rpath, library_path,
+                                    tuple(elf_file.runpath))
+            if not library:
+                logger.debug('Cannot find {!r} needed by {!r}'.format(
+                    name, elf_file.path))
+                continue
+            if library.soname:
+                loaded.add(library.soname)
+            dependencies.append(library.path)
+            queue.append((library, rpath))
+
+    return dependencies
+
+
+def _find_library(name, executable, rpath, library_path, runpath):
+    if '/' in name:
+        return _read_compatible(name, executable.arch)
+
+    key = (name, executable.arch, rpath, library_path, runpath)
+    with _lock:
+        if key in _resolved:
+            return _resolved[key]
+
+    directories = [d for rpath_dirs in rpath for d in rpath_dirs]
+    directories.extend(library_path)
+    directories.extend(runpath)
+    directories.extend(_get_system_dirs(executable.triplet))
+
+    library = None
+    for directory in directories:
+        library = _read_compatible(
+            os.path.join(directory, name), executable.arch)
+        if library:
+            break
+
+    with _lock:
+        _resolved[key] = library
+    return library
+
+
+def _read_compatible(path, arch):
+    try:
+        library = read(path)
+    except (OSError, ElfError):
+        return None
+    # Like ld.so, skip libraries built for another architecture.
+    if library.arch != arch:
+        return None
+    return library
+
+
+def _get_system_dirs(triplet):
+    global _system_dirs
+    with _lock:
+        if _system_dirs is None:
+            _system_dirs = _read_ld_so_conf('/etc/ld.so.conf')
+
+    directories = list(_system_dirs)
+    if triplet:
+        # The directories of other architectures are not in ld.so.conf.
+        directories.extend(os.path.join(d, triplet)
+                           for d in _DEFAULT_LIBRARY_DIRS)
+    directories.extend(_DEFAULT_LIBRARY_DIRS)
+    return directories
+
+
+def _read_ld_so_conf(conf_file):
+    directories = []
+    try:
+        with open(conf_file) as f:
+            lines = f.readlines()
+    except OSError:
+        return directories
+
+    for line in lines:
+        line = line.split('#', 1)[0].strip()
+        if line.startswith('include'):
+            pattern = line[len('include'):].strip()
+            if not os.path.isabs(pattern):
+                pattern = os.path.join(os.path.dirname(conf_file), pattern)
+            for included in sorted(glob.glob(pattern)):
+                directories.extend(_read_ld_so_conf(included))
+        elif line and not line.startswith('hwcap'):
+            directories.append(line)
+
+    return directories
@@ -0,0 +1,160 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Fingerprint directory trees to find out if their contents changed.
+
+A fingerprint is a digest of the names, modes and contents of everything in
+a tree. Hashing the contents of every file is slow for large trees, so the
+content digest of each file is kept in an index along with its inode,
+modification time and size. As long as those stay the same the file is not
+read again, which makes fingerprinting an unchanged tree cost about as much
+as listing it.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import stat
+
+
+logger = logging.getLogger(__name__)
+
+_BUFFER_SIZE = 1024 * 1024
+
+
+def fingerprint_tree(directory, index_file, ignore=()):
+    """Return a digest of the tree in directory.
+
+    :param str directory: the root of the tree.
+    :param str index_file: where to keep the digests of the files in the
+                           tree between calls. It is created if missing.
+    :param ignore: names to leave out at the root of the tree.
+    """
+    index = _load_index(index_file)
+    new_index = {}
+    lines = []
+
+    _scan_directory(directory, '', index, new_index, lines, ignore)
+
+    # Files that were removed also change the index.
+    if len(new_index) != len(index) or any(
+            index.get(path) != value for path, value in new_index.items()):
+        _save_index(index_file, new_index)
+
+    return hashlib.sha256('\n'.join(lines).encode(
+        'utf-8', 'surrogateescape')).hexdigest()
+
+
+class DigestCache:
+    """The digests of the contents of files, kept between runs.
+
+    Like the index of fingerprint_tree, a digest is only computed again
+    when the inode, modification time or size of its file changed.
+    """
+
+    def __init__(self, index_file):
+        self._index_file = index_file
+        self._index = None
+        self._changed = False
+
+    def get_digest(self, path):
+        """Return the digest of the contents of path, following symlinks."""
+        if self._index is None:
+            self._index = _load_index(self._index_file)
+
+        st = os.stat(path)
+        key = '{} {} {} '.format(st.st_ino, st.st_mtime_ns, st.st_size)
+        cached = self._index.get(path)
+        if cached and cached.startswith(key):
+            return cached[len(key):]
+
+        digest = _hash_file(path)
+        self._index[path] = key + digest
+        self._changed = True
+        return digest
+
+    def save(self):
+        """Save the digests computed since the last save, if any."""
+        if not self._changed:
+            return
+        os.makedirs(os.path.dirname(self._index_file), exist_ok=True)
+        _save_index(self._index_file, self._index)
+        self._changed = False
+
+    def clear(self):
+        """Forget every digest."""
+        self._index = {}
+        self._changed = False
+        if os.path.exists(self._index_file):
+            os.remove(self._index_file)
+
+
+def _scan_directory(directory, prefix, index, new_index, lines, ignore=()):
+    entries = sorted((e.name, e) for e in os.scandir(directory)
+                     if e.name not in ignore)
+    for name, entry in entries:
+        path = prefix + name
+        st = entry.stat(follow_symlinks=False)
+        mode = st.st_mode
+        if stat.S_ISREG(mode):
+            # The index entry of a file starts with what tells if the file
+            # changed, followed by the digest of its contents.
+            key = '{} {} {} '.format(st.st_ino, st.st_mtime_ns, st.st_size)
+            cached = index.get(path)
+            if cached and cached.startswith(key):
+                new_index[path] = cached
+            else:
+                new_index[path] = key + _hash_file(entry.path)
+            content = new_index[path][len(key):]
+        elif stat.S_ISLNK(mode):
+            content = os.readlink(entry.path)
+        else:
+            content = ''
+
+        lines.append('{}\0{}\0{}'.format(path, mode, content))
+
+        if stat.S_ISDIR(mode):
+            _scan_directory(
+                entry.path, path + '/', index, new_index, lines)
+
+
+def _hash_file(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_BUFFER_SIZE), b''):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def _load_index(index_file):
+    try:
+        with open(index_file) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except ValueError:
+        logger.debug('Ignoring invalid fingerprint index {!r}'.format(
+            index_file))
+        return {}
+
+
+def _save_index(index_file, index):
+    temp_file = '{}.tmp'.format(index_file)
+    with open(temp_file, 'w') as f:
+        json.dump(index, f, separators=(',', ':'))
+    os.rename(temp_file, index_file)
@@ -14,7 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import os
+import time
 
 from progressbar import (
     AnimatedMarker,
@@ -25,28 +25,42 @@ from progressbar import (
 )
 
 
-def download_requests_stream(request_stream, destination, message=None):
-    """This is a facility to download a request with nice progress bars."""
-    if not message:
-        message = 'Downloading {!r}'.format(os.path.basename(destination))
-
-    total_length = int(request_stream.headers.get('Content-Length', '0'))
-    if total_length:
-        progress_bar = ProgressBar(
-            widgets=[message,
-                     Bar(marker='=', left='[', right=']'),
-                     ' ', Percentage()],
-            maxval=total_length)
-    else:
-        progress_bar = ProgressBar(
-            widgets=[message, AnimatedMarker()],
-            maxval=UnknownLength)
-
-    total_read = 0
-    progress_bar.start()
-    with open(destination, 'wb') as destination_file:
-        for buf in request_stream.iter_content(1024):
-            destination_file.write(buf)
-            total_read += len(buf)
-            progress_bar.update(total_read)
-    progress_bar.finish()
+class DownloadProgress:
+    """A progress bar for a download, redrawn at most every interval."""
+
+    def __init__(self, message, total_length=0, interval=0.1):
+        """Initialize the progress bar.
+
+        :param int total_length: the size of the download, 0 if unknown.
+        :param float interval: the seconds to wait between redraws.
+        """
+        self._total_length = total_length
+        self._interval = interval
+        self._last_update = 0
+        if total_length:
+            self._progress_bar = ProgressBar(
+                widgets=[message,
+                         Bar(marker='=', left='[', right=']'),
+                         ' ', Percentage()],
+                maxval=total_length)
+        else:
+            self._progress_bar = ProgressBar(
+                widgets=[message, AnimatedMarker()],
+                maxval=UnknownLength)
+
+    def start(self, initial=0):
+        self._progress_bar.start()
+        self._update(initial)
+
+    def update(self, read):
+        if time.monotonic() - self._last_update >= self._interval:
+            self._update(read)
+
+    def finish(self):
+        self._progress_bar.finish()
+
+    def _update(self, read):
+        if self._total_length:
+            read = min(read, self._total_length)
+        self._progress_bar.update(read)
+        self._last_update = time.monotonic()
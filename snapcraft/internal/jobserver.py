@@ -0,0 +1,93 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""A GNU make compatible jobserver shared by every part being built.
+
+The jobserver is a pipe holding one token per allowed job. It is handed
+to commands through MAKEFLAGS, which makes every make started by a plugin
+(and every make those start in turn) take a token from the same pipe
+before running an extra job, instead of each make running as many jobs as
+it was told to with -j.
+
+Snapcraft also takes a token for each command it runs itself, standing in
+for the one job every make is allowed to run without a token. This way the
+number of jobs across all the parts never exceeds the number of tokens.
+"""
+
+import contextlib
+import logging
+import os
+
+
+logger = logging.getLogger(__name__)
+
+_jobserver = None
+
+
+class JobServer:
+
+    @property
+    def fds(self):
+        return (self._read_fd, self._write_fd)
+
+    @property
+    def makeflags(self):
+        # --jobserver-fds is understood by every make since 4.0, newer ones
+        # also call it --jobserver-auth.
+        return '-j --jobserver-fds={},{}'.format(*self.fds)
+
+    def __init__(self, jobs):
+        self._read_fd, self._write_fd = os.pipe()
+        os.write(self._write_fd, b'+' * jobs)
+
+    @contextlib.contextmanager
+    def token(self):
+        """Hold one token for the duration of the context."""
+        token = os.read(self._read_fd, 1)
+        try:
+            yield
+        finally:
+            os.write(self._write_fd, token)
+
+    def close(self):
+        os.close(self._read_fd)
+        os.close(self._write_fd)
+
+
+def get():
+    """Return the running jobserver, or None if there is none."""
+    return _jobserver
+
+
+@contextlib.contextmanager
+def serve(jobs):
+    """Run a jobserver with the given number of tokens within the context.
+
+    Nothing is set up if jobs is 1 or less, since make does not use a
+    jobserver for serial builds either.
+    """
+    global _jobserver
+    if jobs <= 1 or _jobserver:
+        yield
+        return
+
+    logger.debug('Starting a jobserver for {} jobs'.format(jobs))
+    _jobserver = JobServer(jobs)
+    try:
+        yield
+    finally:
+        _jobserver.close()
+        _jobserver = None
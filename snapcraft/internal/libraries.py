@@ -16,12 +16,14 @@
 
 import re
 import glob
+import hashlib
+import json
 import logging
 import os
 import platform
-import subprocess
+import threading
 
-from snapcraft.internal import common
+from snapcraft.internal import common, elf
 
 
 logger = logging.getLogger(__name__)
@@ -80,24 +82,155 @@ def _get_system_libs():
     return _libraries
 
 
-def get_dependencies(elf):
+def get_dependencies(elf_file, library_path=None):
     """Return a list of libraries that are needed to satisfy elf's runtime.
 
     This may include libraries contained within the project.
+
+    :param library_path: the directories in LD_LIBRARY_PATH, taken from the
+                         current environment if not given.
     """
-    logger.debug('Getting dependencies for {!r}'.format(elf))
-    ldd_out = ''
+    elf_file = os.fsdecode(elf_file)
+    logger.debug('Getting dependencies for {!r}'.format(elf_file))
+    if library_path is None:
+        library_path = get_library_path()
     try:
-        ldd_out = common.run_output(['ldd', elf]).split('\n')
-    except subprocess.CalledProcessError:
+        libs = elf.get_dependencies(elf_file, library_path)
+    except (OSError, elf.ElfError) as e:
+        logger.debug(str(e))
         logger.warning(
-            'Unable to determine library dependencies for {!r}'.format(elf))
+            'Unable to determine library dependencies for {!r}'.format(
+                elf_file))
         return []
-    ldd_out = [l.split() for l in ldd_out]
-    ldd_out = [l[2] for l in ldd_out if len(l) > 2 and os.path.exists(l[2])]
 
     # Now lets filter out what would be on the system
     system_libs = _get_system_libs()
-    libs = [l for l in ldd_out if not os.path.basename(l) in system_libs]
+    libs = [l for l in libs if not os.path.basename(l) in system_libs]
 
     return libs
+
+
+_library_paths = {}
+_library_paths_lock = threading.Lock()
+
+
+def get_library_path():
+    """Return the directories in LD_LIBRARY_PATH for the current environment.
+    """
+    # LD_LIBRARY_PATH is set in shell syntax, let the shell expand it once
+    # for each environment.
+    environment = common.assemble_env()
+    with _library_paths_lock:
+        library_path = _library_paths.get(environment)
+        if library_path is None:
+            output = common.run_output(
+                ['/bin/sh', '-c', 'echo "$LD_LIBRARY_PATH"'])
+            library_path = [p for p in output.split(':') if p]
+            _library_paths[environment] = library_path
+    return library_path
+
+
+class DependencyCache:
+    """The libraries needed by ELF files, kept between runs.
+
+    The entry of a file is the list of libraries it needs, empty if it is
+    not a dynamically linked ELF file. An entry is only used while the
+    inode, modification time and size of its file, and of each library it
+    was resolved to, stay the same.
+    As the environment and the contents of the library directories decide
+    where libraries are found, all the entries are dropped when either
+    changes.
+    """
+
+    def __init__(self, cache_file):
+        self._cache_file = cache_file
+        self._files = None
+        self._environment = None
+        self._search_path = None
+        self._changed = False
+
+    def get(self, path, st):
+        """Return (found, entry) for path, whose lstat result is st."""
+        if self._files is None:
+            self._files = self._load()
+
+        cached = self._files.get(path)
+        if (cached and len(cached) == 5 and
+                cached[:3] == _get_stamp(st) and
+                cached[4] == _get_library_stamps(cached[3])):
+            return True, cached[3]
+        return False, None
+
+    def set(self, path, st, entry):
+        if self._files is None:
+            self._files = self._load()
+
+        self._files[path] = _get_stamp(st) + [
+            entry, _get_library_stamps(entry)]
+        self._changed = True
+
+    def save(self):
+        """Save the entries added since the last save, if any."""
+        if not self._changed:
+            return
+
+        os.makedirs(os.path.dirname(self._cache_file), exist_ok=True)
+        temp_file = '{}.tmp'.format(self._cache_file)
+        with open(temp_file, 'w') as f:
+            json.dump({'environment': self._environment,
+                       'search_path': self._search_path,
+                       'files': self._files}, f, separators=(',', ':'))
+        os.rename(temp_file, self._cache_file)
+        self._changed = False
+
+    def clear(self):
+        """Forget every entry."""
+        self._files = None
+        self._changed = False
+        if os.path.exists(self._cache_file):
+            os.remove(self._cache_file)
+
+    def _load(self):
+        self._environment = hashlib.sha256(
+            common.assemble_env().encode()).hexdigest()
+        self._search_path = _get_search_path_stamp()
+        try:
+            with open(self._cache_file) as f:
+                cache = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.debug('Ignoring invalid dependency cache {!r}'.format(
+                self._cache_file))
+            return {}
+
+        if (cache.get('environment') != self._environment or
+                cache.get('search_path') != self._search_path):
+            return {}
+        return cache.get('files', {})
+
+
+def _get_stamp(st):
+    return [st.st_ino, st.st_mtime_ns, st.st_size]
+
+
+def _get_library_stamps(libs):
+    stamps = []
+    for lib in libs:
+        try:
+            stamps.append(_get_stamp(os.stat(lib)))
+        except FileNotFoundError:
+            stamps.append(None)
+    return stamps
+
+
+def _get_search_path_stamp():
+    # Adding or removing a library changes the modification time of its
+    # directory, which may change what a library name resolves to.
+    stamp = []
+    for directory in get_library_path():
+        try:
+            stamp.append([directory] + _get_stamp(os.stat(directory)))
+        except OSError:
+            stamp.append([directory, None])
+    return stamp
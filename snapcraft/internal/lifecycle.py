@@ -20,6 +20,7 @@ import os
 import shutil
 import sys
 import tarfile
+import threading
 import time
 from subprocess import Popen, PIPE, STDOUT
 
@@ -29,11 +30,14 @@ from progressbar import AnimatedMarker, ProgressBar
 import snapcraft
 import snapcraft.internal
 from snapcraft.internal import (
+    buildcache,
     common,
+    jobserver,
     lxd,
     meta,
     pluginhandler,
     repo,
+    scheduler,
 )
 
 
@@ -92,10 +96,13 @@ def execute(step, project_options, part_names=None):
                           over.
     :returns: A dict with the snap name, version, type and architectures.
     """
-    config = snapcraft.internal.load_config(project_options)
-    repo.install_build_packages(config.build_tools)
+    # Plugins decide how to run make when they are loaded, so the jobserver
+    # needs to be up before loading them.
+    with jobserver.serve(project_options.parallel_build_count):
+        config = snapcraft.internal.load_config(project_options)
+        repo.install_build_packages(config.build_tools)
 
-    _Executor(config, project_options).run(step, part_names)
+        _Executor(config, project_options).run(step, part_names)
 
     return {'name': config.data['name'],
             'version': config.data['version'],
@@ -108,6 +115,15 @@ class _Executor:
     def __init__(self, config, project_options):
         self.config = config
         self.project_options = project_options
+        # Preparing a step may fetch stage packages, and apt's configuration
+        # is global to the process. Staging and priming write to areas
+        # shared by all the parts.
+        self._prepare_lock = threading.Lock()
+        # It is reentrant since cleaning an out of date step also cleans the
+        # shared areas, also when staging.
+        self._shared_area_lock = threading.RLock()
+        # The parts still to be built when running concurrently.
+        self._building = set()
 
     def run(self, step, part_names=None, recursed=False):
         if part_names:
@@ -117,10 +133,17 @@ class _Executor:
             parts = self.config.all_parts
             part_names = self.config.part_names
 
+        if self.project_options.parallel_part_count > 1:
+            self._run_concurrently(step, parts, part_names)
+            self._create_meta(step, part_names)
+            return
+
         dirty = {p.name for p in parts if p.should_step_run('stage')}
         step_index = common.COMMAND_ORDER.index(step) + 1
 
         for step in common.COMMAND_ORDER[0:step_index]:
+            if step == 'build':
+                self._fetch_cached_builds(parts)
             if step == 'stage':
                 pluginhandler.check_for_collisions(self.config.all_parts)
             for part in parts:
@@ -128,18 +151,30 @@ class _Executor:
 
         self._create_meta(step, part_names)
 
+    def _fetch_cached_builds(self, parts):
+        if not self.project_options.use_build_cache:
+            return
+
+        cache = buildcache.get_cache()
+        if not cache.remote:
+            return
+
+        # The cache key of a part is only known once its dependencies are
+        # staged, fetch what can be fetched now all at once rather than one
+        # part at a time.
+        keys = [p.build_cache_key() for p in parts
+                if p.should_step_run('build') and not p.is_clean('pull') and
+                all(not d.is_clean('stage') for d in p.deps)]
+        if keys:
+            cache.fetch(keys)
+
     def _run_step(self, step, part, part_names, dirty, recursed):
         common.reset_env()
         prereqs = self.config.part_prereqs(part.name)
         if recursed:
             prereqs = prereqs & dirty
         if prereqs and not prereqs.issubset(part_names):
-            for prereq in self.config.all_parts:
-                if prereq.name in prereqs and prereq.should_step_run('stage'):
-                    raise RuntimeError(
-                        'Requested {!r} of {!r} but there are unsatisfied '
-                        'prerequisites: {!r}'.format(
-                            step, part.name, ' '.join(prereqs)))
+            self._verify_prereqs_staged(step, part, prereqs)
         elif prereqs:
             # prerequisites need to build all the way to the staging
             # step to be able to share the common assets that make them
@@ -149,8 +184,21 @@ class _Executor:
                 '{}'.format(part.name, ' '.join(prereqs)))
             self.run('stage', prereqs, recursed=True)
 
+        self._run_part_step(step, part)
+
+    def _verify_prereqs_staged(self, step, part, prereqs):
+        for prereq in self.config.all_parts:
+            if prereq.name in prereqs and prereq.should_step_run('stage'):
+                raise RuntimeError(
+                    'Requested {!r} of {!r} but there are unsatisfied '
+                    'prerequisites: {!r}'.format(
+                        step, part.name, ' '.join(prereqs)))
+
+    def _run_part_step(self, step, part):
         if part.is_dirty(step):
             self._handle_dirty(part, step)
+        elif part.is_outdated(step):
+            self._clean_step(part, step, '(source changed)', incremental=True)
 
         if not part.should_step_run(step):
             part.notify_part_progress('Skipping {}'.format(step),
@@ -159,14 +207,105 @@ class _Executor:
 
         # Run the preparation function for this step (if implemented)
         with contextlib.suppress(AttributeError):
-            getattr(part, 'prepare_{}'.format(step))()
+            prepare = getattr(part, 'prepare_{}'.format(step))
+            with self._prepare_lock:
+                prepare()
 
-        common.env = self.config.build_env_for_part(part)
+        common.set_env(self.config.build_env_for_part(part))
         getattr(part, step)()
 
+    def _run_concurrently(self, step, parts, part_names):
+        """Run the steps of all parts as a graph on a pool of workers.
+
+        Pulling and building only wait on what they need: a part starts
+        building once its own pull is done and its prerequisites are staged.
+        """
+        target_steps = self._get_target_steps(step, parts, part_names)
+
+        tasks = {}
+        for part in self.config.all_parts:
+            for part_step in target_steps.get(part.name, []):
+                tasks[(part.name, part_step)] = scheduler.Task(
+                    part, part_step)
+
+        stage_tasks = {t for t in tasks.values() if t.step == 'stage'}
+        # Collisions are only checked against parts done building, their
+        # installdirs are not written to anymore.
+        self._building = {t.part.name for t in tasks.values()
+                          if t.step == 'build'}
+        for (part_name, part_step), task in tasks.items():
+            index = common.COMMAND_ORDER.index(part_step)
+            if index > 0:
+                task.prerequisites.add(
+                    tasks[(part_name, common.COMMAND_ORDER[index - 1])])
+            if part_step == 'build':
+                for prereq in self.config.part_prereqs(part_name):
+                    with contextlib.suppress(KeyError):
+                        task.prerequisites.add(tasks[(prereq, 'stage')])
+            elif part_step == 'prime':
+                task.prerequisites |= stage_tasks
+
+        scheduler.Scheduler(self.project_options.parallel_part_count).run(
+            self._order_tasks(tasks.values()), self._run_task)
+
+    def _get_target_steps(self, step, parts, part_names):
+        steps = common.COMMAND_ORDER[
+            0:common.COMMAND_ORDER.index(step) + 1]
+        target_steps = {part.name: steps for part in parts}
+        for part in parts:
+            prereqs = self.config.part_prereqs(part.name)
+            if prereqs and not prereqs.issubset(part_names):
+                self._verify_prereqs_staged(steps[0], part, prereqs)
+
+        # Prerequisites of a part that gets built need to reach the stage
+        # step, and so do their own prerequisites in turn.
+        pending = [p for p in parts if 'build' in target_steps[p.name]]
+        while pending:
+            part = pending.pop()
+            for prereq in self.config.part_prereqs(part.name):
+                prereq_steps = target_steps.get(prereq)
+                if prereq_steps is not None and 'stage' not in prereq_steps:
+                    target_steps[prereq] = common.COMMAND_ORDER[0:3]
+                    pending.append(self.config.get_part(prereq))
+
+        return target_steps
+
+    def _order_tasks(self, tasks):
+        """Sort tasks step by step, but never before their prerequisites.
+
+        This is the order the output of the tasks is shown in.
+        """
+        part_names = [p.name for p in self.config.all_parts]
+        remaining = sorted(tasks, key=lambda t: (
+            common.COMMAND_ORDER.index(t.step), part_names.index(t.part.name)))
+        ordered = []
+        while remaining:
+            task = next(t for t in remaining
+                        if t.prerequisites.issubset(ordered))
+            remaining.remove(task)
+            ordered.append(task)
+
+        return ordered
+
+    def _run_task(self, task):
+        if task.step in ('stage', 'prime'):
+            with self._shared_area_lock:
+                if task.step == 'stage':
+                    # Parts still building are checked against this one
+                    # when they are staged in turn.
+                    pluginhandler.check_for_collisions(
+                        [p for p in self.config.all_parts
+                         if p.name not in self._building])
+                self._run_part_step(task.step, task.part)
+        else:
+            self._run_part_step(task.step, task.part)
+            if task.step == 'build':
+                with self._shared_area_lock:
+                    self._building.discard(task.part.name)
+
     def _create_meta(self, step, part_names):
         if step == 'prime' and part_names == self.config.part_names:
-            common.env = self.config.snap_env()
+            common.set_env(self.config.snap_env())
             meta.create_snap_packaging(self.config.data,
                                        self.project_options.snap_dir,
                                        self.project_options.parts_dir)
@@ -178,9 +317,9 @@ class _Executor:
                 "part's {0!r} step in order to rebuild".format(
                     step, part.name))
 
-        staged_state = self.config.get_project_state('stage')
-        primed_state = self.config.get_project_state('prime')
+        self._clean_step(part, step, '(out of date)')
 
+    def _clean_step(self, part, step, hint, incremental=False):
         # We need to clean this step, but if it involves cleaning the stage
         # step and it has dependents that have been built, we need to ask for
         # them to first be cleaned (at least back to the build step).
@@ -200,7 +339,10 @@ class _Executor:
                             step, part.name, humanized_parts,
                             's' if len(dependents) == 1 else ''))
 
-        part.clean(staged_state, primed_state, step, '(out of date)')
+        with self._shared_area_lock:
+            staged_state = self.config.get_project_state('stage')
+            primed_state = self.config.get_project_state('prime')
+            part.clean(staged_state, primed_state, step, hint, incremental)
 
 
 def _create_tar_filter(tar_filename):
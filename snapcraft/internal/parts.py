@@ -14,21 +14,33 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import difflib
+import collections
+import contextlib
 import logging
 import os
+import pickle
+import re
+import sqlite3
 import sys
 
-import requests
 import yaml
 from xdg import BaseDirectory
 
-from snapcraft.internal.indicators import download_requests_stream
 from snapcraft.internal.common import get_terminal_width
 
 
 PARTS_URI = 'https://parts.snapcraft.io/v1/parts.yaml'
-_MATCH_RATIO = 0.6
+# Part names sharing at least this share of their trigrams with the query
+# match it, and so do descriptions containing this share of the trigrams
+# of the query.
+_NAME_SIMILARITY = 0.3
+_DESCRIPTION_CONTAINMENT = 0.6
+# Description matches rank below name matches.
+_DESCRIPTION_WEIGHT = 0.5
+_NAME_FIELD = 0
+_DESCRIPTION_FIELD = 1
+# Increased whenever what the index holds changes.
+_INDEX_VERSION = 2
 _HEADER_PART_NAME = 'PART NAME'
 _HEADER_DESCRIPTION = 'DESCRIPTION'
 
@@ -36,12 +48,119 @@ logging.getLogger("urllib3").setLevel(logging.CRITICAL)
 logger = logging.getLogger(__name__)
 
 
+def get_remote_parts_file():
+    """Return the path to the remote parts cache, which may not exist."""
+    return os.path.join(BaseDirectory.xdg_data_home, 'snapcraft', 'parts.yaml')
+
+
+def _get_index_file(parts_yaml):
+    return os.path.join(os.path.dirname(parts_yaml), 'parts.db')
+
+
+def _get_stamp(parts_yaml):
+    st = os.stat(parts_yaml)
+    return '{} {}'.format(st.st_mtime_ns, st.st_size)
+
+
+def _get_trigrams(text):
+    """Return the set of trigrams of the words in text, as pg_trgm does."""
+    trigrams = set()
+    for word in re.findall(r'\w+', text.lower()):
+        word = '  {} '.format(word)
+        trigrams.update(word[i:i + 3] for i in range(len(word) - 2))
+    return trigrams
+
+
+def _build_index(parts_yaml):
+    """Convert parts_yaml into an index the parts can be read from alone.
+
+    Loading the whole of parts.yaml takes longer the more parts there are,
+    while most projects use a few remote parts, or none. The index also
+    maps the trigrams of the names and descriptions of parts to the parts,
+    to search them without going through every part.
+    """
+    stamp = _get_stamp(parts_yaml)
+    with open(parts_yaml) as parts_file:
+        remote_parts = yaml.load(parts_file) or {}
+
+    index_file = _get_index_file(parts_yaml)
+    temp_file = '{}.{}.tmp'.format(index_file, os.getpid())
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(temp_file)
+    connection = sqlite3.connect(temp_file)
+    try:
+        with connection:
+            connection.executescript('''
+                CREATE TABLE meta (
+                    version INTEGER NOT NULL,
+                    stamp TEXT NOT NULL
+                );
+                CREATE TABLE parts (
+                    id INTEGER PRIMARY KEY,
+                    name TEXT UNIQUE NOT NULL,
+                    plugin TEXT,
+                    maintainer TEXT,
+                    name_trigrams INTEGER NOT NULL,
+                    part BLOB NOT NULL
+                );
+                CREATE TABLE trigrams (
+                    trigram TEXT NOT NULL,
+                    field INTEGER NOT NULL,
+                    part_id INTEGER NOT NULL,
+                    PRIMARY KEY (trigram, field, part_id)
+                ) WITHOUT ROWID;
+            ''')
+            connection.execute('INSERT INTO meta VALUES (?, ?)',
+                               (_INDEX_VERSION, stamp))
+            for part_id, (name, part) in enumerate(remote_parts.items()):
+                _index_part(connection, part_id, name, part)
+    finally:
+        connection.close()
+    os.rename(temp_file, index_file)
+
+
+def _index_part(connection, part_id, name, part):
+    name_trigrams = _get_trigrams(name)
+    description_trigrams = _get_trigrams(str(part.get('description', '')))
+    connection.execute(
+        'INSERT INTO parts VALUES (?, ?, ?, ?, ?, ?)',
+        (part_id, name, part.get('plugin'), part.get('maintainer'),
+         len(name_trigrams),
+         pickle.dumps(part, protocol=pickle.HIGHEST_PROTOCOL)))
+    connection.executemany(
+        'INSERT INTO trigrams VALUES (?, ?, ?)',
+        [(t, _NAME_FIELD, part_id) for t in name_trigrams] +
+        [(t, _DESCRIPTION_FIELD, part_id) for t in description_trigrams])
+
+
+def _open_index(parts_yaml):
+    """Return a connection to the index of parts_yaml, building it if needed.
+
+    The index is built again if parts_yaml changed since it was built.
+    """
+    index_file = _get_index_file(parts_yaml)
+    stamp = _get_stamp(parts_yaml)
+    if os.path.exists(index_file):
+        connection = sqlite3.connect(index_file)
+        try:
+            row = connection.execute(
+                'SELECT version, stamp FROM meta').fetchone()
+        except sqlite3.Error:
+            row = None
+        if row and row == (_INDEX_VERSION, stamp):
+            return connection
+        connection.close()
+
+    _build_index(parts_yaml)
+    return sqlite3.connect(index_file)
+
+
 class _Base:
 
     def __init__(self):
-        self.parts_dir = os.path.join(BaseDirectory.xdg_data_home, 'snapcraft')
+        self.parts_yaml = get_remote_parts_file()
+        self.parts_dir = os.path.dirname(self.parts_yaml)
         os.makedirs(self.parts_dir, exist_ok=True)
-        self.parts_yaml = os.path.join(self.parts_dir, 'parts.yaml')
 
 
 class _Update(_Base):
@@ -52,18 +171,18 @@ class _Update(_Base):
         self._parts_uri = os.environ.get('SNAPCRAFT_PARTS_URI', PARTS_URI)
 
     def execute(self):
-        headers = self._load_headers()
-        self._request = requests.get(self._parts_uri, stream=True,
-                                     headers=headers)
+        # Only updating parts needs requests, which takes long to import.
+        from snapcraft.internal import download
 
-        if self._request.status_code == 304:
+        result = download.download(
+            self._parts_uri, self.parts_yaml, 'Downloading parts list',
+            headers=self._load_headers())
+        if not result:
             logger.info('The parts cache is already up to date.')
             return
-        self._request.raise_for_status()
 
-        download_requests_stream(self._request, self.parts_yaml,
-                                 'Downloading parts list')
-        self._save_headers()
+        _build_index(self.parts_yaml)
+        self._save_headers(result.headers)
 
     def _load_headers(self):
         if not os.path.exists(self._headers_yaml):
@@ -72,48 +191,130 @@ class _Update(_Base):
         with open(self._headers_yaml) as headers_file:
             return yaml.load(headers_file)
 
-    def _save_headers(self):
+    def _save_headers(self, response_headers):
         headers = {
-            'If-Modified-Since': self._request.headers.get('Last-Modified')}
+            'If-Modified-Since': response_headers.get('Last-Modified')}
 
         with open(self._headers_yaml, 'w') as headers_file:
             headers_file.write(yaml.dump(headers))
 
 
 class _RemoteParts(_Base):
+    """The remote parts, read from their index when first needed."""
 
     def __init__(self):
         super().__init__()
 
-        if not os.path.exists(self.parts_yaml):
-            update()
+        self._connection = None
 
-        with open(self.parts_yaml) as parts_file:
-            self._parts = yaml.load(parts_file)
+    def _get_index(self):
+        if not self._connection:
+            if not os.path.exists(self.parts_yaml):
+                update()
+            self._connection = _open_index(self.parts_yaml)
+        return self._connection
 
     def get_part(self, part_name, full=False):
-        remote_part = self._parts[part_name].copy()
+        row = self._get_index().execute(
+            'SELECT part FROM parts WHERE name = ?', (part_name,)).fetchone()
+        if not row:
+            raise KeyError(part_name)
+        remote_part = pickle.loads(row[0])
         if not full:
             for key in ['description', 'maintainer']:
                 remote_part.pop(key)
         return remote_part
 
-    def matches_for(self, part_match, max_len=0):
-        matcher = difflib.SequenceMatcher(isjunk=None, autojunk=False)
-        matcher.set_seq2(part_match)
-
-        matching_parts = {}
-        for part_name in self._parts.keys():
-            matcher.set_seq1(part_name)
-            add_part_name = matcher.ratio() >= _MATCH_RATIO
-
-            if add_part_name or (part_match in part_name):
-                matching_parts[part_name] = self._parts[part_name]
-                if len(part_name) > max_len:
-                    max_len = len(part_name)
+    def matches_for(self, part_match, max_len=0, plugin=None,
+                    maintainer=None):
+        """Return the parts matching part_match, best matches first.
+
+        A part matches if its name contains part_match or shares enough of
+        its trigrams, or if its description contains enough of them.
+
+        :param str part_match: what to look for, all parts match if empty.
+        :param int max_len: the minimum length to return, along with the
+                            length of the longest name matching.
+        :param str plugin: only match parts using this plugin.
+        :param str maintainer: only match parts whose maintainer contains
+                               this, ignoring case.
+        :returns: a tuple with a dictionary of the parts matching and the
+                  length of the longest name matching.
+        """
+        conditions = []
+        parameters = []
+        if plugin:
+            conditions.append('plugin = ?')
+            parameters.append(plugin)
+        if maintainer:
+            conditions.append("maintainer LIKE ? ESCAPE '\\'")
+            parameters.append('%{}%'.format(
+                re.sub(r'([%_\\])', r'\\\1', maintainer)))
+        where = ' AND '.join(conditions) or '1'
+
+        index = self._get_index()
+        if part_match:
+            scores = self._score(index, part_match)
+            rows = index.execute(
+                'SELECT id, name, part FROM parts WHERE ({}) AND ('
+                'id IN ({}) OR instr(name, ?))'.format(
+                    where, ','.join(str(i) for i in scores)),
+                parameters + [part_match]).fetchall()
+            for part_id, part_name, part in rows:
+                # Names containing part_match rank by how much of them it
+                # is, exact matches first.
+                if part_match in part_name:
+                    scores[part_id] = max(scores.get(part_id, 0),
+                                          len(part_match) / len(part_name))
+            rows.sort(key=lambda row: (-scores[row[0]], row[1]))
+        else:
+            rows = index.execute(
+                'SELECT id, name, part FROM parts WHERE {} '
+                'ORDER BY id'.format(where), parameters).fetchall()
+
+        matching_parts = collections.OrderedDict()
+        for part_id, part_name, part in rows:
+            matching_parts[part_name] = pickle.loads(part)
+            max_len = max(max_len, len(part_name))
 
         return matching_parts, max_len
 
+    def _score(self, index, part_match):
+        """Return the ids of the parts matching part_match, with scores."""
+        trigrams = _get_trigrams(part_match)
+        if not trigrams:
+            return {}
+
+        shared = collections.defaultdict(lambda: [0, 0])
+        # Look up trigrams in batches, below the limit of sqlite parameters.
+        trigrams = sorted(trigrams)
+        for i in range(0, len(trigrams), 500):
+            batch = trigrams[i:i + 500]
+            for part_id, field, count in index.execute(
+                    'SELECT part_id, field, COUNT(*) FROM trigrams '
+                    'WHERE trigram IN ({}) GROUP BY part_id, field'.format(
+                        ','.join('?' * len(batch))), batch):
+                shared[part_id][field] += count
+
+        scores = {}
+        for part_id, name_count in index.execute(
+                'SELECT id, name_trigrams FROM parts WHERE id IN ({})'.format(
+                    ','.join(str(i) for i in shared))):
+            name_shared, description_shared = shared[part_id]
+            # The Jaccard similarity of the name and of the query, and how
+            # much of the query the description contains.
+            name_score = name_shared / (
+                len(trigrams) + name_count - name_shared)
+            description_score = description_shared / len(trigrams)
+            score = 0
+            if name_score >= _NAME_SIMILARITY:
+                score = name_score
+            if description_score >= _DESCRIPTION_CONTAINMENT:
+                score = max(score, description_score * _DESCRIPTION_WEIGHT)
+            if score:
+                scores[part_id] = score
+        return scores
+
     def compose(self, part_name, properties):
         """Return properties composed with the ones from part name in the wiki.
         :param str part_name: The name of the part to query from the wiki
@@ -148,9 +349,10 @@ def define(part_name):
               default_flow_style=False, stream=sys.stdout)
 
 
-def search(part_match):
+def search(part_match, plugin=None, maintainer=None):
     header_len = len(_HEADER_PART_NAME)
-    matches, part_length = _RemoteParts().matches_for(part_match, header_len)
+    matches, part_length = _RemoteParts().matches_for(
+        part_match, header_len, plugin=plugin, maintainer=maintainer)
 
     terminal_width = get_terminal_width(max_width=None)
     part_length = max(part_length, header_len)
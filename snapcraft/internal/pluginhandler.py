@@ -14,14 +14,18 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import collections
+import concurrent.futures
 import contextlib
-import filecmp
+import fnmatch
 import glob
 import importlib
 import itertools
 import logging
 import os
+import re
 import shutil
+import stat
 import sys
 
 import jsonschema
@@ -29,15 +33,25 @@ import magic
 import yaml
 
 import snapcraft
+from snapcraft import _schema
 from snapcraft.internal import (
+    buildcache,
     common,
+    fingerprint,
     libraries,
     repo,
+    sources,
     states,
 )
 
 _SNAPCRAFT_STAGE = '$SNAPCRAFT_STAGE'
 
+# The number of threads linking files when migrating them, and how many
+# files each thread is given at a time.
+_MIGRATE_JOBS = 8
+_MIGRATE_CHUNK_SIZE = 256
+_DEPENDENCY_JOBS = 4
+
 logger = logging.getLogger(__name__)
 
 
@@ -69,7 +83,7 @@ class PluginHandler:
         return self._ubuntu
 
     def __init__(self, plugin_name, part_name, properties,
-                 project_options, part_schema):
+                 project_options, part_schema, validate=True):
         self.valid = False
         self.code = None
         self.config = {}
@@ -84,16 +98,24 @@ class PluginHandler:
         parts_dir = project_options.parts_dir
         self.ubuntudir = os.path.join(parts_dir, part_name, 'ubuntu')
         self.statedir = os.path.join(parts_dir, part_name, 'state')
-
+        self._source_index = os.path.join(
+            parts_dir, part_name, 'source-index')
+        self._install_digests = fingerprint.DigestCache(os.path.join(
+            parts_dir, part_name, 'install-digests'))
+        self._dependency_cache = libraries.DependencyCache(os.path.join(
+            parts_dir, part_name, 'dependency-cache'))
+
+        self._state_store = states.get_store(parts_dir)
         self._migrate_state_file()
+        self._migrate_state_directory()
 
         try:
-            self._load_code(plugin_name, properties, part_schema)
+            self._load_code(plugin_name, properties, part_schema, validate)
         except jsonschema.ValidationError as e:
             raise PluginError('properties failed to load for {}: {}'.format(
                 part_name, e.message))
 
-    def _load_code(self, plugin_name, properties, part_schema):
+    def _load_code(self, plugin_name, properties, part_schema, validate):
         module_name = plugin_name.replace('-', '_')
         module = None
 
@@ -118,7 +140,7 @@ class PluginHandler:
         plugin = _get_plugin(module)
         options, self.pull_properties, self.build_properties = _make_options(
             self._project_options.stage_dir, part_schema, properties,
-            plugin.schema())
+            plugin.schema(), validate)
         # For backwards compatibility we add the project to the plugin
         try:
             self.code = plugin(self.name, options, self._project_options)
@@ -147,7 +169,7 @@ class PluginHandler:
     def makedirs(self):
         dirs = [
             self.code.sourcedir, self.code.builddir, self.code.installdir,
-            self.stagedir, self.snapdir, self.ubuntudir, self.statedir
+            self.stagedir, self.snapdir, self.ubuntudir
         ]
         for d in dirs:
             os.makedirs(d, exist_ok=True)
@@ -162,18 +184,28 @@ class PluginHandler:
 
             if step:
                 os.remove(self.statedir)
-                os.makedirs(self.statedir)
                 self.mark_done(step)
 
+    def _migrate_state_directory(self):
+        # Until the project had a state store, each step had its state in a
+        # YAML file in the state directory.
+        if not os.path.isdir(self.statedir):
+            return
+
+        for step in common.COMMAND_ORDER:
+            state_file = os.path.join(self.statedir, step)
+            if os.path.isfile(state_file):
+                with open(state_file, 'r') as f:
+                    state = yaml.load(f.read())
+                self._state_store.set_state(
+                    self.name, step, state, clear_later_steps=False)
+        shutil.rmtree(self.statedir)
+
     def notify_part_progress(self, progress, hint=''):
         logger.info('%s %s %s', progress, self.name, hint)
 
     def last_step(self):
-        for step in reversed(common.COMMAND_ORDER):
-            if os.path.exists(self._step_state_file(step)):
-                return step
-
-        return None
+        return self._state_store.get_last_step(self.name)
 
     def is_clean(self, step):
         """Return true if the given step hasn't run (or has been cleaned)."""
@@ -210,6 +242,21 @@ class PluginHandler:
 
         return False
 
+    def is_outdated(self, step):
+        """Return true if the sources of the given step have changed."""
+
+        if step != 'pull':
+            return False
+
+        # Only local sources have a fingerprint, and neither do states
+        # written by older versions of snapcraft.
+        state = self.get_state('pull')
+        recorded_fingerprint = getattr(state, 'source_fingerprint', None)
+        if not recorded_fingerprint:
+            return False
+
+        return recorded_fingerprint != self._get_source_fingerprint()
+
     def should_step_run(self, step, force=False):
         return force or self.is_clean(step)
 
@@ -217,36 +264,15 @@ class PluginHandler:
         if not state:
             state = {}
 
-        index = common.COMMAND_ORDER.index(step)
-
-        with open(self._step_state_file(step), 'w') as f:
-            f.write(yaml.dump(state))
-
         # We know we've only just completed this step, so make sure any later
         # steps don't have a saved state.
-        if index+1 != len(common.COMMAND_ORDER):
-            for command in common.COMMAND_ORDER[index+1:]:
-                self.mark_cleaned(command)
+        self._state_store.set_state(self.name, step, state)
 
     def mark_cleaned(self, step):
-        state_file = self._step_state_file(step)
-        if os.path.exists(state_file):
-            os.remove(state_file)
-
-        if os.path.isdir(self.statedir) and not os.listdir(self.statedir):
-            os.rmdir(self.statedir)
+        self._state_store.clear_state(self.name, step)
 
     def get_state(self, step):
-        state = None
-        state_file = self._step_state_file(step)
-        if os.path.isfile(state_file):
-            with open(state_file, 'r') as f:
-                state = yaml.load(f.read())
-
-        return state
-
-    def _step_state_file(self, step):
-        return os.path.join(self.statedir, step)
+        return self._state_store.get_state(self.name, step)
 
     def _fetch_stage_packages(self):
         if not self.code.stage_packages:
@@ -272,11 +298,20 @@ class PluginHandler:
     def pull(self, force=False):
         self.makedirs()
         self.notify_part_progress('Pulling')
+        # Take the fingerprint first, so changes made while pulling are
+        # picked up next time.
+        source_fingerprint = self._get_source_fingerprint()
         self.code.pull()
         self.mark_done('pull', states.PullState(
-            self.pull_properties, self.code.options, self._project_options))
+            self.pull_properties, self.code.options, self._project_options,
+            source_fingerprint))
+
+    def _get_source_fingerprint(self):
+        return sources.get_fingerprint(
+            self.code.sourcedir, self.code.options,
+            self._source_index)
 
-    def clean_pull(self, hint=''):
+    def clean_pull(self, hint='', incremental=False):
         if self.is_clean('pull'):
             hint = '{} {}'.format(hint, '(already clean)').strip()
             self.notify_part_progress('Skipping cleaning pulled source for',
@@ -284,11 +319,19 @@ class PluginHandler:
             return
 
         self.notify_part_progress('Cleaning pulled source for', hint)
-        # Remove ubuntu cache (where stage packages are fetched)
-        if os.path.exists(self.ubuntudir):
-            shutil.rmtree(self.ubuntudir)
-
-        self.code.clean_pull()
+        # Pulling again updates the source and stage packages in place.
+        if not incremental:
+            # Remove ubuntu cache (where stage packages are fetched)
+            if os.path.exists(self.ubuntudir):
+                shutil.rmtree(self.ubuntudir)
+
+            # What is kept about the part between runs goes along with it.
+            if os.path.exists(self._source_index):
+                os.remove(self._source_index)
+            self._install_digests.clear()
+            self._dependency_cache.clear()
+
+            self.code.clean_pull()
         self.mark_cleaned('pull')
 
     def prepare_build(self, force=False):
@@ -296,16 +339,41 @@ class PluginHandler:
         self.notify_part_progress('Preparing to build')
         # Stage packages are fetched and unpacked in the pull step, but we'll
         # unpack again here just in case the build step has been cleaned.
+        # Only what is missing from installdir is extracted again.
         self._unpack_stage_packages()
 
     def build(self, force=False):
         self.makedirs()
-        self.notify_part_progress('Building')
-        self.code.build()
+
+        cache = None
+        cache_key = None
+        if self._project_options.use_build_cache:
+            cache = buildcache.get_cache()
+            cache_key = self.build_cache_key()
+
+        if cache and cache.restore(cache_key, self.installdir):
+            self.notify_part_progress('Building', '(restored from cache)')
+        else:
+            self.notify_part_progress('Building')
+            self.code.build()
+            if cache:
+                cache.save(cache_key, self.installdir)
+
         self.mark_done('build', states.BuildState(
             self.build_properties, self.code.options, self._project_options))
 
-    def clean_build(self, hint=''):
+    def build_cache_key(self):
+        dependency_files = []
+        for dep in self.deps:
+            state = dep.get_state('stage')
+            if state:
+                dependency_files.extend(state.files)
+
+        return buildcache.compute_key(
+            self.code, self.code.options, self.code.sourcedir,
+            self._project_options, dependency_files)
+
+    def clean_build(self, hint='', incremental=False):
         if self.is_clean('build'):
             hint = '{} {}'.format(hint, '(already clean)').strip()
             self.notify_part_progress('Skipping cleaning build for',
@@ -313,7 +381,13 @@ class PluginHandler:
             return
 
         self.notify_part_progress('Cleaning build for', hint)
-        self.code.clean_build()
+        # Keep what was built so building again only rebuilds what changed,
+        # but not what was installed since that is not tracked.
+        if incremental:
+            if os.path.exists(self.installdir):
+                shutil.rmtree(self.installdir)
+        else:
+            self.code.clean_build()
         self.mark_cleaned('build')
 
     def migratable_fileset_for(self, step):
@@ -323,6 +397,14 @@ class PluginHandler:
 
         return _migratable_filesets(fileset, self.code.installdir)
 
+    def get_installed_digest(self, path):
+        """Return the digest of the contents of path in the installdir."""
+        return self._install_digests.get_digest(
+            os.path.join(self.installdir, path))
+
+    def save_installed_digests(self):
+        self._install_digests.save()
+
     def _organize(self):
         organize_fileset = getattr(self.code.options, 'organize', {}) or {}
 
@@ -351,12 +433,11 @@ class PluginHandler:
         def fixup_func(file_path):
             if os.path.islink(file_path):
                 return
-            if not file_path.endswith('.pc'):
-                return
             repo.fix_pkg_config(self.stagedir, file_path, self.code.installdir)
 
         _migrate_files(snap_files, snap_dirs, self.code.installdir,
-                       self.stagedir, fixup_func=fixup_func)
+                       self.stagedir, fixup_func=fixup_func,
+                       fixup_pattern='*.pc')
         # TODO once `snappy try` is in place we will need to copy
         # dependencies here too
 
@@ -389,7 +470,10 @@ class PluginHandler:
         self.notify_part_progress('Priming')
         snap_files, snap_dirs = self.migratable_fileset_for('snap')
         _migrate_files(snap_files, snap_dirs, self.stagedir, self.snapdir)
-        dependencies = _find_dependencies(self.snapdir)
+        # Files primed by other parts had their dependencies found then.
+        dependencies = _find_dependencies(
+            self.snapdir, snap_files, self._dependency_cache)
+        self._dependency_cache.save()
 
         # Split the necessary dependencies into their corresponding location.
         # We'll both migrate and track the system dependencies, but we'll only
@@ -482,7 +566,12 @@ class PluginHandler:
         return self.code.env(root)
 
     def clean(self, project_staged_state=None, project_primed_state=None,
-              step=None, hint=''):
+              step=None, hint='', incremental=False):
+        """Clean the given step and the ones after it.
+
+        If incremental is set, the pulled source and build directory are
+        kept for the pull and build steps to update.
+        """
         if not project_staged_state:
             project_staged_state = {}
 
@@ -491,7 +580,7 @@ class PluginHandler:
 
         try:
             self._clean_steps(project_staged_state, project_primed_state,
-                              step, hint)
+                              step, hint, incremental)
         except MissingState:
             # If one of the step cleaning rules is missing state, it must be
             # running on the output of an old Snapcraft. In that case, if we
@@ -512,7 +601,7 @@ class PluginHandler:
             os.rmdir(self.code.partdir)
 
     def _clean_steps(self, project_staged_state, project_primed_state,
-                     step=None, hint=None):
+                     step=None, hint=None, incremental=False):
         index = None
         if step:
             if step not in common.COMMAND_ORDER:
@@ -529,10 +618,10 @@ class PluginHandler:
             self.clean_stage(project_staged_state, hint)
 
         if not index or index <= common.COMMAND_ORDER.index('build'):
-            self.clean_build(hint)
+            self.clean_build(hint, incremental)
 
         if not index or index <= common.COMMAND_ORDER.index('pull'):
-            self.clean_pull(hint)
+            self.clean_pull(hint, incremental)
 
 
 def _validate_step_properties(step, plugin_schema):
@@ -551,7 +640,8 @@ def _validate_step_properties(step, plugin_schema):
                 step_properties_key, list(invalid_properties)))
 
 
-def _make_options(stage_dir, part_schema, properties, plugin_schema):
+def _make_options(stage_dir, part_schema, properties, plugin_schema,
+                  validate=True):
     if 'properties' not in plugin_schema:
         plugin_schema['properties'] = {}
     # The base part_schema takes precedense over the plugin.
@@ -559,7 +649,8 @@ def _make_options(stage_dir, part_schema, properties, plugin_schema):
 
     _validate_step_properties('pull', plugin_schema)
     _validate_step_properties('build', plugin_schema)
-    jsonschema.validate(properties, plugin_schema)
+    if validate:
+        _schema.validate(properties, plugin_schema)
 
     class Options():
         pass
@@ -611,7 +702,7 @@ def _load_local(module_name, local_plugin_dir):
 
 
 def load_plugin(part_name, plugin_name, properties=None,
-                project_options=None, part_schema=None):
+                project_options=None, part_schema=None, validate=True):
     if properties is None:
         properties = {}
     if part_schema is None:
@@ -619,59 +710,99 @@ def load_plugin(part_name, plugin_name, properties=None,
     if project_options is None:
         project_options = snapcraft.ProjectOptions()
     return PluginHandler(plugin_name, part_name, properties,
-                         project_options, part_schema)
+                         project_options, part_schema, validate)
 
 
 def _migratable_filesets(fileset, srcdir):
     includes, excludes = _get_file_list(fileset)
 
-    include_files = _generate_include_set(srcdir, includes)
-    exclude_files, exclude_dirs = _generate_exclude_set(srcdir, excludes)
-
-    # And chop files, including whole trees if any dirs are mentioned
-    snap_files = include_files - exclude_files
-    for exclude_dir in exclude_dirs:
-        snap_files = set([x for x in snap_files
-                          if not x.startswith(exclude_dir + '/')])
-
-    # Separate dirs from files
-    snap_dirs = set([x for x in snap_files
-                     if os.path.isdir(os.path.join(srcdir, x)) and
-                     not os.path.islink(os.path.join(srcdir, x))])
-    snap_files = snap_files - snap_dirs
-
-    # Make sure we also obtain the parent directories of files
-    for snap_file in snap_files:
-        dirname = os.path.dirname(snap_file)
-        while dirname:
-            snap_dirs.add(dirname)
-            dirname = os.path.dirname(dirname)
-
-    return snap_files, snap_dirs
+    return _FilesetMatcher(includes, excludes).match(srcdir)
 
 
 def _migrate_files(snap_files, snap_dirs, srcdir, dstdir, missing_ok=False,
-                   follow_symlinks=False, fixup_func=lambda *args: None):
-    for directory in snap_dirs:
-        os.makedirs(os.path.join(dstdir, directory), exist_ok=True)
-
-    for snap_file in snap_files:
-        src = os.path.join(srcdir, snap_file)
-        dst = os.path.join(dstdir, snap_file)
-        os.makedirs(os.path.dirname(dst), exist_ok=True)
-        if missing_ok and not os.path.exists(src):
-            continue
+                   follow_symlinks=False, fixup_func=lambda *args: None,
+                   fixup_pattern=None):
+    """Link or copy snap_files and snap_dirs from srcdir into dstdir.
+
+    Files already in dstdir are replaced, unless they are symlinks. The
+    files are linked from a pool of threads, after which fixup_func is
+    called on those migrated whose path matches fixup_pattern (a shell
+    pattern), or on all of them if there is no pattern.
+    """
+    stats = common.get_copy_stats()
+
+    directories = set(snap_dirs)
+    directories.update(os.path.dirname(f) for f in snap_files)
+    existing = _make_directories(directories, dstdir)
+
+    snap_files = sorted(snap_files)
+    chunks = [snap_files[i:i + _MIGRATE_CHUNK_SIZE]
+              for i in range(0, len(snap_files), _MIGRATE_CHUNK_SIZE)]
+
+    def migrate(chunk):
+        migrated = []
+        for snap_file in chunk:
+            src = os.path.join(srcdir, snap_file)
+            dst = os.path.join(dstdir, snap_file)
+            if missing_ok and not os.path.exists(src):
+                continue
 
-        # If the file is already here and it's a symlink, leave it alone.
-        if os.path.islink(dst):
-            continue
+            # If the file is already here and it's a symlink, leave it
+            # alone. Otherwise, remove and re-link it.
+            is_symlink = existing.get(snap_file)
+            if is_symlink:
+                continue
+            elif is_symlink is not None:
+                os.remove(dst)
+
+            common.link_or_copy(src, dst, follow_symlinks=follow_symlinks)
+            migrated.append(snap_file)
+        return migrated
+
+    with concurrent.futures.ThreadPoolExecutor(_MIGRATE_JOBS) as executor:
+        migrated = list(itertools.chain.from_iterable(
+            executor.map(migrate, chunks)))
+
+    # Fixups are not expected to be thread safe, fix_pkg_config is not.
+    for snap_file in migrated:
+        if not fixup_pattern or fnmatch.fnmatchcase(snap_file, fixup_pattern):
+            fixup_func(os.path.join(dstdir, snap_file))
+
+    stats = common.get_copy_stats() - stats
+    if stats:
+        logger.debug('Copied files into {!r} ({})'.format(
+            dstdir, common.format_copy_stats(stats)))
+
+
+def _make_directories(directories, dstdir):
+    """Create directories in dstdir and scan those that already existed.
+
+    :returns: a dict telling, for each entry found in the directories that
+              already existed, whether it is a symlink.
+    """
+    os.makedirs(dstdir, exist_ok=True)
+    existing_dirs = ['']
+    # Parents sort before their children, so each directory is created
+    # with a single mkdir.
+    for directory in sorted(directories - {''}):
+        path = os.path.join(dstdir, directory)
+        try:
+            os.mkdir(path)
+        except FileExistsError:
+            if not os.path.isdir(path):
+                raise
+            existing_dirs.append(directory)
+        except FileNotFoundError:
+            # Only happens when not given the parents of a directory.
+            os.makedirs(path)
 
-        # Otherwise, remove and re-link it.
-        if os.path.exists(dst):
-            os.remove(dst)
+    existing = {}
+    for directory in existing_dirs:
+        prefix = directory + '/' if directory else ''
+        for entry in os.scandir(os.path.join(dstdir, directory)):
+            existing[prefix + entry.name] = entry.is_symlink()
 
-        common.link_or_copy(src, dst, follow_symlinks=follow_symlinks)
-        fixup_func(dst)
+    return existing
 
 
 def _clean_migrated_files(snap_files, snap_dirs, directory):
@@ -689,33 +820,85 @@ def _clean_migrated_files(snap_files, snap_dirs, directory):
             os.rmdir(migrated_directory)
 
 
-def _find_dependencies(workdir):
+def _find_dependencies(workdir, files=None, cache=None):
+    """Return the libraries needed by the dynamically linked ELF files.
+
+    :param str workdir: the directory holding the files.
+    :param files: the paths of the files to look at relative to workdir, or
+                  None to look at every file in workdir.
+    :param cache: a libraries.DependencyCache to keep the results in.
+    """
     ms = magic.open(magic.NONE)
     if ms.load() != 0:
         raise RuntimeError('Cannot load magic header detection')
 
-    elf_files = set()
     fs_encoding = sys.getfilesystemencoding()
-
-    for root, dirs, files in os.walk(workdir.encode(fs_encoding)):
+    if files is None:
+        paths = _walk_files(workdir.encode(fs_encoding))
+    else:
+        paths = (os.path.join(workdir, f).encode(fs_encoding)
+                 for f in sorted(files))
+
+    dependencies = set()
+    elf_files = []
+    for path, st in _find_regular_files(workdir, paths):
+        key = os.fsdecode(path)
+        libs = _get_cached_dependencies(cache, key, st)
+        if libs is not None:
+            dependencies.update(libs)
+        elif _is_dynamic_elf(ms, path):
+            elf_files.append((key, st))
+        elif cache:
+            cache.set(key, st, [])
+
+    # The environment is local to this thread, read it before starting the
+    # workers.
+    library_path = libraries.get_library_path() if elf_files else None
+    with concurrent.futures.ThreadPoolExecutor(_DEPENDENCY_JOBS) as executor:
+        results = executor.map(
+            lambda path: libraries.get_dependencies(path, library_path),
+            [key for key, st in elf_files])
+        for (key, st), libs in zip(elf_files, results):
+            if cache:
+                cache.set(key, st, libs)
+            dependencies.update(libs)
+
+    return dependencies
+
+
+def _find_regular_files(workdir, paths):
+    """Yield the paths of the regular files in paths, and their stat."""
+    for path in paths:
         # Filter out object (*.o) files-- we only care about binaries.
-        entries = (entry for entry in itertools.chain(files, dirs)
-                   if not entry.endswith(b'.o'))
-        for entry in entries:
-            path = os.path.join(root, entry)
-            if os.path.islink(path):
-                logger.debug('Skipped link {!r} when parsing {!r}'.format(
-                    path, workdir))
-                continue
-            file_m = ms.file(path)
-            if file_m.startswith('ELF') and 'dynamically linked' in file_m:
-                elf_files.add(path)
+        if path.endswith(b'.o'):
+            continue
+        st = os.lstat(path)
+        if stat.S_ISLNK(st.st_mode):
+            logger.debug('Skipped link {!r} when parsing {!r}'.format(
+                path, workdir))
+            continue
+        if stat.S_ISREG(st.st_mode):
+            yield path, st
 
-    dependencies = []
-    for elf_file in elf_files:
-        dependencies += libraries.get_dependencies(elf_file)
 
-    return set(dependencies)
+def _get_cached_dependencies(cache, key, st):
+    """Return the libraries cached for the file, or None if not cached."""
+    found, libs = cache.get(key, st) if cache else (False, None)
+    if not found:
+        return None
+    # Libraries are only listed if they exist, which may have changed since.
+    return [lib for lib in libs or () if os.path.exists(lib)]
+
+
+def _is_dynamic_elf(ms, path):
+    file_m = ms.file(path)
+    return file_m.startswith('ELF') and 'dynamically linked' in file_m
+
+
+def _walk_files(directory):
+    for root, dirs, files in os.walk(directory):
+        for entry in files:
+            yield os.path.join(root, entry)
 
 
 def _get_file_list(stage_set):
@@ -737,45 +920,159 @@ def _get_file_list(stage_set):
     return includes, excludes
 
 
-def _generate_include_set(directory, includes):
-    include_files = set()
-    for include in includes:
-        if '*' in include:
-            matches = glob.glob(os.path.join(directory, include))
-            include_files |= set(matches)
-        else:
-            include_files |= set([os.path.join(directory, include), ])
+class _FilesetMatcher:
+    """Find the files and directories of a tree selected by a fileset.
+
+    Everything matching an include pattern is selected, along with the
+    whole tree below the directories it matches. Everything matching an
+    exclude pattern is then left out, along with the whole tree below the
+    directories it matches. Patterns are matched like glob does, except for
+    includes without a '*', which are taken literally and selected even if
+    missing.
+
+    The tree is walked once, descending only into the directories some
+    pattern or selected directory leads to.
+    """
+
+    def __init__(self, includes, excludes):
+        self._root_included = False
+        self._root_excluded = False
+        self._literal_includes = []
+        self._patterns = []
+        for include in includes:
+            literal = '*' not in include
+            self._add_pattern(include, literal, is_exclude=False)
+            if literal:
+                self._literal_includes.append(os.path.normpath(include))
+        for exclude in excludes:
+            self._add_pattern(exclude, literal=False, is_exclude=True)
+
+    def _add_pattern(self, pattern, literal, is_exclude):
+        dirs_only = not literal and pattern.endswith('/')
+        components = tuple(_compile_component(c, literal)
+                           for c in pattern.split('/') if c not in ('', '.'))
+        if not components:
+            if is_exclude:
+                self._root_excluded = True
+            else:
+                self._root_included = True
+            return
+        self._patterns.append((components, 0, is_exclude, dirs_only))
+
+    def match(self, directory):
+        """Return the selected files and directories, relative to directory.
+
+        Directories holding selected files are selected too.
+        """
+        files = set()
+        dirs = set()
+        excluded_dirs = set()
+        if not self._root_excluded:
+            self._match_directory(directory, '', self._root_included,
+                                  self._patterns, files, dirs, excluded_dirs)
+
+            for path in self._literal_includes:
+                if (path in files or path in dirs or
+                        _is_below(path, excluded_dirs) or
+                        os.path.lexists(os.path.join(directory, path))):
+                    continue
+                files.add(path)
+
+        # Make sure we also obtain the parent directories of files
+        for path in files:
+            dirname = os.path.dirname(path)
+            while dirname:
+                dirs.add(dirname)
+                dirname = os.path.dirname(dirname)
 
-    include_dirs = [x for x in include_files if os.path.isdir(x)]
-    include_files = set([os.path.relpath(x, directory) for x in include_files])
+        return files, dirs
 
-    # Expand includeFiles, so that an exclude like '*/*.so' will still match
-    # files from an include like 'lib'
-    for include_dir in include_dirs:
-        for root, dirs, files in os.walk(include_dir):
-            include_files |= \
-                set([os.path.relpath(os.path.join(root, d), directory)
-                     for d in dirs])
-            include_files |= \
-                set([os.path.relpath(os.path.join(root, f), directory)
-                     for f in files])
+    def _match_directory(self, path, prefix, included, patterns, files, dirs,
+                         excluded_dirs):
+        try:
+            entries = list(os.scandir(path))
+        except (FileNotFoundError, NotADirectoryError):
+            return
 
-    return include_files
+        for entry in entries:
+            relpath = prefix + entry.name
+            entry_included, excluded, entry_patterns = self._match_entry(
+                entry, included, patterns)
+
+            if excluded:
+                if _is_dir(entry):
+                    excluded_dirs.add(relpath)
+                continue
 
+            is_real_dir = entry.is_dir(follow_symlinks=False)
+            if entry_included:
+                if is_real_dir:
+                    dirs.add(relpath)
+                else:
+                    files.add(relpath)
+
+            # Like glob, patterns go through symlinks to directories, but the
+            # tree below a selected symlink is not selected.
+            entry_included = entry_included and is_real_dir
+            if (entry_included or entry_patterns) and _is_dir(entry):
+                self._match_directory(entry.path, relpath + '/',
+                                      entry_included, entry_patterns, files,
+                                      dirs, excluded_dirs)
+
+    def _match_entry(self, entry, included, patterns):
+        """Match the patterns against entry.
+
+        :returns: whether entry is included and whether it is excluded, and
+                  the patterns left to match below it.
+        """
+        excluded = False
+        entry_patterns = []
+        for components, index, is_exclude, dirs_only in patterns:
+            if not _match_component(components[index], entry.name):
+                continue
+            if index + 1 < len(components):
+                entry_patterns.append(
+                    (components, index + 1, is_exclude, dirs_only))
+            elif dirs_only and not _is_dir(entry):
+                continue
+            elif is_exclude:
+                excluded = True
+            else:
+                included = True
+        return included, excluded, entry_patterns
 
-def _generate_exclude_set(directory, excludes):
-    exclude_files = set()
 
-    for exclude in excludes:
-        matches = glob.glob(os.path.join(directory, exclude))
-        exclude_files |= set(matches)
+def _compile_component(component, literal):
+    if literal or not glob.has_magic(component):
+        return component
+    regex = fnmatch.translate(component)
+    # Like glob, wildcards do not match hidden files.
+    if not component.startswith('.'):
+        regex = r'(?!\.)' + regex
+    return re.compile(regex)
 
-    exclude_dirs = [os.path.relpath(x, directory)
-                    for x in exclude_files if os.path.isdir(x)]
-    exclude_files = set([os.path.relpath(x, directory)
-                         for x in exclude_files])
 
-    return exclude_files, exclude_dirs
+def _match_component(component, name):
+    if isinstance(component, str):
+        return component == name
+    return component.match(name)
+
+
+def _is_dir(entry):
+    # Like os.path.isdir, symlink loops are not directories.
+    try:
+        return entry.is_dir()
+    except OSError:
+        return False
+
+
+def _is_below(path, directories):
+    dirname = os.path.dirname(path)
+    while dirname:
+        if dirname in directories:
+            return True
+        dirname = os.path.dirname(dirname)
+    return False
 
 
 def _validate_relative_paths(files):
@@ -785,33 +1082,42 @@ def _validate_relative_paths(files):
 
 
 def check_for_collisions(parts):
-    """Raises an EnvironmentError if conflicts are found between two parts."""
-    parts_files = {}
-    for part in parts:
-        # Gather our own files up
-        part_files, _ = part.migratable_fileset_for('stage')
-
-        # Scan previous parts for collisions
-        for other_part_name in parts_files:
-            common = part_files & parts_files[other_part_name]['files']
-            conflict_files = []
-            for f in common:
-                this = os.path.join(part.installdir, f)
-                other = os.path.join(
-                    parts_files[other_part_name]['installdir'],
-                    f)
-                if os.path.islink(this) and os.path.islink(other):
-                    continue
-                if not filecmp.cmp(this, other, shallow=False):
-                    conflict_files.append(f)
-
-            if conflict_files:
+    """Raises an EnvironmentError if conflicts are found between two parts.
+
+    Each path is owned by the first part having it, the parts having it
+    after must have the same contents. Only the contents of those shared
+    paths are looked at, using digests kept between runs.
+    """
+    owners = {}
+    try:
+        for part in parts:
+            part_files, _ = part.migratable_fileset_for('stage')
+
+            conflicts = collections.defaultdict(list)
+            for f in part_files:
+                owner = owners.setdefault(f, part)
+                if owner is not part and not _same_contents(owner, part, f):
+                    conflicts[owner.name].append(f)
+
+            if conflicts:
+                other_part_name = next(
+                    p.name for p in parts if p.name in conflicts)
                 raise EnvironmentError(
                     'Parts {!r} and {!r} have the following file paths in '
                     'common which have different contents:\n{}'.format(
                         other_part_name, part.name,
-                        '\n'.join(sorted(conflict_files))))
+                        '\n'.join(sorted(conflicts[other_part_name]))))
+    finally:
+        for part in parts:
+            part.save_installed_digests()
+
 
-        # And add our files to the list
-        parts_files[part.name] = {'files': part_files,
-                                  'installdir': part.installdir}
+def _same_contents(part, other_part, path):
+    this = os.path.join(part.installdir, path)
+    other = os.path.join(other_part.installdir, path)
+    if os.path.islink(this) and os.path.islink(other):
+        return True
+    if os.path.getsize(this) != os.path.getsize(other):
+        return False
+    return (part.get_installed_digest(path) ==
+            other_part.get_installed_digest(path))
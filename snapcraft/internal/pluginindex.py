@@ -0,0 +1,112 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""An index of the bundled plugins and of their documentation.
+
+Showing the help of a plugin used to import it, and with it most of
+snapcraft and its dependencies. The index is generated from the sources of
+the plugins instead, without running them, and kept in the XDG cache until
+a plugin is added, removed or changed.
+"""
+
+import ast
+import json
+import logging
+import os
+
+from xdg import BaseDirectory
+
+import snapcraft
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_plugin_names():
+    """Return the sorted names of the bundled plugin modules."""
+    return sorted(_get_index())
+
+
+def get_plugin_doc(plugin_name):
+    """Return the docstring of plugin_name, or None if it has none.
+
+    :raises KeyError: if there is no such plugin.
+    """
+    return _get_index()[plugin_name]
+
+
+def _get_plugins_dir():
+    return os.path.join(os.path.dirname(snapcraft.__file__), 'plugins')
+
+
+def _get_index_file():
+    return os.path.join(
+        BaseDirectory.xdg_cache_home, 'snapcraft', 'plugins.json')
+
+
+def _get_index():
+    plugins_dir = _get_plugins_dir()
+    sources = _find_plugin_sources(plugins_dir)
+    # Any change to a plugin changes the size or mtime of its source.
+    stamps = {name: [st.st_mtime_ns, st.st_size]
+              for name, (path, st) in sources.items()}
+
+    index_file = _get_index_file()
+    try:
+        with open(index_file) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = {}
+    if (index.get('plugins_dir') == plugins_dir and
+            index.get('stamps') == stamps):
+        return index['docs']
+
+    docs = {name: _read_doc(path) for name, (path, st) in sources.items()}
+    index = {'plugins_dir': plugins_dir, 'stamps': stamps, 'docs': docs}
+    try:
+        os.makedirs(os.path.dirname(index_file), exist_ok=True)
+        temp_file = '{}.{}.tmp'.format(index_file, os.getpid())
+        with open(temp_file, 'w') as f:
+            json.dump(index, f)
+        os.rename(temp_file, index_file)
+    except OSError as e:
+        logger.debug('Cannot save the plugin index: {}'.format(e))
+    return docs
+
+
+def _find_plugin_sources(plugins_dir):
+    # The modules and packages pkgutil.iter_modules would find.
+    sources = {}
+    for entry in os.scandir(plugins_dir):
+        name, ext = os.path.splitext(entry.name)
+        if entry.is_file() and ext == '.py' and name != '__init__':
+            path = entry.path
+        elif entry.is_dir() and '.' not in entry.name:
+            path = os.path.join(entry.path, '__init__.py')
+        else:
+            continue
+        try:
+            sources[name] = (path, os.stat(path))
+        except FileNotFoundError:
+            continue
+    return sources
+
+
+def _read_doc(path):
+    with open(path, 'rb') as f:
+        module = ast.parse(f.read(), path)
+    # Like __doc__, and unlike inspect, keep the docstring as it is written.
+    return ast.get_docstring(module, clean=False)
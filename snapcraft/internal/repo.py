@@ -14,25 +14,27 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import concurrent.futures
+import contextlib
 import fileinput
+import functools
 import glob
+import hashlib
 import itertools
+import json
 import logging
 import os
 import platform
 import re
-import shutil
 import stat
 import string
 import subprocess
-import urllib
-import urllib.request
+import threading
 
-import apt
 from xml.etree import ElementTree
 
 import snapcraft
-from snapcraft.internal import common
+from snapcraft.internal import common, debcache, download
 
 
 _BIN_PATHS = (
@@ -57,6 +59,29 @@ deb http://${security}.ubuntu.com/${suffix} ${release}-security multiverse
 '''
 _GEOIP_SERVER = "http://geoip.ubuntu.com/lookup"
 
+# apt and urllib.request are only imported where they are used, as they
+# take long to import and most commands do not need them.
+
+# The apt indexes used in this run, by their directory, and the lock every
+# use of them takes, as apt keeps its configuration global.
+_apt_indexes = {}
+_apt_lock = threading.RLock()
+
+# Bumped whenever the resolutions saved change.
+_RESOLUTION_VERSION = 1
+
+# The number of packages extracted at the same time, and the version of the
+# manifests of what was extracted, bumped whenever they change.
+_UNPACK_JOBS = 4
+_UNPACK_MANIFEST_VERSION = 1
+
+# Files rewritten for the directory they are unpacked in, along pkg-config
+# files.
+_XML_TOOL_PATHS = (
+    os.path.join('usr', 'bin', 'xml2-config'),
+    os.path.join('usr', 'bin', 'xslt-config'),
+)
+
 
 def is_package_installed(package):
     """Return True if a package is installed on the system.
@@ -64,11 +89,13 @@ def is_package_installed(package):
     :param str package: the deb package to query for.
     :returns: True if the package is installed, False if not.
     """
+    import apt
     with apt.Cache() as apt_cache:
         return apt_cache[package].installed
 
 
 def install_build_packages(packages):
+    import apt
     unique_packages = set(packages)
     new_packages = []
     with apt.Cache() as apt_cache:
@@ -125,42 +152,102 @@ class Ubuntu:
 
         if not project_options:
             project_options = snapcraft.ProjectOptions()
-        self.apt_cache, self.apt_progress = _setup_apt_cache(
-            rootdir, sources, project_options)
+        self._deb_arch = project_options.deb_arch
+        self._index = _get_apt_index(sources, project_options)
+        self._deb_cache = debcache.get_cache()
 
     def get(self, package_names):
+        # Parts with the same sources share the apt cache.
+        with _apt_lock:
+            self._get(package_names)
+
+    def _get(self, package_names):
         # Create the 'partial' subdir too (LP: #1578007).
         os.makedirs(os.path.join(self.downloaddir, 'partial'), exist_ok=True)
 
-        manifest_dep_names = self._manifest_dep_names()
+        # Updating is cheap when the indexes did not change, and the saved
+        # resolutions are only found again for the indexes they were made
+        # with.
+        self._index.get_cache(update=True)
+        packages = self._index.load_resolution(package_names, self._deb_arch)
+        if packages is None:
+            packages = self._resolve(package_names)
+            self._index.save_resolution(
+                package_names, self._deb_arch, packages)
+            missing = self._restore_cached(packages)
+        else:
+            missing = self._restore_cached(packages)
+            if missing and not self._mark_resolved(missing):
+                # The indexes changed since the packages were resolved.
+                packages = self._resolve(package_names)
+                self._index.save_resolution(
+                    package_names, self._deb_arch, packages)
+                missing = self._restore_cached(packages)
+
+        if missing:
+            # download the remaining ones with proper progress
+            import apt
+            apt_cache, apt_progress = self._index.get_cache()
+            apt.apt_pkg.config.set("Dir::Cache::Archives", self.downloaddir)
+            apt_cache.fetch_archives(progress=apt_progress)
+            self._save_cached(missing)
+
+    def _restore_cached(self, packages):
+        """Link the packages not downloaded yet from the deb cache.
+
+        :returns: the packages still to download.
+        """
+        missing = []
+        for package in packages:
+            path = os.path.join(self.downloaddir, package['filename'])
+            if os.path.exists(path):
+                continue
+            if (not self._deb_cache or not package['sha256'] or
+                    not self._deb_cache.restore(package['sha256'], path)):
+                missing.append(package)
+        return missing
+
+    def _save_cached(self, packages):
+        if not self._deb_cache:
+            return
+        for package in packages:
+            path = os.path.join(self.downloaddir, package['filename'])
+            if package['sha256'] and os.path.exists(path):
+                self._deb_cache.save(package['sha256'], path)
+        self._deb_cache.trim()
+
+    def _resolve(self, package_names):
+        """Mark package_names and their dependencies, and describe them."""
+        apt_cache, apt_progress = self._index.get_cache(update=True)
+        # Forget the packages marked for the previous part.
+        apt_cache.clear()
 
         for name in package_names:
             try:
-                self.apt_cache[name].mark_install()
+                apt_cache[name].mark_install()
             except KeyError:
                 raise PackageNotFoundError(name)
 
         skipped_essential = []
         skipped_blacklisted = []
+        essential_names, manifest_dep_names = self._index.get_kept_names()
 
         # unmark some base packages here
         # note that this will break the consistency check inside apt_cache
-        # (self.apt_cache.broken_count will be > 0)
+        # (apt_cache.broken_count will be > 0)
         # but that is ok as it was consistent before we excluded
         # these base package
-        for pkg in self.apt_cache:
+        for pkg in apt_cache.get_changes():
+            if pkg.name in package_names:
+                continue
             # those should be already on each system, it also prevents
             # diving into downloading libc6
-            if (pkg.candidate.priority in 'essential' and
-               pkg.name not in package_names):
+            if pkg.name in essential_names:
                 skipped_essential.append(pkg.name)
                 pkg.mark_keep()
-                continue
-            if (pkg.name in manifest_dep_names and
-                    pkg.name not in package_names):
+            elif pkg.name in manifest_dep_names:
                 skipped_blacklisted.append(pkg.name)
                 pkg.mark_keep()
-                continue
 
         if skipped_essential:
             print('Skipping priority essential packages:', skipped_essential)
@@ -168,34 +255,205 @@ class Ubuntu:
             print('Skipping blacklisted from manifest packages:',
                   skipped_blacklisted)
 
-        # download the remaining ones with proper progress
-        apt.apt_pkg.config.set("Dir::Cache::Archives", self.downloaddir)
-        self.apt_cache.fetch_archives(progress=self.apt_progress)
+        return [_describe_package(pkg) for pkg in apt_cache.get_changes()
+                if pkg.marked_install]
 
-    def unpack(self, rootdir):
-        pkgs_abs_path = glob.glob(os.path.join(self.downloaddir, '*.deb'))
-        for pkg in pkgs_abs_path:
-            # TODO needs elegance and error control
+    def _mark_resolved(self, packages):
+        """Mark packages as resolved before, without resolving them again.
+
+        :returns: False if the apt cache does not have their versions.
+        """
+        apt_cache, apt_progress = self._index.get_cache()
+        apt_cache.clear()
+        for package in packages:
             try:
-                subprocess.check_call(['dpkg-deb', '--extract', pkg, rootdir])
-            except subprocess.CalledProcessError:
-                raise UnpackError(pkg)
+                pkg = apt_cache[package['name']]
+            except KeyError:
+                return False
+            if (not pkg.candidate or
+                    pkg.candidate.version != package['version']):
+                return False
+            pkg.mark_install(auto_fix=False, auto_inst=False)
+        return True
 
-        _fix_artifacts(rootdir)
-        _fix_xml_tools(rootdir)
+    def unpack(self, rootdir):
+        """Extract the downloaded packages into rootdir.
+
+        Packages extracted by a previous call, whose files are all still
+        there, are not extracted again.
+        """
+        manifest_path = self._get_unpack_manifest_path(rootdir)
+        manifest = _load_unpack_manifest(manifest_path)
+
+        debs = {}
+        to_extract = []
+        for pkg in sorted(glob.glob(os.path.join(self.downloaddir, '*.deb'))):
+            st = os.stat(pkg)
+            entry = {'stamp': [st.st_size, st.st_mtime_ns], 'paths': []}
+            name = os.path.basename(pkg)
+            unpacked = manifest.get(name)
+            if (unpacked and unpacked['stamp'] == entry['stamp'] and
+                    all(os.path.lexists(os.path.join(rootdir, path))
+                        for path in unpacked['paths'])):
+                debs[name] = unpacked
+            else:
+                debs[name] = entry
+                to_extract.append(pkg)
+        if not to_extract:
+            logger.debug('Stage packages are already unpacked in {!r}'.format(
+                rootdir))
+            return
+
+        # dpkg-deb and the file system do the work, the threads only wait
+        # on them.
+        with concurrent.futures.ThreadPoolExecutor(_UNPACK_JOBS) as executor:
+            results = executor.map(
+                functools.partial(self._unpack_deb, rootdir=rootdir),
+                to_extract)
+            for pkg, paths in zip(to_extract, results):
+                debs[os.path.basename(pkg)]['paths'] = paths
+
+        # Only the files just extracted are fixed, those extracted before
+        # already are and fixing some of them twice would break them.
+        extracted = set(itertools.chain.from_iterable(
+            debs[os.path.basename(pkg)]['paths'] for pkg in to_extract))
+        _fix_artifacts(rootdir, paths=sorted(extracted))
+        _fix_xml_tools(rootdir, paths=extracted)
         _fix_shebangs(rootdir)
 
-    def _manifest_dep_names(self):
-        manifest_dep_names = set()
+        _save_unpack_manifest(manifest_path, debs)
+        if self._deb_cache:
+            self._deb_cache.trim()
+
+    def _unpack_deb(self, pkg, rootdir):
+        """Unpack pkg into rootdir, returning the paths of what it holds.
+
+        The tree pkg extracts to is kept in the deb cache, and copied into
+        rootdir.
+        """
+        if not self._deb_cache:
+            return _extract_deb(pkg, rootdir)
+
+        sha256 = download.get_digests(pkg, ['sha256'])['sha256']
+        try:
+            tree_dir, paths = self._deb_cache.get_tree(
+                sha256, functools.partial(_extract_tree, pkg))
+            _copy_tree(tree_dir, paths, rootdir)
+        except FileNotFoundError:
+            # The tree was removed from the cache while in use.
+            return _extract_deb(pkg, rootdir)
+        return paths
+
+    def _get_unpack_manifest_path(self, rootdir):
+        # Packages can be unpacked in more than one directory.
+        rootdir_hash = hashlib.sha256(
+            os.path.abspath(rootdir).encode()).hexdigest()[:16]
+        return os.path.join(
+            self.rootdir, 'unpacked-{}.json'.format(rootdir_hash))
+
+
+def _extract_deb(pkg, rootdir):
+    """Extract pkg into rootdir, returning the paths of what it holds."""
+    try:
+        output = subprocess.check_output(
+            ['dpkg-deb', '--vextract', pkg, rootdir])
+    except subprocess.CalledProcessError:
+        raise UnpackError(pkg)
+    # Paths are listed like ./usr/bin/, relative to rootdir.
+    paths = []
+    for line in output.decode(errors='surrogateescape').splitlines():
+        path = os.path.normpath(line)
+        if path != '.':
+            paths.append(path)
+    return paths
+
+
+def _extract_tree(pkg, tree_dir):
+    """Extract pkg into tree_dir, fixing what does not depend on where it
+    is unpacked in the end."""
+    paths = _extract_deb(pkg, tree_dir)
+    for path in paths:
+        path = os.path.join(tree_dir, path)
+        if not os.path.islink(path):
+            _fix_filemode(path)
+    _fix_shebangs(tree_dir)
+    return paths
+
+
+def _copy_tree(tree_dir, paths, rootdir):
+    """Recreate the tree in tree_dir in rootdir.
+
+    Files are cloned where the file system supports it, and copied
+    otherwise, but never hard-linked: fixups and plugins change files of
+    rootdir in place, which must leave the tree alone.
+    """
+    dirs = []
+    for path in paths:
+        source = os.path.join(tree_dir, path)
+        destination = os.path.join(rootdir, path)
+        st = os.lstat(source)
+        if stat.S_ISDIR(st.st_mode):
+            os.makedirs(destination, exist_ok=True)
+            if not os.path.islink(destination):
+                dirs.append((destination, stat.S_IMODE(st.st_mode)))
+        elif stat.S_ISLNK(st.st_mode):
+            _replace(destination, os.symlink, os.readlink(source))
+        else:
+            _replace(destination, common.clone_or_copy, source)
+
+    # Like tar, set the modes of directories once their contents are in.
+    for path, mode in reversed(dirs):
+        os.chmod(path, mode)
+
 
-        with open(os.path.abspath(os.path.join(__file__, '..',
-                                               'manifest.txt'))) as f:
-            for line in f:
-                pkg = line.strip()
-                if pkg in self.apt_cache:
-                    manifest_dep_names.add(pkg)
+def _replace(destination, create, source):
+    # Packages unpacked at the same time can hold the same file.
+    for attempt in range(2):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(destination)
+        try:
+            create(source, destination)
+            return
+        except FileExistsError:
+            if attempt:
+                raise
 
-        return manifest_dep_names
+
+def _load_unpack_manifest(path):
+    try:
+        with open(path) as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if manifest.get('version') != _UNPACK_MANIFEST_VERSION:
+        return {}
+    return manifest.get('debs', {})
+
+
+def _save_unpack_manifest(path, debs):
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_file = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp_file, 'w') as f:
+            json.dump({'version': _UNPACK_MANIFEST_VERSION, 'debs': debs}, f)
+        os.rename(temp_file, path)
+    except OSError as e:
+        logger.debug('Cannot save the unpack manifest: {}'.format(e))
+
+
+def _describe_package(pkg):
+    candidate = pkg.candidate
+    # The name apt gives the archive in Dir::Cache::Archives.
+    filename = '{}_{}_{}.deb'.format(
+        pkg.shortname, candidate.version.replace(':', '%3a'),
+        candidate.architecture)
+    return {
+        'name': pkg.name,
+        'version': candidate.version,
+        'filename': filename,
+        'sha256': candidate.sha256,
+        'uri': candidate.uri,
+    }
 
 
 def _get_local_sources_list():
@@ -210,7 +468,9 @@ def _get_local_sources_list():
     return sources
 
 
+@functools.lru_cache()
 def _get_geoip_country_code_prefix():
+    import urllib.request
     try:
         with urllib.request.urlopen(_GEOIP_SERVER) as f:
             xml_data = f.read()
@@ -249,16 +509,118 @@ def _format_sources_list(sources, project_options, release='xenial'):
     })
 
 
-def _setup_apt_cache(rootdir, sources, project_options):
-    os.makedirs(os.path.join(rootdir, 'etc', 'apt'), exist_ok=True)
-    srcfile = os.path.join(rootdir, 'etc', 'apt', 'sources.list')
-
+def _get_sources_list(sources, project_options):
     if project_options.use_geoip or sources:
         release = platform.linux_distribution()[2]
-        sources = _format_sources_list(
-            sources, project_options, release)
-    else:
-        sources = _get_local_sources_list()
+        return _format_sources_list(sources, project_options, release)
+    return _get_local_sources_list()
+
+
+def _get_apt_index(sources, project_options):
+    """Return the _AptIndex of sources, shared by all parts."""
+    sources = _get_sources_list(sources, project_options)
+    rootdir = os.path.join(
+        project_options.parts_dir, '.ubuntu',
+        hashlib.sha256(sources.encode()).hexdigest()[:16])
+    with _apt_lock:
+        if rootdir not in _apt_indexes:
+            _apt_indexes[rootdir] = _AptIndex(rootdir, sources)
+        return _apt_indexes[rootdir]
+
+
+class _AptIndex:
+    """The package indexes of a sources list, kept in rootdir.
+
+    The indexes are updated once per run, before packages are first
+    looked for. The packages resolved for a list of packages are saved
+    along with the indexes, and are not resolved again as long as the
+    indexes stay the same.
+    """
+
+    def __init__(self, rootdir, sources):
+        self.rootdir = rootdir
+        self.sources = sources
+        self._cache = None
+        self._progress = None
+        self._updated = False
+        self._kept_names = None
+
+    def get_cache(self, update=False):
+        """Return the apt cache and its progress.
+
+        :param bool update: update the indexes first, unless they were
+                            already updated in this run.
+        """
+        if self._cache is None:
+            self._cache, self._progress = _setup_apt_cache(
+                self.rootdir, self.sources)
+        if update and not self._updated:
+            _update_apt_cache(self.rootdir, self._cache, self._progress)
+            self._updated = True
+            self._kept_names = None
+        return self._cache, self._progress
+
+    def get_kept_names(self):
+        """Return the names of the essential and of the manifest packages.
+
+        Those are on every system, they are only staged when asked for.
+        """
+        if self._kept_names is None:
+            apt_cache, _ = self.get_cache()
+            essential_names = {
+                pkg.name for pkg in apt_cache
+                if pkg.candidate and pkg.candidate.priority in 'essential'}
+            with open(os.path.abspath(os.path.join(
+                    __file__, '..', 'manifest.txt'))) as f:
+                manifest_dep_names = {
+                    line.strip() for line in f if line.strip() in apt_cache}
+            self._kept_names = (essential_names, manifest_dep_names)
+        return self._kept_names
+
+    def load_resolution(self, package_names, deb_arch):
+        """Return the packages resolved for package_names, or None."""
+        path = self._get_resolution_path(package_names, deb_arch)
+        if not path:
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def save_resolution(self, package_names, deb_arch, packages):
+        """Save the packages resolved for package_names."""
+        path = self._get_resolution_path(package_names, deb_arch)
+        if not path:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_file = '{}.{}.tmp'.format(path, os.getpid())
+        with open(temp_file, 'w') as f:
+            json.dump(packages, f)
+        os.rename(temp_file, path)
+
+    def _get_resolution_path(self, package_names, deb_arch):
+        # The Release files hold the digests of every index, a resolution
+        # is only valid for the indexes it was made with.
+        release_files = sorted(glob.glob(os.path.join(
+            self.rootdir, 'var', 'lib', 'apt', 'lists', '*Release')))
+        if not release_files:
+            return None
+        digest = hashlib.sha256(json.dumps([
+            _RESOLUTION_VERSION, sorted(package_names), deb_arch,
+            self.sources]).encode())
+        for path in release_files:
+            digest.update(b'\0' + os.fsencode(os.path.basename(path)))
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        return os.path.join(
+            self.rootdir, 'resolutions', digest.hexdigest() + '.json')
+
+
+def _setup_apt_cache(rootdir, sources):
+    import apt
+    os.makedirs(os.path.join(rootdir, 'etc', 'apt'), exist_ok=True)
+    srcfile = os.path.join(rootdir, 'etc', 'apt', 'sources.list')
 
     with open(srcfile, 'w') as f:
         f.write(sources)
@@ -278,12 +640,16 @@ def _setup_apt_cache(rootdir, sources, project_options):
         progress._width = 0
 
     apt_cache = apt.Cache(rootdir=rootdir, memonly=True)
+    return apt_cache, progress
+
+
+def _update_apt_cache(rootdir, apt_cache, progress):
+    import apt
+    srcfile = os.path.join(rootdir, 'etc', 'apt', 'sources.list')
     apt.apt_pkg.config.clear("APT::Update::Post-Invoke-Success")
     apt_cache.update(fetch_progress=progress, sources_list=srcfile)
     apt_cache.open()
 
-    return apt_cache, progress
-
 
 def fix_pkg_config(root, pkg_config_file, prefix_trim=None):
     """Opens a pkg_config_file and prefixes the prefix with root."""
@@ -306,7 +672,7 @@ def fix_pkg_config(root, pkg_config_file, prefix_trim=None):
                 print(line, end='')
 
 
-def _fix_artifacts(debdir):
+def _fix_artifacts(debdir, paths=None):
     '''
     Sometimes debs will contain absolute symlinks (e.g. if the relative
     path would go all the way to root, they just do absolute).  We can't
@@ -314,33 +680,42 @@ def _fix_artifacts(debdir):
 
     Some unpacked items will also contain suid binaries which we do not want in
     the resulting snap.
+
+    Only the paths given, relative to debdir, are fixed if there are some.
     '''
+    if paths is None:
+        paths = _walk(debdir)
+    else:
+        paths = (os.path.join(debdir, path) for path in paths)
+
+    for path in paths:
+        root = os.path.dirname(path)
+        if os.path.islink(path) and os.path.isabs(os.readlink(path)):
+            _fix_symlink(path, debdir, root)
+        elif os.path.exists(path):
+            _fix_filemode(path)
+
+        if path.endswith('.pc') and not os.path.islink(path):
+            fix_pkg_config(debdir, path)
+
+
+def _walk(debdir):
     for root, dirs, files in os.walk(debdir):
         # Symlinks to directories will be in dirs, while symlinks to
         # non-directories will be in files.
         for entry in itertools.chain(files, dirs):
-            path = os.path.join(root, entry)
-            if os.path.islink(path) and os.path.isabs(os.readlink(path)):
-                _fix_symlink(path, debdir, root)
-            elif os.path.exists(path):
-                _fix_filemode(path)
-
-            if path.endswith('.pc') and not os.path.islink(path):
-                fix_pkg_config(debdir, path)
-
+            yield os.path.join(root, entry)
 
-def _fix_xml_tools(root):
-    xml2_config_path = os.path.join(root, 'usr', 'bin', 'xml2-config')
-    if os.path.isfile(xml2_config_path):
-        common.run(
-            ['sed', '-i', '-e', 's|prefix=/usr|prefix={}/usr|'.
-                format(root), xml2_config_path])
 
-    xslt_config_path = os.path.join(root, 'usr', 'bin', 'xslt-config')
-    if os.path.isfile(xslt_config_path):
-        common.run(
-            ['sed', '-i', '-e', 's|prefix=/usr|prefix={}/usr|'.
-                format(root), xslt_config_path])
+def _fix_xml_tools(root, paths=None):
+    for tool_path in _XML_TOOL_PATHS:
+        if paths is not None and tool_path not in paths:
+            continue
+        tool_path = os.path.join(root, tool_path)
+        if os.path.isfile(tool_path):
+            common.run(
+                ['sed', '-i', '-e', 's|prefix=/usr|prefix={}/usr|'.
+                    format(root), tool_path])
 
 
 def _fix_symlink(path, debdir, root):
@@ -388,7 +763,8 @@ def _try_copy_local(path, target):
         logger.warning(
             'Copying needed target link from the system {}'.format(real_path))
         os.makedirs(os.path.dirname(target), exist_ok=True)
-        shutil.copyfile(os.readlink(path), target)
+        # Never hard-linked, fixing up the copy must leave the system alone.
+        common.clone_or_copy(real_path, target)
         return True
     else:
         logger.warning(
@@ -0,0 +1,237 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Run the lifecycle steps of independent parts concurrently.
+
+The scheduler works on a graph of tasks, each one being a single step of a
+single part. A task only starts once all of its prerequisites have
+completed, and at most `jobs` tasks run at the same time.
+
+Everything a task logs or prints (including the output of commands started
+through common.run) is held back and replayed as one block once the task is
+done. Blocks are replayed in the order the tasks were given, so the output
+is the same from one run to the next regardless of which task finished
+first.
+"""
+
+import concurrent.futures
+import contextlib
+import logging
+import sys
+import tempfile
+
+from snapcraft.internal import common
+
+
+logger = logging.getLogger(__name__)
+
+
+class Task:
+
+    @property
+    def name(self):
+        return '{}:{}'.format(self.part.name, self.step)
+
+    def __init__(self, part, step):
+        self.part = part
+        self.step = step
+        self.prerequisites = set()
+
+    def __repr__(self):
+        return 'Task({!r})'.format(self.name)
+
+
+class _TaskOutput:
+    """Collects what a task logs and prints, in the order it happened."""
+
+    def __init__(self):
+        # Subprocesses need a real file to write to.
+        self._file = tempfile.TemporaryFile()
+        self._offset = 0
+        self.entries = []
+        self.closed = False
+
+    def fileno(self):
+        return self._file.fileno()
+
+    def write(self, text):
+        self._collect_subprocess_output()
+        self.entries.append(text)
+
+    def add_record(self, record):
+        self._collect_subprocess_output()
+        # The same record is handed to every handler, only keep it once.
+        if not self.entries or self.entries[-1] is not record:
+            self.entries.append(record)
+
+    def close(self):
+        self._collect_subprocess_output()
+        self._file.close()
+        self.closed = True
+
+    def _collect_subprocess_output(self):
+        self._file.seek(self._offset)
+        data = self._file.read()
+        self._file.seek(0, 2)
+        if data:
+            self._offset += len(data)
+            self.entries.append(data.decode('utf-8', 'replace'))
+
+
+class _CaptureFilter(logging.Filter):
+
+    def filter(self, record):
+        output = common.get_thread_output()
+        if output is None:
+            return True
+
+        output.add_record(record)
+        return False
+
+
+class _ThreadedStream:
+    """Route writes from worker threads to the output of their task."""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def write(self, text):
+        output = common.get_thread_output()
+        if output is None:
+            return self._stream.write(text)
+
+        output.write(text)
+        return len(text)
+
+    def flush(self):
+        if common.get_thread_output() is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+class Scheduler:
+
+    def __init__(self, jobs):
+        self._jobs = max(jobs, 1)
+
+    def run(self, tasks, function):
+        """Run function(task) for every task, honouring prerequisites.
+
+        :param list tasks: the tasks to run, in the order their output should
+                           be shown. Prerequisites must be in the list too.
+        :param function: the callable doing the actual work for a task.
+        :raises: the first exception raised by a task, once all the tasks
+                 that were already running have finished.
+        """
+        with _capture_output():
+            self._run(tasks, function)
+
+    def _run(self, tasks, function):
+        self._pending = list(tasks)
+        self._outputs = {}
+        self._done = set()
+        self._failures = []
+        self._running = {}
+        flushed = 0
+
+        with concurrent.futures.ThreadPoolExecutor(self._jobs) as executor:
+            while self._pending or self._running:
+                if not self._failures:
+                    self._submit_ready_tasks(executor, function)
+                elif not self._running:
+                    break
+
+                self._wait_for_tasks()
+                flushed = _flush(tasks, self._outputs, flushed)
+
+        # After a failure not every task got to run, replay what did.
+        for task in tasks[flushed:]:
+            if task in self._outputs:
+                _replay(self._outputs[task])
+
+        if self._failures:
+            raise self._failures[0]
+
+    def _submit_ready_tasks(self, executor, function):
+        for task in [t for t in self._pending
+                     if t.prerequisites.issubset(self._done)]:
+            self._pending.remove(task)
+            self._outputs[task] = _TaskOutput()
+            future = executor.submit(
+                _run_task, function, task, self._outputs[task])
+            self._running[future] = task
+
+        if not self._running:
+            raise RuntimeError(
+                'Cannot schedule {}: unsatisfiable prerequisites'.format(
+                    ', '.join(t.name for t in self._pending)))
+
+    def _wait_for_tasks(self):
+        finished, _ = concurrent.futures.wait(
+            self._running, return_when=concurrent.futures.FIRST_COMPLETED)
+        for future in finished:
+            task = self._running.pop(future)
+            self._outputs[task].close()
+            if future.exception():
+                self._failures.append(future.exception())
+            else:
+                self._done.add(task)
+
+
+def _run_task(function, task, output):
+    with common.thread_context([], output):
+        function(task)
+
+
+def _flush(tasks, outputs, flushed):
+    """Replay the output of the completed tasks at the head of the list."""
+    while flushed < len(tasks):
+        output = outputs.get(tasks[flushed])
+        if not output or not output.closed:
+            break
+        _replay(output)
+        flushed += 1
+
+    return flushed
+
+
+def _replay(output):
+    for entry in output.entries:
+        if isinstance(entry, logging.LogRecord):
+            logging.getLogger(entry.name).handle(entry)
+        else:
+            sys.stdout.write(entry)
+    output.entries = []
+    sys.stdout.flush()
+
+
+@contextlib.contextmanager
+def _capture_output():
+    capture_filter = _CaptureFilter()
+    handlers = list(logging.getLogger().handlers)
+    for handler in handlers:
+        handler.addFilter(capture_filter)
+    stdout = sys.stdout
+    sys.stdout = _ThreadedStream(stdout)
+
+    try:
+        yield
+    finally:
+        sys.stdout = stdout
+        for handler in handlers:
+            handler.removeFilter(capture_filter)
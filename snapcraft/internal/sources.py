@@ -62,7 +62,6 @@ cases you want to refer to the help text for the specific plugin.
 import logging
 import os
 import os.path
-import requests
 import shutil
 import tarfile
 import re
@@ -71,8 +70,7 @@ import tempfile
 import zipfile
 import glob
 
-from snapcraft.internal import common
-from snapcraft.internal.indicators import download_requests_stream
+from snapcraft.internal import common, fingerprint, sync
 
 
 logging.getLogger('urllib3').setLevel(logging.CRITICAL)
@@ -93,6 +91,14 @@ class Base:
         self.source_tag = source_tag
         self.source_branch = source_branch
 
+    def fingerprint(self, index_file):
+        """Return a digest of the source as it is now, or None.
+
+        Only sources that can change without snapcraft being told about it
+        return a digest.
+        """
+        return None
+
 
 class FileBase(Base):
 
@@ -105,12 +111,12 @@ class FileBase(Base):
         self.provision(self.source_dir)
 
     def download(self):
-        request = requests.get(self.source, stream=True, allow_redirects=True)
-        request.raise_for_status()
+        # Downloading needs requests, which takes long to import.
+        from snapcraft.internal import download
 
         file_path = os.path.join(
             self.source_dir, os.path.basename(self.source))
-        download_requests_stream(request, file_path)
+        download.download(self.source, file_path)
 
 
 class Bazaar(Base):
@@ -326,26 +332,39 @@ class Zip(FileBase):
 class Local(Base):
 
     def pull(self):
+        """Make the source dir a hard link farm of the local source.
+
+        Pulling again only updates what changed in the local source since
+        the last pull, using modification times.
+        """
         if os.path.islink(self.source_dir) or os.path.isfile(self.source_dir):
             os.remove(self.source_dir)
-        elif os.path.isdir(self.source_dir):
-            shutil.rmtree(self.source_dir)
 
         source_abspath = os.path.abspath(self.source)
 
         def ignore(directory, files):
             if directory is source_abspath:
-                snaps = glob.glob(os.path.join(directory, '*.snap'))
-                if snaps:
-                    snaps = [os.path.basename(s) for s in snaps]
-                    return common.SNAPCRAFT_FILES + snaps
-                else:
-                    return common.SNAPCRAFT_FILES
+                return _get_local_ignores(directory)
             else:
                 return []
 
-        shutil.copytree(source_abspath, self.source_dir,
-                        copy_function=common.link_or_copy, ignore=ignore)
+        sync.sync_tree(source_abspath, self.source_dir, ignore=ignore,
+                       copy_function=common.link_or_copy)
+
+    def fingerprint(self, index_file):
+        source_abspath = os.path.abspath(self.source)
+        return fingerprint.fingerprint_tree(
+            source_abspath, index_file,
+            ignore=_get_local_ignores(source_abspath))
+
+
+def _get_local_ignores(directory):
+    snaps = glob.glob(os.path.join(directory, '*.snap'))
+    if snaps:
+        snaps = [os.path.basename(s) for s in snaps]
+        return common.SNAPCRAFT_FILES + snaps
+    else:
+        return common.SNAPCRAFT_FILES
 
 
 def get(sourcedir, builddir, options):
@@ -365,6 +384,29 @@ def get(sourcedir, builddir, options):
     handler.pull()
 
 
+def get_fingerprint(sourcedir, options, index_file):
+    """Return a digest of the source defined in options, or None.
+
+    :param str sourcedir: The source directory to use.
+    :param options: source options.
+    :param str index_file: where to keep the file digests used to compute
+                           the fingerprint from one call to the next.
+    """
+    source = getattr(options, 'source', None)
+    if not source:
+        return None
+
+    source_type = getattr(options, 'source_type', None)
+    if not source_type:
+        source_type = _get_source_type_from_uri(source, ignore_errors=True)
+    handler_class = _source_handler.get(source_type, Local)
+    if handler_class is Local and not os.path.isdir(source):
+        return None
+
+    handler = handler_class(source, sourcedir)
+    return handler.fingerprint(index_file)
+
+
 def get_required_packages(options):
     """Return a list with required packages to handle the source.
 
@@ -18,3 +18,4 @@ from snapcraft.internal.states._prime_state import PrimeState  # noqa
 from snapcraft.internal.states._stage_state import StageState  # noqa
 from snapcraft.internal.states._build_state import BuildState  # noqa
 from snapcraft.internal.states._pull_state import PullState    # noqa
+from snapcraft.internal.states._store import close_stores, get_store  # noqa
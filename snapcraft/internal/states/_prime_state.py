@@ -16,7 +16,7 @@
 
 import yaml
 
-from snapcraft.internal.states._state import State
+from snapcraft.internal.states._state import PathSet, State
 
 
 def _prime_state_constructor(loader, node):
@@ -29,6 +29,10 @@ yaml.add_constructor(u'!PrimeState', _prime_state_constructor)
 class PrimeState(State):
     yaml_tag = u'!PrimeState'
 
+    files = PathSet('files')
+    directories = PathSet('directories')
+    dependency_paths = PathSet('dependency_paths')
+
     def __init__(self, files, directories, dependency_paths=None,
                  options=None, project=None):
         super().__init__(options, project)
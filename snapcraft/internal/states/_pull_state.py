@@ -29,9 +29,11 @@ yaml.add_constructor(u'!PullState', _pull_state_constructor)
 class PullState(State):
     yaml_tag = u'!PullState'
 
-    def __init__(self, schema_properties, options=None, project=None):
+    def __init__(self, schema_properties, options=None, project=None,
+                 source_fingerprint=None):
         # Save this off before calling super() since we'll need it
         self.schema_properties = schema_properties
+        self.source_fingerprint = source_fingerprint
 
         super().__init__(options, project)
 
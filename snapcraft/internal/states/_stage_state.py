@@ -16,7 +16,7 @@
 
 import yaml
 
-from snapcraft.internal.states._state import State
+from snapcraft.internal.states._state import PathSet, State
 
 
 def _stage_state_constructor(loader, node):
@@ -29,6 +29,9 @@ yaml.add_constructor(u'!StageState', _stage_state_constructor)
 class StageState(State):
     yaml_tag = u'!StageState'
 
+    files = PathSet('files')
+    directories = PathSet('directories')
+
     def __init__(self, files, directories, options=None, project=None):
         super().__init__(options, project)
 
@@ -17,11 +17,45 @@
 import yaml
 
 
+class PathSet:
+    """A set of paths, which states loaded from the store decode on first use.
+    """
+
+    def __init__(self, name):
+        # Given explicitly, as __set_name__ is only called from Python 3.6.
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+
+        instance._load_path_sets()
+        try:
+            return instance.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(self.name)
+
+
+def get_path_set_names(state_class):
+    """Return the names of the PathSet attributes of state_class."""
+    return [name for cls in state_class.__mro__
+            for name, value in vars(cls).items() if isinstance(value, PathSet)]
+
+
 class State(yaml.YAMLObject):
     def __init__(self, options, project):
         self.properties = self.properties_of_interest(options)
         self.project_options = self.project_options_of_interest(project)
 
+    def _load_path_sets(self):
+        loader = self.__dict__.pop('_path_set_loader', None)
+        if loader:
+            self.__dict__.update(loader())
+
+    def __getstate__(self):
+        self._load_path_sets()
+        return self.__dict__.copy()
+
     def properties_of_interest(self, options):
         """Extract the properties concerning this step from the options.
 
@@ -36,6 +70,7 @@ class State(yaml.YAMLObject):
         raise NotImplementedError
 
     def __repr__(self):
+        self._load_path_sets()
         items = sorted(self.__dict__.items())
         strings = (': '.join((key, repr(value))) for key, value in items)
         representation = ', '.join(strings)
@@ -44,6 +79,8 @@ class State(yaml.YAMLObject):
 
     def __eq__(self, other):
         if type(other) is type(self):
+            self._load_path_sets()
+            other._load_path_sets()
             return self.__dict__ == other.__dict__
 
         return False
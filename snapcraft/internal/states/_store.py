@@ -0,0 +1,247 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""The states of every step of every part of a project, in one database.
+
+The sets of files and directories staged or primed by a part make most of
+its states, so they are kept apart from the other attributes: sorted, with
+the prefix each path shares with the previous one left out, and compressed.
+They are only decoded when a state's PathSet attributes are first used, so
+finding out which steps ran, or what options a step ran with, stays cheap
+however many files a part has.
+"""
+
+import contextlib
+import os
+import sqlite3
+import threading
+import zlib
+
+import yaml
+
+from snapcraft.internal import common
+from snapcraft.internal.states._state import State, get_path_set_names
+
+
+_DATABASE_NAME = '.state.db'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS steps (
+    part TEXT NOT NULL,
+    step INTEGER NOT NULL,
+    kind TEXT NOT NULL,
+    state TEXT NOT NULL,
+    PRIMARY KEY (part, step)
+);
+CREATE TABLE IF NOT EXISTS path_sets (
+    part TEXT NOT NULL,
+    step INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    paths BLOB NOT NULL,
+    PRIMARY KEY (part, step, name)
+);
+'''
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(parts_dir):
+    """Return the StateStore of the project whose parts are in parts_dir."""
+    path = os.path.join(os.path.abspath(parts_dir), _DATABASE_NAME)
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = StateStore(path)
+        return _stores[path]
+
+
+def close_stores():
+    """Close the databases of every store, they are opened again if used."""
+    with _stores_lock:
+        for store in _stores.values():
+            store.close()
+        _stores.clear()
+
+
+class StateStore:
+    """Steps run by the parts of a project, along with their states."""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._connection = None
+        self._file_id = None
+
+    def close(self):
+        with self._lock:
+            if self._connection:
+                self._connection.close()
+                self._connection = None
+
+    def get_last_step(self, part_name):
+        """Return the last step part_name ran, or None."""
+        with self._connect(create=False) as connection:
+            if not connection:
+                return None
+            row = connection.execute(
+                'SELECT MAX(step) FROM steps WHERE part = ?',
+                (part_name,)).fetchone()
+
+        if row[0] is None:
+            return None
+        return common.COMMAND_ORDER[row[0]]
+
+    def get_state(self, part_name, step):
+        """Return the state part_name saved when running step, or None."""
+        index = common.COMMAND_ORDER.index(step)
+        with self._connect(create=False) as connection:
+            if not connection:
+                return None
+            row = connection.execute(
+                'SELECT kind, state FROM steps WHERE part = ? AND step = ?',
+                (part_name, index)).fetchone()
+            if not row:
+                return None
+            path_sets = connection.execute(
+                'SELECT name, paths FROM path_sets '
+                'WHERE part = ? AND step = ?', (part_name, index)).fetchall()
+
+        kind, state = row
+        state = yaml.load(state)
+        if kind:
+            # States are saved without their PathSet attributes, which their
+            # initializers require, so set their attributes directly.
+            state_class = _get_state_classes()[kind]
+            attributes = state
+            state = state_class.__new__(state_class)
+            state.__dict__.update(attributes)
+        if path_sets:
+            # Keep the compressed paths around and decode them when needed.
+            state.__dict__['_path_set_loader'] = lambda: {
+                name: _decode_paths(paths) for name, paths in path_sets}
+        return state
+
+    def set_state(self, part_name, step, state, clear_later_steps=True):
+        """Record that part_name ran step, saving state.
+
+        :param bool clear_later_steps: also forget the steps after step,
+                                       as they need to run again.
+        """
+        index = common.COMMAND_ORDER.index(step)
+        kind = ''
+        path_sets = {}
+        if isinstance(state, State):
+            kind = state.yaml_tag
+            state = state.__getstate__()
+            for name in get_path_set_names(_get_state_classes()[kind]):
+                path_sets[name] = _encode_paths(state.pop(name))
+
+        with self._connect(create=True) as connection:
+            if clear_later_steps:
+                self._delete(connection, part_name, index, '>=')
+            else:
+                self._delete(connection, part_name, index, '=')
+            connection.execute(
+                'INSERT INTO steps (part, step, kind, state) '
+                'VALUES (?, ?, ?, ?)',
+                (part_name, index, kind, yaml.dump(state)))
+            connection.executemany(
+                'INSERT INTO path_sets (part, step, name, paths) '
+                'VALUES (?, ?, ?, ?)',
+                [(part_name, index, name, paths)
+                 for name, paths in path_sets.items()])
+
+    def clear_state(self, part_name, step):
+        """Forget that part_name ran step."""
+        index = common.COMMAND_ORDER.index(step)
+        with self._connect(create=False) as connection:
+            if connection:
+                self._delete(connection, part_name, index, '=')
+
+    def _delete(self, connection, part_name, index, operator):
+        for table in ('steps', 'path_sets'):
+            connection.execute(
+                'DELETE FROM {} WHERE part = ? AND step {} ?'.format(
+                    table, operator), (part_name, index))
+
+    @contextlib.contextmanager
+    def _connect(self, create):
+        """Give the connection to the database, within a transaction.
+
+        None is given instead if the database does not exist and create is
+        False.
+        """
+        with self._lock:
+            connection = self._get_connection(create)
+            if not connection:
+                yield None
+                return
+            with connection:
+                yield connection
+
+    def _get_connection(self, create):
+        # The database goes away with the parts directory, follow it.
+        try:
+            st = os.stat(self.path)
+            file_id = (st.st_dev, st.st_ino)
+        except FileNotFoundError:
+            file_id = None
+
+        if self._connection and file_id != self._file_id:
+            self._connection.close()
+            self._connection = None
+
+        if not self._connection:
+            if not file_id and not create:
+                return None
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._connection = sqlite3.connect(
+                self.path, check_same_thread=False)
+            self._connection.executescript(_SCHEMA)
+            st = os.stat(self.path)
+            self._file_id = (st.st_dev, st.st_ino)
+
+        return self._connection
+
+
+def _get_state_classes():
+    return {cls.yaml_tag: cls for cls in State.__subclasses__()}
+
+
+def _encode_paths(paths):
+    # Sorted paths share long prefixes with the one before them, keep only
+    # the length of that prefix and the rest of each path.
+    lines = []
+    previous = ''
+    for path in sorted(paths):
+        shared = len(os.path.commonprefix((previous, path)))
+        lines.append('{} {}'.format(shared, path[shared:]))
+        previous = path
+    return zlib.compress('\0'.join(lines).encode('utf-8', 'surrogateescape'))
+
+
+def _decode_paths(data):
+    paths = set()
+    if not data:
+        return paths
+
+    previous = ''
+    text = zlib.decompress(data).decode('utf-8', 'surrogateescape')
+    for line in text.split('\0') if text else ():
+        shared, rest = line.split(' ', 1)
+        previous = previous[:int(shared)] + rest
+        paths.add(previous)
+    return paths
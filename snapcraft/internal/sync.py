@@ -0,0 +1,165 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""Keep a copy of a directory tree up to date, the way rsync does.
+
+Only what changed since the last sync is copied again. A file is taken to
+be unchanged if its size and modification time are the same in both trees,
+and since copies keep the modification time of their source, untouched
+files keep theirs too. This matters to build tools like make, which would
+otherwise rebuild everything.
+"""
+
+import json
+import logging
+import os
+import shutil
+import stat
+
+
+logger = logging.getLogger(__name__)
+
+
+def sync_tree(source, destination, ignore=None, manifest=None,
+              copy_function=shutil.copy2):
+    """Make destination hold the same files as source.
+
+    :param str source: the tree to copy.
+    :param str destination: the copy to update, created if needed.
+    :param ignore: a callable like the one given to shutil.copytree.
+    :param str manifest: a file to record what was synced in. When given,
+                         only what was synced before and is gone from
+                         source is removed from destination, leaving
+                         anything else found there (such as build
+                         artifacts) alone. Otherwise everything that is not
+                         in source is removed.
+    :param copy_function: the function used to copy files, it must keep
+                          their modification time.
+    """
+    synced = set()
+    os.makedirs(destination, exist_ok=True)
+    _sync_directory(source, destination, '', ignore, copy_function, synced)
+
+    if manifest:
+        previous = _load_manifest(manifest)
+        for path in sorted(previous - synced, reverse=True):
+            _remove(os.path.join(destination, path))
+        _save_manifest(manifest, synced)
+    else:
+        _remove_unsynced(destination, '', synced)
+
+
+def _sync_directory(source, destination, prefix, ignore, copy_function,
+                    synced):
+    names = os.listdir(source)
+    ignored = set(ignore(source, names)) if ignore else set()
+
+    for name in names:
+        if name in ignored:
+            continue
+
+        source_path = os.path.join(source, name)
+        destination_path = os.path.join(destination, name)
+        synced.add(prefix + name)
+
+        source_stat = os.lstat(source_path)
+        try:
+            destination_stat = os.lstat(destination_path)
+        except FileNotFoundError:
+            destination_stat = None
+
+        if stat.S_ISDIR(source_stat.st_mode):
+            _sync_subdirectory(source_path, destination_path,
+                               destination_stat, prefix + name + '/', ignore,
+                               copy_function, synced)
+        elif stat.S_ISLNK(source_stat.st_mode):
+            _sync_symlink(source_path, destination_path, destination_stat)
+        else:
+            _sync_file(source_path, destination_path, source_stat,
+                       destination_stat, copy_function)
+
+
+def _sync_subdirectory(source_path, destination_path, destination_stat,
+                       prefix, ignore, copy_function, synced):
+    if destination_stat and not stat.S_ISDIR(destination_stat.st_mode):
+        _remove(destination_path)
+        destination_stat = None
+    if not destination_stat:
+        os.mkdir(destination_path)
+    _sync_directory(source_path, destination_path, prefix, ignore,
+                    copy_function, synced)
+    shutil.copystat(source_path, destination_path)
+
+
+def _sync_symlink(source_path, destination_path, destination_stat):
+    target = os.readlink(source_path)
+    if (destination_stat and stat.S_ISLNK(destination_stat.st_mode) and
+            os.readlink(destination_path) == target):
+        return
+    if destination_stat:
+        _remove(destination_path)
+    os.symlink(target, destination_path)
+
+
+def _sync_file(source_path, destination_path, source_stat, destination_stat,
+               copy_function):
+    if _is_same_file(source_stat, destination_stat):
+        return
+    if destination_stat:
+        _remove(destination_path)
+    copy_function(source_path, destination_path)
+
+
+def _is_same_file(source_stat, destination_stat):
+    return (destination_stat and
+            stat.S_ISREG(destination_stat.st_mode) and
+            destination_stat.st_size == source_stat.st_size and
+            destination_stat.st_mtime_ns == source_stat.st_mtime_ns and
+            destination_stat.st_mode == source_stat.st_mode)
+
+
+def _remove_unsynced(directory, prefix, synced):
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if prefix + name not in synced:
+            _remove(path)
+        elif os.path.isdir(path) and not os.path.islink(path):
+            _remove_unsynced(path, prefix + name + '/', synced)
+
+
+def _remove(path):
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+    elif os.path.lexists(path):
+        os.remove(path)
+
+
+def _load_manifest(manifest):
+    try:
+        with open(manifest) as f:
+            return set(json.load(f))
+    except FileNotFoundError:
+        return set()
+    except ValueError:
+        logger.debug('Ignoring invalid sync manifest {!r}'.format(manifest))
+        return set()
+
+
+def _save_manifest(manifest, synced):
+    temp_file = '{}.tmp'.format(manifest)
+    with open(temp_file, 'w') as f:
+        json.dump(sorted(synced), f)
+    os.rename(temp_file, manifest)
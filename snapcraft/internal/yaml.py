@@ -15,6 +15,7 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import codecs
+import copy
 import logging
 import os
 import os.path
@@ -27,6 +28,7 @@ import yaml
 import snapcraft
 from snapcraft.internal import (
     common,
+    configcache,
     libraries,
     parts,
     pluginhandler,
@@ -122,19 +124,67 @@ class Config:
         self._part_names = []
         self._project_options = project_options
         self.after_requests = {}
+        self._part_definitions = []
 
         self._snapcraft_yaml = _get_snapcraft_yaml()
+        cache_key = configcache.compute_key(
+            self._snapcraft_yaml, project_options.local_plugins_dir)
+        cached = configcache.load(cache_key)
+        if cached:
+            self._load_cached(cached)
+        else:
+            self._load()
+
+        self._compute_part_dependencies()
+        self.all_parts = self._sort_parts()
+
+        if 'architectures' not in self.data:
+            self.data['architectures'] = [self._project_options.deb_arch]
+
+    def _load(self):
         self.data = _snapcraft_yaml_load(self._snapcraft_yaml)
 
-        self._validator = Validator(self.data)
-        self._validator.validate()
-        _ensure_confinement_default(self.data, self._validator.schema)
+        validator = Validator(self.data)
+        validator.validate()
+        _ensure_confinement_default(self.data, validator.schema)
+        self._part_schema = validator.part_schema
 
-        self.build_tools = self.data.get('build-packages', [])
-        self.build_tools.extend(project_options.additional_build_packages)
+        self.build_tools = list(self.data.get('build-packages', []))
+        self.build_tools.extend(
+            self._project_options.additional_build_packages)
 
         self._remote_parts = parts.get_remote_parts()
         self._process_parts()
+        self._load_remote_dependencies()
+
+        configuration = copy.deepcopy({
+            'data': self.data,
+            'part_schema': self._part_schema,
+            'part_names': self._part_names,
+            'part_definitions': self._part_definitions,
+            'after_requests': self.after_requests,
+        })
+        # The remote parts are downloaded the first time they are needed,
+        # which changes the key.
+        cache_key = configcache.compute_key(
+            self._snapcraft_yaml, self._project_options.local_plugins_dir)
+        configcache.save(cache_key, configuration)
+
+    def _load_cached(self, configuration):
+        # Everything cached was already validated, only load the plugins.
+        self.data = configuration['data']
+        self._part_schema = configuration['part_schema']
+        self.after_requests = configuration['after_requests']
+
+        self.build_tools = list(self.data.get('build-packages', []))
+        self.build_tools.extend(
+            self._project_options.additional_build_packages)
+
+        for part_name, plugin_name, properties in (
+                configuration['part_definitions']):
+            self.load_plugin(part_name, plugin_name, properties,
+                             validate=False)
+        self._part_names = configuration['part_names']
 
     def _process_parts(self):
         for part_name in self.data.get('parts', []):
@@ -168,37 +218,33 @@ class Config:
 
             self.load_plugin(part_name, plugin_name, properties)
 
-        self._compute_part_dependencies()
-        self.all_parts = self._sort_parts()
+    def _load_remote_dependencies(self):
+        '''Load the remote parts that parts are after.'''
 
-        if 'architectures' not in self.data:
-            self.data['architectures'] = [self._project_options.deb_arch]
+        for part in self.all_parts:
+            dep_names = self.after_requests.get(part.name, [])
+            for dep in dep_names:
+                if dep in self._part_names:
+                    continue
+                try:
+                    remote_part = self._remote_parts.get_part(dep)
+                except KeyError as e:
+                    raise SnapcraftLogicError(
+                        'Cannot find definition for part {!r}. '
+                        'It may be a remote part, run `snapcraft update` '
+                        'to refresh the remote parts '
+                        'cache'.format(dep)) from e
+                plugin_name = remote_part.pop('plugin')
+                self.load_plugin(dep, plugin_name, remote_part)
+                self._part_names.append(dep)
 
     def _compute_part_dependencies(self):
         '''Gather the lists of dependencies and adds to all_parts.'''
 
+        parts_by_name = {part.name: part for part in self.all_parts}
         for part in self.all_parts:
-            dep_names = self.after_requests.get(part.name, [])
-            for dep in dep_names:
-                found = False
-                for i in range(len(self.all_parts)):
-                    if dep == self.all_parts[i].name:
-                        part.deps.append(self.all_parts[i])
-                        found = True
-                        break
-                if not found:
-                    try:
-                        remote_part = self._remote_parts.get_part(dep)
-                    except KeyError as e:
-                        raise SnapcraftLogicError(
-                            'Cannot find definition for part {!r}. '
-                            'It may be a remote part, run `snapcraft update` '
-                            'to refresh the remote parts '
-                            'cache'.format(dep)) from e
-                    plugin_name = remote_part.pop('plugin')
-                    part.deps.append(self.load_plugin(
-                        dep, plugin_name, remote_part))
-                    self._part_names.append(dep)
+            for dep in self.after_requests.get(part.name, []):
+                part.deps.append(parts_by_name[dep])
 
     def _sort_parts(self):
         '''Performs an inneficient but easy to follow sorting of parts.'''
@@ -260,10 +306,13 @@ class Config:
                     'The part named {!r} is not defined in '
                     '{!r}'.format(part_name, self._snapcraft_yaml))
 
-    def load_plugin(self, part_name, plugin_name, properties):
+    def load_plugin(self, part_name, plugin_name, properties,
+                    validate=True):
+        self._part_definitions.append(
+            (part_name, plugin_name, copy.deepcopy(properties)))
         part = pluginhandler.load_plugin(
             part_name, plugin_name, properties,
-            self._project_options, self._validator.part_schema)
+            self._project_options, self._part_schema, validate)
 
         self.build_tools += part.code.build_packages
         self.build_tools += sources.get_required_packages(part.code.options)
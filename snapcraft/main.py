@@ -19,15 +19,17 @@
 snapcraft
 
 Usage:
-  snapcraft [options] [--enable-geoip --no-parallel-build]
+  snapcraft [options] [--enable-geoip --no-parallel-build --enable-build-cache]
   snapcraft [options] init
   snapcraft [options] pull [<part> ...]  [--enable-geoip]
   snapcraft [options] build [<part> ...] [--no-parallel-build]
-  snapcraft [options] stage [<part> ...]
-  snapcraft [options] prime [<part> ...]
-  snapcraft [options] strip [<part> ...]
+                            [--enable-build-cache]
+  snapcraft [options] stage [<part> ...] [--enable-build-cache]
+  snapcraft [options] prime [<part> ...] [--enable-build-cache]
+  snapcraft [options] strip [<part> ...] [--enable-build-cache]
   snapcraft [options] clean [<part> ...] [--step <step>]
   snapcraft [options] snap [<directory> --output <snap-file>]
+                           [--enable-build-cache]
   snapcraft [options] cleanbuild
   snapcraft [options] login
   snapcraft [options] logout
@@ -38,7 +40,8 @@ Usage:
   snapcraft [options] tour [<directory>]
   snapcraft [options] update
   snapcraft [options] define <part-name>
-  snapcraft [options] search [<query> ...]
+  snapcraft [options] search [<query> ...] [--plugin <plugin>]
+                             [--maintainer <maintainer>]
   snapcraft [options] help (topics | <plugin> | <topic>) [--devel]
   snapcraft (-h | --help)
   snapcraft --version
@@ -51,6 +54,8 @@ Options:
   --target-arch ARCH                    EXPERIMENTAL: sets the target
                                         architecture. Very few plugins support
                                         this.
+  -j <count>, --jobs <count>            number of parts to pull and build
+                                        concurrently [default: 1].
 
 Options specific to pulling:
   --enable-geoip         enables geoip for the pull step if stage-packages
@@ -60,6 +65,9 @@ Options specific to building:
   --no-parallel-build                   use only a single build job per part
                                         (the default number of jobs per part is
                                         equal to the number of CPUs)
+  --enable-build-cache                  reuse the result of earlier builds of a
+                                        part when nothing it is built from has
+                                        changed.
 
 Options specific to cleaning:
   -s <step>, --step <step>              only clean the specified step and those
@@ -70,6 +78,11 @@ Options specific to snapping:
   -o <snap-file>, --output <snap-file>  used in case you want to rename the
                                         snap.
 
+Options specific to searching:
+  --plugin <plugin>                     only show parts using this plugin.
+  --maintainer <maintainer>             only show parts whose maintainer
+                                        contains this.
+
 The available commands are:
   help         Obtain help for a certain plugin or topic
   init         Initialize a snapcraft project.
@@ -112,15 +125,13 @@ http://developer.ubuntu.com/snappy/snapcraft
 
 import logging
 import os
-import pkg_resources
-import pkgutil
 import shutil
 import sys
 
 from docopt import docopt
 
 import snapcraft
-from snapcraft.internal import lifecycle, log, parts
+from snapcraft.internal import log, pluginindex
 from snapcraft.internal.common import (
     format_output_in_columns,
     get_terminal_width,
@@ -132,12 +143,21 @@ _SNAPCRAFT_TOUR_DIR = "./snapcraft-tour/"
 
 
 def _get_version():
+    # pkg_resources takes long to import, only do it for --version.
+    import pkg_resources
     try:
         return pkg_resources.require('snapcraft')[0].version
     except pkg_resources.DistributionNotFound:
         return 'devel'
 
 
+class _Version:
+    """The version of snapcraft, looked up when docopt prints it."""
+
+    def __str__(self):
+        return _get_version()
+
+
 def _scaffold_examples(directory):
     logger.debug("Copying examples tour to {}".format(directory))
     dest_dir = os.path.abspath(directory)
@@ -166,10 +186,8 @@ def _scaffold_examples(directory):
 
 
 def _list_plugins():
-    plugins = []
-    for importer, modname, is_package in pkgutil.iter_modules(
-            snapcraft.plugins.__path__):
-        plugins.append(modname.replace('_', '-'))
+    plugins = [name.replace('_', '-')
+               for name in pluginindex.get_plugin_names()]
 
     # we wrap the output depending on terminal size
     width = get_terminal_width()
@@ -182,12 +200,19 @@ def _get_project_options(args):
     options['use_geoip'] = args['--enable-geoip']
     options['parallel_builds'] = not args['--no-parallel-build']
     options['target_deb_arch'] = args['--target-arch']
+    options['use_build_cache'] = args['--enable-build-cache']
+
+    try:
+        options['parallel_part_count'] = int(args['--jobs'])
+    except ValueError:
+        raise EnvironmentError(
+            '--jobs expects a number, not {!r}'.format(args['--jobs']))
 
     return snapcraft.ProjectOptions(**options)
 
 
 def main(argv=None):
-    args = docopt(__doc__, version=_get_version(), argv=argv)
+    args = docopt(__doc__, version=_Version(), argv=argv)
 
     # Default log level is INFO unless --debug is specified
     log_level = logging.INFO
@@ -195,12 +220,12 @@ def main(argv=None):
         log_level = logging.DEBUG
 
     log.configure(log_level=log_level)
-    project_options = _get_project_options(args)
 
     if args['strip']:
         logger.warning("DEPRECATED: use 'prime' instead of 'strip'")
         args['prime'] = True
     try:
+        project_options = _get_project_options(args)
         return run(args, project_options)
     except Exception as e:
         if args['--debug']:
@@ -220,7 +245,7 @@ def _get_lifecycle_command(args):
 
 def _get_command_from_arg(args):
     functions = {
-        'init': lifecycle.init,
+        'init': _init,
         'login': snapcraft.login,
         'logout': snapcraft.logout,
         'list-plugins': _list_plugins,
@@ -231,18 +256,17 @@ def _get_command_from_arg(args):
     return functions[function[0]]
 
 
+def _init():
+    from snapcraft.internal import lifecycle
+    lifecycle.init()
+
+
 def run(args, project_options):  # noqa
-    lifecycle_command = _get_lifecycle_command(args)
+    # Commands import what they need when they run, so that the ones which
+    # do not need much, such as help or list-plugins, start quickly.
     argless_command = _get_command_from_arg(args)
-    if lifecycle_command:
-        lifecycle.execute(
-            lifecycle_command, project_options, args['<part>'])
-    elif argless_command:
+    if argless_command:
         argless_command()
-    elif args['clean']:
-        _run_clean(args, project_options)
-    elif args['cleanbuild']:
-        lifecycle.cleanbuild(project_options),
     elif _is_store_command(args):
         _run_store_command(args)
     elif args['tour']:
@@ -250,19 +274,32 @@ def run(args, project_options):  # noqa
     elif args['help']:
         snapcraft.topic_help(args['<topic>'] or args['<plugin>'],
                              args['--devel'], args['topics'])
-    elif args['update']:
-        parts.update()
-    elif args['define']:
-        parts.define(args['<part-name>'])
-    elif args['search']:
-        parts.search(' '.join(args['<query>']))
-    else:  # snap by default:
-        lifecycle.snap(project_options, args['<directory>'], args['--output'])
+    elif _is_parts_command(args):
+        _run_parts_command(args)
+    else:
+        _run_lifecycle_command(args, project_options)
 
     return project_options
 
 
+def _run_lifecycle_command(args, project_options):
+    from snapcraft.internal import lifecycle
+
+    lifecycle_command = _get_lifecycle_command(args)
+    if lifecycle_command:
+        lifecycle.execute(
+            lifecycle_command, project_options, args['<part>'])
+    elif args['clean']:
+        _run_clean(args, project_options)
+    elif args['cleanbuild']:
+        lifecycle.cleanbuild(project_options),
+    else:  # snap by default:
+        lifecycle.snap(project_options, args['<directory>'], args['--output'])
+
+
 def _run_clean(args, project_options):
+    from snapcraft.internal import lifecycle
+
     step = args['--step']
     if step == 'strip':
         logger.warning('DEPRECATED: Use `prime` instead of `strip` '
@@ -271,6 +308,23 @@ def _run_clean(args, project_options):
     lifecycle.clean(project_options, args['<part>'], step)
 
 
+def _is_parts_command(args):
+    commands = ('update', 'define', 'search')
+    return any(args.get(command) for command in commands)
+
+
+def _run_parts_command(args):
+    from snapcraft.internal import parts
+
+    if args['update']:
+        parts.update()
+    elif args['define']:
+        parts.define(args['<part-name>'])
+    elif args['search']:
+        parts.search(' '.join(args['<query>']), plugin=args['--plugin'],
+                     maintainer=args['--maintainer'])
+
+
 def _is_store_command(args):
     commands = ('register', 'upload', 'release')
     return any(args.get(command) for command in commands)
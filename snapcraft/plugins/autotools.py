@@ -115,5 +115,5 @@ class AutotoolsPlugin(snapcraft.BasePlugin):
             configure_command.append('--prefix=' + self.installdir)
 
         self.run(configure_command + self.options.configflags)
-        self.run(['make', '-j{}'.format(self.project.parallel_build_count)])
+        self.run(['make'] + self.parallel_make_args())
         self.run(make_install_command)
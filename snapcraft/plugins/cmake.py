@@ -77,8 +77,7 @@ class CMakePlugin(snapcraft.plugins.make.MakePlugin):
         self.run(['cmake', sourcedir, '-DCMAKE_INSTALL_PREFIX='] +
                  self.options.configflags, env=env)
 
-        self.run(['make', '-j{}'.format(
-            self.project.parallel_build_count)], env=env)
+        self.run(['make'] + self.parallel_make_args(), env=env)
 
         self.run(['make', 'install', 'DESTDIR=' + self.installdir], env=env)
 
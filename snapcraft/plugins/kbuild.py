@@ -105,8 +105,7 @@ class KBuildPlugin(BasePlugin):
 
         self.make_targets = []
         self.make_install_targets = ['install']
-        self.make_cmd = [
-            'make', '-j{}'.format(project.parallel_build_count)]
+        self.make_cmd = ['make'] + self.parallel_make_args()
         if logger.isEnabledFor(logging.DEBUG):
             self.make_cmd.append('V=1')
 
@@ -115,8 +114,8 @@ class KBuildPlugin(BasePlugin):
         # otherwise use defconfig to seed the base config
         if self.options.kconfigfile is None:
             # we need to run this with -j1, unit tests are a good defense here.
-            make_cmd = self.make_cmd.copy()
-            make_cmd[1] = '-j1'
+            make_cmd = [c for c in self.make_cmd if not c.startswith('-j')]
+            make_cmd.insert(1, '-j1')
             self.run(make_cmd + self.options.kdefconfig)
         else:
             shutil.copy(self.options.kconfigfile, config_path)
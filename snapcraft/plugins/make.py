@@ -77,5 +77,5 @@ class MakePlugin(snapcraft.BasePlugin):
         if self.options.make_parameters:
             command.extend(self.options.make_parameters)
 
-        self.run(command + ['-j{}'.format(self.project.parallel_build_count)])
+        self.run(command + self.parallel_make_args())
         self.run(command + ['install', 'DESTDIR=' + self.installdir])
@@ -107,8 +107,7 @@ class QmakePlugin(snapcraft.BasePlugin):
         self.run(['qmake'] + self._extra_config() + self.options.options +
                  sources, env=env)
 
-        self.run(['make', '-j{}'.format(
-            self.project.parallel_build_count)], env=env)
+        self.run(['make'] + self.parallel_make_args(), env=env)
 
         self.run(['make', 'install', 'INSTALL_ROOT=' + self.installdir],
                  env=env)
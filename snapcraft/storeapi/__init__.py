@@ -14,7 +14,6 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import hashlib
 import itertools
 import json
 import logging
@@ -34,7 +33,7 @@ from progressbar import (
 
 import snapcraft
 from snapcraft import config
-from snapcraft.internal.indicators import download_requests_stream
+from snapcraft.internal import download
 from snapcraft.storeapi import (
     _upload,
     constants,
@@ -183,26 +182,25 @@ class StoreClient():
                 name, download_path))
             return
         logger.info('Downloading {}'.format(name, download_path))
-        request = self.cpi.get(download_url, stream=True)
-        request.raise_for_status()
-        download_requests_stream(request, download_path)
-
-        if self._is_downloaded(download_path, expected_sha512):
-            logger.info('Successfully downloaded {} at {}'.format(
-                name, download_path))
-        else:
+        # The snap is hashed as it is downloaded, and a download
+        # interrupted before is resumed.
+        try:
+            download.download(
+                download_url, download_path,
+                headers={'Authorization': _macaroon_auth(self.conf)},
+                expected_digests={'sha512': expected_sha512})
+        except download.DigestMismatchError:
             raise errors.SHAMismatchError(download_path, expected_sha512)
+        logger.info('Successfully downloaded {} at {}'.format(
+            name, download_path))
 
     def _is_downloaded(self, path, expected_sha512):
-        if not os.path.exists(path):
+        # Snaps are big, their digests are only computed when they change.
+        try:
+            digests = download.get_digests(path, ['sha512'])
+        except FileNotFoundError:
             return False
-
-        file_sum = hashlib.sha512()
-        with open(path, 'rb') as f:
-            for file_chunk in iter(
-                    lambda: f.read(file_sum.block_size * 128), b''):
-                file_sum.update(file_chunk)
-        return expected_sha512 == file_sum.hexdigest()
+        return expected_sha512 == digests['sha512']
 
 
 class SSOClient(Client):
@@ -22,7 +22,7 @@ import fixtures
 import progressbar
 import testscenarios
 
-from snapcraft.internal import common
+from snapcraft.internal import common, states
 from snapcraft.tests import fixture_setup
 
 
@@ -53,6 +53,8 @@ class TestCase(testscenarios.WithScenarios, fixtures.TestWithFixtures):
         self.addCleanup(common.set_librariesdir, common.get_librariesdir())
         self.addCleanup(common.set_tourdir, common.get_tourdir())
         self.addCleanup(common.reset_env)
+        self.addCleanup(common.reset_copy_cache)
+        self.addCleanup(states.close_stores)
         common.set_schemadir(os.path.join(__file__,
                              '..', '..', '..', 'schema'))
         self.useFixture(fixtures.FakeLogger(level=logging.ERROR))
@@ -80,16 +82,18 @@ class TestCase(testscenarios.WithScenarios, fixtures.TestWithFixtures):
         with open('snapcraft.yaml', 'w', encoding=encoding) as fp:
             fp.write(content)
 
-    def verify_state(self, part_name, state_dir, expected_step):
-        self.assertTrue(os.path.isdir(state_dir),
-                        'Expected state directory for {}'.format(part_name))
-
+    def verify_state(self, part_name, expected_step):
         # Expect every step up to and including the specified one to be run
-        index = common.COMMAND_ORDER.index(expected_step)
-        for step in common.COMMAND_ORDER[:index+1]:
-            self.assertTrue(os.path.exists(os.path.join(state_dir, step)),
-                            'Expected {!r} to be run for {}'.format(
-                                step, part_name))
+        last_step = states.get_store(self.parts_dir).get_last_step(part_name)
+        self.assertTrue(
+            last_step and (common.COMMAND_ORDER.index(last_step) >=
+                           common.COMMAND_ORDER.index(expected_step)),
+            'Expected {!r} to be run for {}'.format(expected_step, part_name))
+
+    def assert_no_state(self, part_name):
+        self.assertIsNone(
+            states.get_store(self.parts_dir).get_last_step(part_name),
+            'Expected no step to be run for {}'.format(part_name))
 
 
 class SilentProgressBar(progressbar.ProgressBar):
@@ -19,6 +19,8 @@ import json
 import logging
 import http.server
 import os
+import socketserver
+import threading
 import urllib.parse
 
 import pymacaroons
@@ -80,14 +82,15 @@ class FakePartsRequestHandler(BaseHTTPRequestHandler):
                     'maintainer': 'none',
                 },
             }
+        data = yaml.dump(response).encode()
         self.send_header('Content-Type', 'text/plain')
         if 'NO_CONTENT_LENGTH' not in os.environ:
-            self.send_header('Content-Length', '1000')
+            self.send_header('Content-Length', str(len(data)))
         self.send_header(
             'Last-Modified', self._parts_date.strftime(self._date_format))
         self.send_header('ETag', '1111')
         self.end_headers()
-        self.wfile.write(yaml.dump(response).encode())
+        self.wfile.write(data)
 
 
 class FakePartsWikiServer(http.server.HTTPServer):
@@ -150,6 +153,62 @@ parts:
         self.wfile.write(response.encode())
 
 
+class FakeBuildCacheServer(socketserver.ThreadingMixIn,
+                           http.server.HTTPServer):
+    """A build cache keeping its entries in memory.
+
+    Entries are stored with PUT and retrieved with GET on any path, which
+    is all snapcraft needs from a remote build cache.
+    """
+
+    def __init__(self, server_address):
+        super().__init__(
+            server_address, FakeBuildCacheRequestHandler)
+        self.entries = {}
+        self.lock = threading.Lock()
+
+
+class FakeBuildCacheRequestHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        logger.debug('Handling getting build cache entry')
+        with self.server.lock:
+            data = self.server.entries.get(self.path)
+        if data is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_PUT(self):
+        logger.debug('Handling storing build cache entry')
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            data = self._read_chunks()
+        else:
+            data = self.rfile.read(int(self.headers['Content-Length']))
+        with self.server.lock:
+            self.server.entries[self.path] = data
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def _read_chunks(self):
+        data = b''
+        while True:
+            size = int(self.rfile.readline().strip(), 16)
+            if not size:
+                self.rfile.readline()
+                return data
+            data += self.rfile.read(size)
+            self.rfile.readline()
+
+
 class FakeSSOServer(http.server.HTTPServer):
 
     def __init__(self, server_address):
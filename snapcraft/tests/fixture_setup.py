@@ -55,6 +55,11 @@ class TempXDG(fixtures.Fixture):
             new=os.path.join(self.path, '.local'))
         patcher.start()
         self.addCleanup(patcher.stop)
+        patcher = mock.patch(
+            'xdg.BaseDirectory.xdg_cache_home',
+            new=os.path.join(self.path, '.cache'))
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
         patcher_dirs = mock.patch(
             'xdg.BaseDirectory.xdg_config_dirs',
@@ -228,6 +233,11 @@ class FakePartsServerRunning(_FakeServerRunning):
     fake_server = fake_servers.FakePartsServer
 
 
+class FakeBuildCacheServerRunning(_FakeServerRunning):
+
+    fake_server = fake_servers.FakeBuildCacheServer
+
+
 class FakeSSOServerRunning(_FakeServerRunning):
 
     fake_server = fake_servers.FakeSSOServer
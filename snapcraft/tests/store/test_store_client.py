@@ -123,6 +123,23 @@ class DownloadTestCase(tests.TestCase):
             'Already downloaded test-snap at {}'.format(download_path),
             self.fake_logger.output)
 
+    def test_already_downloaded_snap_is_not_hashed_again(self):
+        self.fake_logger = fixtures.FakeLogger(level=logging.INFO)
+        self.useFixture(self.fake_logger)
+        self.client.login('dummy', 'test correct password')
+        download_path = os.path.join(self.path, 'test-snap.snap')
+        self.client.download(
+            'test-snap', 'test-channel', download_path)
+
+        with mock.patch('snapcraft.internal.download._update_hashes') as \
+                update_mock:
+            self.client.download(
+                'test-snap', 'test-channel', download_path)
+        self.assertFalse(update_mock.called)
+        self.assertIn(
+            'Already downloaded test-snap at {}'.format(download_path),
+            self.fake_logger.output)
+
     def test_download_on_sha_mismatch(self):
         self.fake_logger = fixtures.FakeLogger(level=logging.INFO)
         self.useFixture(self.fake_logger)
@@ -85,6 +85,32 @@ class TestBasePlugin(tests.TestCase):
         self.assertTrue(
             os.path.exists(os.path.join(plugin.build_basedir, 'file')))
 
+    def test_build_again_updates_build_basedir(self):
+        plugin = snapcraft.BasePlugin('test-part', options=None)
+
+        os.makedirs(plugin.sourcedir)
+        for name in ('changed', 'unchanged', 'removed'):
+            with open(os.path.join(plugin.sourcedir, name), 'w') as f:
+                f.write(name)
+
+        plugin.build()
+
+        # Artifacts from the build, and times the build tools rely on.
+        open(os.path.join(plugin.builddir, 'built'), 'w').close()
+        unchanged = os.path.join(plugin.builddir, 'unchanged')
+        unchanged_mtime = os.stat(unchanged).st_mtime_ns
+        with open(os.path.join(plugin.sourcedir, 'changed'), 'w') as f:
+            f.write('new contents')
+        os.remove(os.path.join(plugin.sourcedir, 'removed'))
+
+        plugin.build()
+
+        self.assertEqual(['built', 'changed', 'unchanged'],
+                         sorted(os.listdir(plugin.builddir)))
+        with open(os.path.join(plugin.builddir, 'changed')) as f:
+            self.assertEqual('new contents', f.read())
+        self.assertEqual(unchanged_mtime, os.stat(unchanged).st_mtime_ns)
+
 
 class GetSourceWithBranches(tests.TestCase):
 
@@ -0,0 +1,329 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import logging
+import os
+import tarfile
+from unittest import mock
+
+import fixtures
+
+import snapcraft
+from snapcraft.internal import buildcache
+from snapcraft.plugins import nil
+from snapcraft import tests
+from snapcraft.tests import fixture_setup
+
+
+class _Options:
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class BuildCacheTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.cache = buildcache.BuildCache()
+        self.installdir = os.path.join(self.path, 'install')
+        os.makedirs(os.path.join(self.installdir, 'bin'))
+        with open(os.path.join(self.installdir, 'bin', 'app'), 'w') as f:
+            f.write('app')
+        os.symlink('app', os.path.join(self.installdir, 'bin', 'link'))
+
+    def test_restore_missing_entry(self):
+        self.assertFalse(self.cache.restore('key', self.installdir))
+        self.assertTrue(
+            os.path.exists(os.path.join(self.installdir, 'bin', 'app')))
+
+    def test_save_and_restore(self):
+        self.cache.save('key', self.installdir)
+
+        restored = os.path.join(self.path, 'restored')
+        os.makedirs(os.path.join(restored, 'stale'))
+        self.assertTrue(self.cache.restore('key', restored))
+
+        self.assertEqual(['bin'], os.listdir(restored))
+        self.assertEqual(
+            'app', os.readlink(os.path.join(restored, 'bin', 'link')))
+        with open(os.path.join(restored, 'bin', 'app')) as f:
+            self.assertEqual('app', f.read())
+
+    def test_cache_dir_is_in_xdg_cache_home(self):
+        self.cache.save('key', self.installdir)
+
+        self.assertTrue(os.path.isdir(os.path.join(
+            self.path, '.cache', 'snapcraft', 'build', 'key')))
+        # No temporary directories are left behind.
+        self.assertEqual(['key'], os.listdir(self.cache.cache_dir))
+
+    def test_save_existing_entry_is_kept(self):
+        self.cache.save('key', self.installdir)
+        os.remove(os.path.join(self.installdir, 'bin', 'app'))
+        self.cache.save('key', self.installdir)
+
+        self.assertTrue(os.path.exists(
+            os.path.join(self.cache.cache_dir, 'key', 'bin', 'app')))
+
+    def test_changing_installdirs_leaves_entries_alone(self):
+        self.cache.save('key', self.installdir)
+        with open(os.path.join(self.installdir, 'bin', 'app'), 'r+') as f:
+            f.write('new')
+        restored = os.path.join(self.path, 'restored')
+        self.cache.restore('key', restored)
+        with open(os.path.join(restored, 'bin', 'app'), 'r+') as f:
+            f.write('new')
+
+        entry = os.path.join(self.cache.cache_dir, 'key')
+        with open(os.path.join(entry, 'bin', 'app')) as f:
+            self.assertEqual('app', f.read())
+
+
+class RemoteBuildCacheTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.fake_logger = fixtures.FakeLogger(level=logging.WARNING)
+        self.useFixture(self.fake_logger)
+
+        self.server_fixture = fixture_setup.FakeBuildCacheServerRunning()
+        self.useFixture(self.server_fixture)
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SNAPCRAFT_BUILD_CACHE_URL', self.server_fixture.url + 'cache'))
+
+        self.installdir = os.path.join(self.path, 'install')
+        os.makedirs(os.path.join(self.installdir, 'lib'))
+        with open(os.path.join(self.installdir, 'lib', 'libfoo.so'),
+                  'w') as f:
+            f.write('libfoo')
+
+    def _get_other_cache(self):
+        # A cache sharing the remote but with its own local tier, as if on
+        # another machine.
+        cache = buildcache.get_cache()
+        cache.cache_dir = os.path.join(self.path, 'other-cache')
+        return cache
+
+    def test_get_cache_uses_http_backend(self):
+        self.assertIsInstance(
+            buildcache.get_cache().remote, buildcache.HTTPBackend)
+
+    def test_get_cache_without_remote(self):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SNAPCRAFT_BUILD_CACHE_URL'))
+
+        self.assertIsNone(buildcache.get_cache().remote)
+
+    def test_get_cache_unsupported_scheme(self):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SNAPCRAFT_BUILD_CACHE_URL', 'ftp://example.com/cache'))
+
+        with self.assertRaises(buildcache.BuildCacheError) as raised:
+            buildcache.get_cache()
+
+        self.assertEqual(
+            "Unsupported build cache URL 'ftp://example.com/cache': the "
+            "scheme must be one of http, https", str(raised.exception))
+
+    def test_save_uploads_compressed_entry(self):
+        buildcache.get_cache().save('key', self.installdir)
+
+        data = self.server_fixture.server.entries['/cache/key.tar.gz']
+        with tarfile.open(fileobj=io.BytesIO(data), mode='r:gz') as tar:
+            self.assertEqual(['lib', 'lib/libfoo.so'], tar.getnames())
+
+    def test_failed_tarball_is_not_uploaded(self):
+        with mock.patch('tarfile.TarFile.add',
+                        side_effect=OSError('cannot read')):
+            buildcache.get_cache().save('key', self.installdir)
+
+        self.assertNotIn('/cache/key.tar.gz',
+                         self.server_fixture.server.entries)
+        self.assertIn('Cannot upload build cache entry key',
+                      self.fake_logger.output)
+
+    def test_restore_from_remote(self):
+        buildcache.get_cache().save('key', self.installdir)
+        cache = self._get_other_cache()
+
+        restored = os.path.join(self.path, 'restored')
+        self.assertTrue(cache.restore('key', restored))
+
+        with open(os.path.join(restored, 'lib', 'libfoo.so')) as f:
+            self.assertEqual('libfoo', f.read())
+        # The entry is now in the local tier too.
+        self.assertTrue(os.path.isdir(os.path.join(cache.cache_dir, 'key')))
+
+    def test_restore_missing_from_remote(self):
+        cache = self._get_other_cache()
+
+        self.assertFalse(cache.restore('key', self.installdir))
+        self.assertEqual('', self.fake_logger.output)
+
+    def test_fetch_several_entries(self):
+        for key in ('key1', 'key2', 'key3'):
+            buildcache.get_cache().save(key, self.installdir)
+        cache = self._get_other_cache()
+
+        cache.fetch(['key1', 'key2', 'key3', 'missing'])
+
+        self.assertEqual(['key1', 'key2', 'key3'],
+                         sorted(os.listdir(cache.cache_dir)))
+
+    def test_unsafe_entry_is_rejected(self):
+        data = io.BytesIO()
+        with tarfile.open(fileobj=data, mode='w:gz') as tar:
+            info = tarfile.TarInfo('../evil')
+            tar.addfile(info, io.BytesIO())
+        self.server_fixture.server.entries['/cache/key.tar.gz'] = (
+            data.getvalue())
+
+        self.assertFalse(
+            self._get_other_cache().restore('key', self.installdir))
+        self.assertFalse(os.path.exists(os.path.join(self.path, 'evil')))
+        self.assertEqual(
+            "Cannot fetch build cache entry key: unexpected path '../evil' "
+            "in tarball\n", self.fake_logger.output)
+
+    def _serve_entry(self, members):
+        data = io.BytesIO()
+        with tarfile.open(fileobj=data, mode='w:gz') as tar:
+            for name, linkname in members:
+                info = tarfile.TarInfo(name)
+                if linkname:
+                    info.type = tarfile.SYMTYPE
+                    info.linkname = linkname
+                else:
+                    info.type = tarfile.DIRTYPE
+                tar.addfile(info, io.BytesIO())
+        self.server_fixture.server.entries['/cache/key.tar.gz'] = (
+            data.getvalue())
+
+    def test_entry_with_symlink_out_is_rejected(self):
+        for linkname in ('/etc', '../..', 'lib/../..'):
+            with self.subTest(linkname=linkname):
+                self._serve_entry([('lib', None), ('a', linkname)])
+
+                self.assertFalse(
+                    self._get_other_cache().restore('key', self.installdir))
+
+    def test_entry_going_through_symlink_is_rejected(self):
+        for members in ([('a', 'lib'), ('a/passwd', None)],
+                        [('a', '.'), ('b', 'a/..')]):
+            with self.subTest(members=members):
+                self._serve_entry(members)
+
+                self.assertFalse(
+                    self._get_other_cache().restore('key', self.installdir))
+                self.assertFalse(os.path.exists(
+                    os.path.join(self.path, 'passwd')))
+
+    def test_entry_with_symlink_inside(self):
+        self._serve_entry([('lib', None), ('usr', None),
+                           ('usr/lib', '../lib')])
+        restored = os.path.join(self.path, 'restored')
+
+        self.assertTrue(self._get_other_cache().restore('key', restored))
+        self.assertEqual(os.path.join('..', 'lib'), os.readlink(
+            os.path.join(restored, 'usr', 'lib')))
+
+    def test_unreachable_remote_is_a_cache_miss(self):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SNAPCRAFT_BUILD_CACHE_URL', 'http://localhost:1/cache'))
+        cache = buildcache.get_cache()
+
+        cache.save('key', self.installdir)
+        self.assertFalse(self._get_other_cache().restore('key', self.path))
+
+        self.assertTrue(
+            'Cannot upload build cache entry key' in self.fake_logger.output)
+        self.assertTrue(
+            'Cannot fetch build cache entry key' in self.fake_logger.output)
+
+
+class ComputeKeyTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.project_options = snapcraft.ProjectOptions()
+        self.plugin = nil.NilPlugin('part', _Options(), self.project_options)
+        self.sourcedir = os.path.join(self.path, 'src')
+        os.makedirs(self.sourcedir)
+        with open(os.path.join(self.sourcedir, 'main.c'), 'w') as f:
+            f.write('int main() {}')
+
+    def _compute_key(self, options=None, dependency_files=None):
+        return buildcache.compute_key(
+            self.plugin, options or _Options(stage=[], snap=[]),
+            self.sourcedir, self.project_options, dependency_files or [])
+
+    def test_key_is_stable(self):
+        self.assertEqual(self._compute_key(), self._compute_key())
+
+    def test_key_changes_with_build_options(self):
+        self.assertNotEqual(
+            self._compute_key(_Options(configflags=['--foo'])),
+            self._compute_key(_Options(configflags=['--bar'])))
+
+    def test_key_ignores_options_used_after_build(self):
+        self.assertEqual(
+            self._compute_key(_Options(stage=['foo'], snap=[], organize={})),
+            self._compute_key(_Options(stage=[], snap=['bar'],
+                                       organize={'a': 'b'})))
+
+    def test_key_changes_with_project_location(self):
+        key = self._compute_key()
+        self.plugin.installdir = os.path.join(self.path, 'other', 'install')
+
+        self.assertNotEqual(key, self._compute_key())
+
+    def test_key_changes_with_source(self):
+        key = self._compute_key()
+        with open(os.path.join(self.sourcedir, 'main.c'), 'a') as f:
+            f.write('\n')
+
+        self.assertNotEqual(key, self._compute_key())
+
+    def test_key_changes_with_source_mode(self):
+        key = self._compute_key()
+        os.chmod(os.path.join(self.sourcedir, 'main.c'), 0o755)
+
+        self.assertNotEqual(key, self._compute_key())
+
+    def test_key_changes_with_target_arch(self):
+        key = self._compute_key()
+        self.project_options = snapcraft.ProjectOptions(
+            target_deb_arch='armhf')
+
+        self.assertNotEqual(key, self._compute_key())
+
+    def test_key_changes_with_staged_dependencies(self):
+        stage_dir = self.project_options.stage_dir
+        os.makedirs(os.path.join(stage_dir, 'lib'))
+        with open(os.path.join(stage_dir, 'lib', 'libfoo.so'), 'w') as f:
+            f.write('1')
+        key = self._compute_key(dependency_files=['lib/libfoo.so'])
+
+        with open(os.path.join(stage_dir, 'lib', 'libfoo.so'), 'w') as f:
+            f.write('2')
+
+        self.assertNotEqual(
+            key, self._compute_key(dependency_files=['lib/libfoo.so']))
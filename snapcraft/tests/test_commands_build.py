@@ -19,6 +19,7 @@ import os
 import os.path
 
 import fixtures
+from unittest import mock
 
 from snapcraft.main import main
 from snapcraft import tests
@@ -45,10 +46,8 @@ parts:
         parts = []
         for i in range(n):
             part_dir = os.path.join(self.parts_dir, 'build{}'.format(i))
-            state_dir = os.path.join(part_dir, 'state')
             parts.append({
                 'part_dir': part_dir,
-                'state_dir': state_dir,
             })
 
         return parts
@@ -78,7 +77,17 @@ parts:
         self.assertTrue(os.path.exists(parts[0]['part_dir']),
                         'Expected a part directory for the build0 part')
 
-        self.verify_state('build0', parts[0]['state_dir'], 'build')
+        self.verify_state('build0', 'build')
+
+    @mock.patch('snapcraft.internal.lifecycle.execute')
+    def test_build_with_build_cache(self, execute_mock):
+        self.make_snapcraft_yaml()
+
+        main(['build', '--enable-build-cache'])
+
+        step, project_options = execute_mock.call_args[0][:2]
+        self.assertEqual('build', step)
+        self.assertTrue(project_options.use_build_cache)
 
     def test_build_one_part_only_from_3(self):
         fake_logger = fixtures.FakeLogger(level=logging.ERROR)
@@ -92,10 +101,9 @@ parts:
         self.assertTrue(os.path.exists(parts[1]['part_dir']),
                         'Expected a part directory for the build1 part')
 
-        self.verify_state('build1', parts[1]['state_dir'], 'build')
+        self.verify_state('build1', 'build')
 
         for i in [0, 2]:
             self.assertFalse(os.path.exists(parts[i]['part_dir']),
                              'Pulled wrong part')
-            self.assertFalse(os.path.exists(parts[i]['state_dir']),
-                             'Expected for only to be a state file for build1')
+            self.assert_no_state('build{}'.format(i))
@@ -45,10 +45,8 @@ parts:
         parts = []
         for i in range(n):
             part_dir = os.path.join(self.parts_dir, 'prime{}'.format(i))
-            state_dir = os.path.join(part_dir, 'state')
             parts.append({
                 'part_dir': part_dir,
-                'state_dir': state_dir,
             })
 
         return parts
@@ -86,7 +84,7 @@ parts:
         self.assertTrue(os.path.exists(parts[0]['part_dir']),
                         'Expected a part directory for the build0 part')
 
-        self.verify_state('build0', parts[0]['state_dir'], 'prime')
+        self.verify_state('prime0', 'prime')
 
     def test_prime_one_part_only_from_3(self):
         fake_logger = fixtures.FakeLogger(level=logging.ERROR)
@@ -108,13 +106,12 @@ parts:
         self.assertTrue(os.path.exists(parts[1]['part_dir']),
                         'Expected a part directory for the prime1 part')
 
-        self.verify_state('prime1', parts[1]['state_dir'], 'prime')
+        self.verify_state('prime1', 'prime')
 
         for i in [0, 2]:
             self.assertFalse(os.path.exists(parts[i]['part_dir']),
                              'Pulled wrong part')
-            self.assertFalse(os.path.exists(parts[i]['state_dir']),
-                             'Expected for only to be a state file for build1')
+            self.assert_no_state('prime{}'.format(i))
 
     def test_prime_ran_twice_is_a_noop(self):
         fake_logger = fixtures.FakeLogger(level=logging.INFO)
@@ -139,7 +136,7 @@ parts:
         self.assertTrue(os.path.exists(parts[0]['part_dir']),
                         'Expected a part directory for the build0 part')
 
-        self.verify_state('build0', parts[0]['state_dir'], 'prime')
+        self.verify_state('prime0', 'prime')
 
         fake_logger = fixtures.FakeLogger(level=logging.INFO)
         self.useFixture(fake_logger)
@@ -14,6 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import hashlib
 import logging
 import os
 import os.path
@@ -21,7 +22,6 @@ from unittest import mock
 
 import fixtures
 
-import snapcraft
 from snapcraft.main import main
 from snapcraft import tests
 
@@ -57,10 +57,8 @@ parts:
         parts = []
         for i in range(n):
             part_dir = os.path.join(self.parts_dir, 'pull{}'.format(i))
-            state_dir = os.path.join(part_dir, 'state')
             parts.append({
                 'part_dir': part_dir,
-                'state_dir': state_dir,
             })
 
         return parts
@@ -89,7 +87,7 @@ parts:
         self.assertTrue(os.path.exists(parts[0]['part_dir']),
                         'Expected a part directory for the pull0 part')
 
-        self.verify_state('pull0', parts[0]['state_dir'], 'pull')
+        self.verify_state('pull0', 'pull')
 
     def test_pull_one_part_only_from_3(self):
         parts = self.make_snapcraft_yaml(n=3)
@@ -101,59 +99,95 @@ parts:
         self.assertTrue(os.path.exists(parts[1]['part_dir']),
                         'Expected a part directory for the pull1 part')
 
-        self.verify_state('pull1', parts[1]['state_dir'], 'pull')
+        self.verify_state('pull1', 'pull')
 
         for i in [0, 2]:
             self.assertFalse(os.path.exists(parts[i]['part_dir']),
                              'Pulled wrong part')
-            self.assertFalse(os.path.exists(parts[i]['state_dir']),
-                             'Expected for only to be a state file for pull1')
+            self.assert_no_state('pull{}'.format(i))
 
+    @mock.patch('snapcraft.repo._get_sources_list')
     @mock.patch('snapcraft.repo._setup_apt_cache')
-    @mock.patch('snapcraft.repo.Ubuntu.get')
+    @mock.patch('snapcraft.repo._update_apt_cache')
     @mock.patch('snapcraft.repo.Ubuntu.unpack')
-    def test_pull_stage_packages_without_geoip(self, mock_get, mock_ubpack,
-                                               mock_setup_apt_cache):
+    def test_pull_stage_packages_without_geoip(self, mock_ubpack,
+                                               mock_update_apt_cache,
+                                               mock_setup_apt_cache,
+                                               mock_get_sources_list):
         yaml_part = """  pull{:d}:
         plugin: nil
         stage-packages: ['mir']"""
 
         self.make_snapcraft_yaml(n=3, yaml_part=yaml_part)
 
-        project_options = mock.Mock(spec=snapcraft.ProjectOptions)
-        mock_apt_cache = mock.Mock()
+        mock_get_sources_list.return_value = 'sources'
+        mock_apt_cache = mock.MagicMock()
         mock_apt_progress = mock.Mock()
         mock_setup_apt_cache.return_value = (mock_apt_cache, mock_apt_progress)
 
         project_options = main(['pull', 'pull1'])
 
         self.assertFalse(project_options.use_geoip)
-        mock_setup_apt_cache.assert_called_once_with(
-            os.path.join(self.parts_dir, 'pull1', 'ubuntu'),
+        mock_get_sources_list.assert_called_once_with(
             [],                # no sources
             project_options,   # use_geoip is False
         )
+        mock_setup_apt_cache.assert_called_once_with(
+            self.get_apt_dir('sources'), 'sources')
 
+    @mock.patch('snapcraft.repo._get_sources_list')
     @mock.patch('snapcraft.repo._setup_apt_cache')
-    @mock.patch('snapcraft.repo.Ubuntu.get')
+    @mock.patch('snapcraft.repo._update_apt_cache')
     @mock.patch('snapcraft.repo.Ubuntu.unpack')
-    def test_pull_stage_packages_with_geoip(self, mock_get, mock_ubpack,
-                                            mock_setup_apt_cache):
+    def test_pull_stage_packages_with_geoip(self, mock_ubpack,
+                                            mock_update_apt_cache,
+                                            mock_setup_apt_cache,
+                                            mock_get_sources_list):
         yaml_part = """  pull{:d}:
         plugin: nil
         stage-packages: ['mir']"""
 
         self.make_snapcraft_yaml(n=3, yaml_part=yaml_part)
 
-        mock_apt_cache = mock.Mock()
+        mock_get_sources_list.return_value = 'geoip sources'
+        mock_apt_cache = mock.MagicMock()
         mock_apt_progress = mock.Mock()
         mock_setup_apt_cache.return_value = (mock_apt_cache, mock_apt_progress)
 
         project_options = main(['pull', 'pull1', '--enable-geoip'])
 
         self.assertTrue(project_options.use_geoip)
-        mock_setup_apt_cache.assert_called_once_with(
-            os.path.join(self.parts_dir, 'pull1', 'ubuntu'),
+        mock_get_sources_list.assert_called_once_with(
             [],                # no sources
-            project_options,   # use_geoip is False
+            project_options,   # use_geoip is True
         )
+        mock_setup_apt_cache.assert_called_once_with(
+            self.get_apt_dir('geoip sources'), 'geoip sources')
+
+    @mock.patch('snapcraft.repo._get_sources_list')
+    @mock.patch('snapcraft.repo._setup_apt_cache')
+    @mock.patch('snapcraft.repo._update_apt_cache')
+    @mock.patch('snapcraft.repo.Ubuntu.unpack')
+    def test_parts_share_the_apt_cache(self, mock_ubpack,
+                                       mock_update_apt_cache,
+                                       mock_setup_apt_cache,
+                                       mock_get_sources_list):
+        yaml_part = """  pull{:d}:
+        plugin: nil
+        stage-packages: ['mir']"""
+
+        self.make_snapcraft_yaml(n=3, yaml_part=yaml_part)
+
+        mock_get_sources_list.return_value = 'sources'
+        mock_setup_apt_cache.return_value = (mock.MagicMock(), mock.Mock())
+
+        main(['pull'])
+
+        mock_setup_apt_cache.assert_called_once_with(
+            self.get_apt_dir('sources'), 'sources')
+        self.assertEqual(1, mock_update_apt_cache.call_count)
+
+    def get_apt_dir(self, sources):
+        return os.path.join(
+            self.parts_dir, '.ubuntu',
+            hashlib.sha256(sources.encode()).hexdigest()[:16])
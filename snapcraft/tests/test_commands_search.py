@@ -85,3 +85,27 @@ curl       test entry for curl
 curl       test entry for curl
 """
         self.assertEqual(fake_terminal.getvalue(), expected_output)
+
+    def test_search_by_plugin(self):
+        fake_terminal = fixture_setup.FakeTerminal()
+        self.useFixture(fake_terminal)
+
+        main.main(['search', '--plugin', 'go'])
+
+        output = fake_terminal.getvalue()
+        self.assertIn('part1', output)
+        self.assertIn('long-described-part', output)
+        self.assertNotIn('curl', output)
+
+    def test_search_by_maintainer(self):
+        self.useFixture(fixture_setup.FakeTerminal())
+
+        fake_logger = fixtures.FakeLogger(level=logging.INFO)
+        self.useFixture(fake_logger)
+
+        main.main(['search', 'curl', '--maintainer', 'someone'])
+
+        self.assertEqual(
+            fake_logger.output,
+            'No matches found, try to run `snapcraft update` to refresh the '
+            'remote parts cache.\n')
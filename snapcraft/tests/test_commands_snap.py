@@ -88,7 +88,7 @@ parts:
         self.assertTrue(os.path.exists(self.stage_dir),
                         'Expected a stage directory')
 
-        self.verify_state('part1', self.state_dir, 'prime')
+        self.verify_state('part1', 'prime')
 
         self.popen_spy.assert_called_once_with([
             'mksquashfs', self.snap_dir, 'snap-test_1.0_amd64.snap',
@@ -117,7 +117,7 @@ parts:
         self.assertTrue(os.path.exists(self.stage_dir),
                         'Expected a stage directory')
 
-        self.verify_state('part1', self.state_dir, 'prime')
+        self.verify_state('part1', 'prime')
 
         self.popen_spy.assert_called_once_with([
             'mksquashfs', self.snap_dir, 'snap-test_1.0_amd64.snap',
@@ -147,7 +147,7 @@ parts:
         self.assertTrue(os.path.exists(self.stage_dir),
                         'Expected a stage directory')
 
-        self.verify_state('part1', self.state_dir, 'prime')
+        self.verify_state('part1', 'prime')
 
         self.popen_spy.assert_called_once_with([
             'mksquashfs', self.snap_dir, 'snap-test_1.0_amd64.snap',
@@ -282,7 +282,7 @@ type: os
         self.assertTrue(os.path.exists(self.stage_dir),
                         'Expected a stage directory')
 
-        self.verify_state('part1', self.state_dir, 'prime')
+        self.verify_state('part1', 'prime')
 
         self.popen_spy.assert_called_once_with([
             'mksquashfs', self.snap_dir, 'mysnap.snap',
@@ -14,8 +14,11 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import collections
 import os
 import re
+import shutil
+from unittest import mock
 
 from snapcraft.internal import common
 from snapcraft import tests
@@ -83,6 +86,224 @@ class CommonTestCase(tests.TestCase):
                 with open(file_info['path'], 'r') as f:
                     self.assertEqual(f.read(), file_info['expected'])
 
+    def test_replace_in_file_leaves_hard_links_alone(self):
+        os.makedirs('bin')
+        with open('python', 'w') as f:
+            f.write('#!/foo/bar/baz/python')
+        os.link('python', os.path.join('bin', 'python'))
+
+        common.replace_in_file('bin', re.compile(r''),
+                               re.compile(r'#!.*python'),
+                               r'#!/usr/bin/env python')
+
+        with open(os.path.join('bin', 'python')) as f:
+            self.assertEqual('#!/usr/bin/env python', f.read())
+        with open('python') as f:
+            self.assertEqual('#!/foo/bar/baz/python', f.read())
+
+    def test_search_and_replace_contents_through_symlink(self):
+        with open('python', 'w') as f:
+            f.write('#!/foo/bar/baz/python')
+        os.link('python', 'linked-python')
+        os.symlink('python', 'symlink')
+
+        common.search_and_replace_contents(
+            'symlink', re.compile(r'#!.*python'), r'#!/usr/bin/env python')
+
+        self.assertEqual('python', os.readlink('symlink'))
+        with open('python') as f:
+            self.assertEqual('#!/usr/bin/env python', f.read())
+        with open('linked-python') as f:
+            self.assertEqual('#!/foo/bar/baz/python', f.read())
+
+
+class CloneOrCopyTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        with open('source', 'w') as f:
+            f.write('contents')
+        os.chmod('source', 0o755)
+        os.utime('source', ns=(0, 0))
+
+    def _assert_copied(self):
+        self.assertFalse(os.path.samefile('source', 'destination'))
+        with open('destination') as f:
+            self.assertEqual('contents', f.read())
+        st = os.stat('destination')
+        self.assertEqual(0o755, st.st_mode & 0o777)
+        self.assertEqual(0, st.st_mtime_ns)
+
+    @mock.patch('fcntl.ioctl')
+    def test_clone(self, mock_ioctl):
+        def clone(fd, request, source_fd):
+            # Stand in for a filesystem supporting reflinks.
+            os.write(fd, os.pread(source_fd, 100, 0))
+        mock_ioctl.side_effect = clone
+
+        common.clone_or_copy('source', 'destination')
+
+        self.assertEqual(common._FICLONE, mock_ioctl.call_args[0][1])
+        self._assert_copied()
+
+    @mock.patch('fcntl.ioctl')
+    def test_copy_if_clone_is_not_supported(self, mock_ioctl):
+        mock_ioctl.side_effect = OSError(95, 'Operation not supported')
+
+        common.clone_or_copy('source', 'destination')
+
+        self._assert_copied()
+
+    @mock.patch('fcntl.ioctl')
+    def test_symlinks_are_not_cloned(self, mock_ioctl):
+        os.symlink('source', 'link')
+
+        common.clone_or_copy('link', 'destination')
+
+        mock_ioctl.assert_not_called()
+        self.assertEqual('source', os.readlink('destination'))
+
+    @mock.patch('fcntl.ioctl')
+    def test_in_kernel_copy_if_clone_is_not_supported(self, mock_ioctl):
+        mock_ioctl.side_effect = OSError(95, 'Operation not supported')
+        stats = common.get_copy_stats()
+
+        common.clone_or_copy('source', 'destination')
+
+        self._assert_copied()
+        self.assertEqual({'in-kernel copy': 1},
+                         common.get_copy_stats() - stats)
+
+    @mock.patch('fcntl.ioctl')
+    def test_clone_is_not_tried_again_if_not_supported(self, mock_ioctl):
+        mock_ioctl.side_effect = OSError(95, 'Operation not supported')
+
+        common.clone_or_copy('source', 'destination')
+        common.clone_or_copy('source', 'other-destination')
+
+        self.assertEqual(1, mock_ioctl.call_count)
+
+    @mock.patch('fcntl.ioctl')
+    def test_copy_if_nothing_else_is_supported(self, mock_ioctl):
+        mock_ioctl.side_effect = OSError(95, 'Operation not supported')
+        stats = common.get_copy_stats()
+
+        with mock.patch('os.copy_file_range', create=True,
+                        side_effect=OSError(38, 'Function not implemented')):
+            common.clone_or_copy('source', 'destination')
+
+        self._assert_copied()
+        self.assertEqual({'copy': 1}, common.get_copy_stats() - stats)
+
+    @mock.patch('fcntl.ioctl')
+    def test_invalid_argument_only_falls_back_for_the_file(self, mock_ioctl):
+        mock_ioctl.side_effect = OSError(95, 'Operation not supported')
+
+        with mock.patch('os.copy_file_range', create=True,
+                        side_effect=OSError(22, 'Invalid argument')) as \
+                copy_mock:
+            common.clone_or_copy('source', 'destination')
+            common.clone_or_copy('source', 'other-destination')
+
+        self._assert_copied()
+        self.assertEqual(2, copy_mock.call_count)
+
+    @mock.patch('fcntl.ioctl')
+    def test_short_copy_in_kernel_is_copied_again(self, mock_ioctl):
+        mock_ioctl.side_effect = OSError(95, 'Operation not supported')
+        stats = common.get_copy_stats()
+
+        with mock.patch('os.copy_file_range', create=True, return_value=0):
+            common.clone_or_copy('source', 'destination')
+
+        self._assert_copied()
+        self.assertEqual({'copy': 1}, common.get_copy_stats() - stats)
+
+
+class LinkOrCopyTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        with open('source', 'w') as f:
+            f.write('contents')
+
+    def test_link(self):
+        stats = common.get_copy_stats()
+
+        common.link_or_copy('source', 'destination')
+
+        self.assertTrue(os.path.samefile('source', 'destination'))
+        self.assertEqual({'hard link': 1}, common.get_copy_stats() - stats)
+
+    @mock.patch('os.link')
+    @mock.patch('fcntl.ioctl')
+    def test_clone_if_link_is_not_supported(self, mock_ioctl, mock_link):
+        mock_link.side_effect = OSError(18, 'Invalid cross-device link')
+        stats = common.get_copy_stats()
+
+        common.link_or_copy('source', 'destination')
+
+        mock_ioctl.assert_called_once_with(
+            mock.ANY, common._FICLONE, mock.ANY)
+        self.assertEqual({'reflink': 1}, common.get_copy_stats() - stats)
+
+    @mock.patch('os.link')
+    def test_link_is_not_tried_again_if_not_supported(self, mock_link):
+        mock_link.side_effect = OSError(18, 'Invalid cross-device link')
+
+        common.link_or_copy('source', 'destination')
+        common.link_or_copy('source', 'other-destination')
+
+        self.assertEqual(1, mock_link.call_count)
+        with open('other-destination') as f:
+            self.assertEqual('contents', f.read())
+
+    @mock.patch('os.link')
+    def test_link_is_tried_again_if_denied(self, mock_link):
+        mock_link.side_effect = OSError(1, 'Operation not permitted')
+
+        common.link_or_copy('source', 'destination')
+        common.link_or_copy('source', 'other-destination')
+
+        self.assertEqual(2, mock_link.call_count)
+
+    def test_link_is_not_tried_again_for_the_same_filesystems_only(self):
+        os.mkdir('elsewhere')
+        with mock.patch('os.link') as mock_link:
+            mock_link.side_effect = OSError(18, 'Invalid cross-device link')
+            with mock.patch('snapcraft.internal.common._get_device',
+                            side_effect=lambda d: d):
+                common.link_or_copy('source', 'destination')
+                common.link_or_copy('source', 'elsewhere/destination')
+
+        self.assertEqual(2, mock_link.call_count)
+
+    @mock.patch('os.link')
+    def test_symlinks_are_created_again_if_link_fails(self, mock_link):
+        mock_link.side_effect = OSError(18, 'Invalid cross-device link')
+        os.symlink('source', 'link')
+
+        common.link_or_copy('link', 'destination')
+
+        self.assertEqual('source', os.readlink('destination'))
+
+    def test_file_is_not_copied_onto_itself(self):
+        os.link('source', 'destination')
+
+        self.assertRaises(shutil.SameFileError, common.link_or_copy,
+                          'source', 'destination')
+
+        with open('source') as f:
+            self.assertEqual('contents', f.read())
+
+    def test_format_copy_stats(self):
+        self.assertEqual(
+            'hard link: 3, copy: 1',
+            common.format_copy_stats(
+                collections.Counter({'copy': 1, 'hard link': 3})))
+
 
 class CommonMigratedTestCase(tests.TestCase):
 
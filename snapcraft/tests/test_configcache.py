@@ -0,0 +1,155 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from unittest import mock
+
+import snapcraft
+from snapcraft.internal import configcache
+from snapcraft.internal import yaml as internal_yaml
+from snapcraft import tests
+
+
+class ComputeKeyTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.make_snapcraft_yaml('name: test\n')
+        self.key = configcache.compute_key(
+            'snapcraft.yaml', self.local_plugins_dir)
+
+    def test_key_is_stable(self):
+        self.assertEqual(self.key, configcache.compute_key(
+            'snapcraft.yaml', self.local_plugins_dir))
+
+    def test_key_changes_with_snapcraft_yaml(self):
+        self.make_snapcraft_yaml('name: other\n')
+
+        self.assertNotEqual(self.key, configcache.compute_key(
+            'snapcraft.yaml', self.local_plugins_dir))
+
+    def test_key_changes_with_local_plugins(self):
+        os.makedirs(self.local_plugins_dir)
+        with open(os.path.join(self.local_plugins_dir, 'x_foo.py'), 'w') as f:
+            f.write('pass\n')
+
+        self.assertNotEqual(self.key, configcache.compute_key(
+            'snapcraft.yaml', self.local_plugins_dir))
+
+
+class LoadTestCase(tests.TestCase):
+
+    def test_round_trip(self):
+        configcache.save('key', {'data': {'name': 'test'}})
+
+        self.assertEqual({'data': {'name': 'test'}},
+                         configcache.load('key'))
+
+    def test_other_key_misses(self):
+        configcache.save('key', {'data': {'name': 'test'}})
+
+        self.assertIsNone(configcache.load('other-key'))
+
+    def test_missing_icon_misses(self):
+        open('icon.png', 'w').close()
+        configcache.save('key', {'data': {'icon': 'icon.png'}})
+        self.assertIsNotNone(configcache.load('key'))
+
+        os.remove('icon.png')
+
+        self.assertIsNone(configcache.load('key'))
+
+    def test_corrupt_entry_misses(self):
+        configcache.save('key', {'data': {}})
+        with open(configcache._get_entry_path(), 'wb') as f:
+            f.write(b'garbage')
+
+        self.assertIsNone(configcache.load('key'))
+
+
+class ConfigTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.make_snapcraft_yaml("""name: test
+version: "1"
+summary: test
+description: test
+confinement: strict
+
+parts:
+  part1:
+    plugin: nil
+  part2:
+    plugin: nil
+    after: [part1]
+""")
+
+    def test_cached_configuration_is_not_validated_again(self):
+        config = internal_yaml.Config()
+
+        with mock.patch('snapcraft._schema.Validator.validate') as \
+                validate_mock:
+            cached_config = internal_yaml.Config()
+
+        self.assertFalse(validate_mock.called)
+        self.assertEqual(config.data, cached_config.data)
+        self.assertEqual(['part1', 'part2'],
+                         [p.name for p in cached_config.all_parts])
+        self.assertEqual(['part1'],
+                         [p.name for p in cached_config.all_parts[1].deps])
+
+    def test_changed_snapcraft_yaml_is_validated(self):
+        internal_yaml.Config()
+        with open('snapcraft.yaml', 'a') as f:
+            f.write('  part3:\n    plugin: nil\n')
+
+        with mock.patch('snapcraft._schema.Validator.validate') as \
+                validate_mock:
+            config = internal_yaml.Config()
+
+        self.assertTrue(validate_mock.called)
+        self.assertIn('part3', [p.name for p in config.all_parts])
+
+    def test_upgraded_snapcraft_is_validated(self):
+        internal_yaml.Config()
+        package_dir = os.path.dirname(snapcraft.__file__)
+        real_stat = os.stat
+
+        def stat(path, *args, **kwargs):
+            st = real_stat(path, *args, **kwargs)
+            if path == os.path.join(package_dir, '_schema.py'):
+                return os.stat_result(st[:8] + (0, 0))
+            return st
+
+        with mock.patch('os.stat', side_effect=stat):
+            with mock.patch('snapcraft._schema.Validator.validate') as \
+                    validate_mock:
+                internal_yaml.Config()
+
+        self.assertTrue(validate_mock.called)
+
+    def test_cached_build_tools(self):
+        with open('snapcraft.yaml', 'a') as f:
+            f.write('build-packages: [foo]\n')
+        config = internal_yaml.Config()
+
+        cached_config = internal_yaml.Config()
+
+        self.assertEqual(config.build_tools, cached_config.build_tools)
+        self.assertEqual(['foo'], cached_config.data['build-packages'])
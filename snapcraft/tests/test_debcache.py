@@ -0,0 +1,154 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import os
+
+import fixtures
+
+from snapcraft.internal import debcache
+from snapcraft import tests
+
+
+class DebCacheTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.cache = debcache.DebCache(max_size=10)
+
+    def make_deb(self, name, content):
+        with open(name, 'wb') as f:
+            f.write(content)
+        return hashlib.sha256(content).hexdigest()
+
+    def test_restore_missing_archive(self):
+        self.assertFalse(self.cache.restore('missing', 'foo.deb'))
+        self.assertFalse(os.path.exists('foo.deb'))
+
+    def test_save_and_restore(self):
+        sha256 = self.make_deb('foo.deb', b'foo')
+
+        self.cache.save(sha256, 'foo.deb')
+
+        self.assertTrue(self.cache.restore(sha256, 'restored.deb'))
+        with open('restored.deb', 'rb') as f:
+            self.assertEqual(b'foo', f.read())
+        self.assertEqual(os.stat('foo.deb').st_ino,
+                         os.stat('restored.deb').st_ino)
+
+    def test_archive_with_another_sha256_is_not_saved(self):
+        self.make_deb('foo.deb', b'foo')
+
+        self.cache.save('0' * 64, 'foo.deb')
+
+        self.assertFalse(self.cache.restore('0' * 64, 'restored.deb'))
+
+    def test_least_recently_used_archives_are_removed(self):
+        first = self.make_deb('first.deb', b'first')
+        second = self.make_deb('second.deb', b'second')
+        third = self.make_deb('third.deb', b'third')
+        self.cache.save(first, 'first.deb')
+        self.cache.save(second, 'second.deb')
+        os.utime(os.path.join(self.cache.cache_dir, first + '.used'), (1, 1))
+        os.utime(os.path.join(self.cache.cache_dir, second + '.used'),
+                 (2, 2))
+        # Using an archive makes it the most recently used.
+        self.cache.restore(first, 'restored.deb')
+
+        self.cache.save(third, 'third.deb')
+        self.cache.trim()
+
+        self.assertEqual(
+            sorted([first, first + '.used', third, third + '.used']),
+            sorted(os.listdir(self.cache.cache_dir)))
+
+    def test_restore_leaves_linked_archives_alone(self):
+        sha256 = self.make_deb('foo.deb', b'foo')
+        self.cache.save(sha256, 'foo.deb')
+        os.utime('foo.deb', (1, 1))
+
+        self.cache.restore(sha256, 'restored.deb')
+
+        # Other parts keep the archive they downloaded as it was.
+        self.assertEqual(1, os.stat('foo.deb').st_mtime)
+
+    def test_trim_without_cache(self):
+        self.cache.trim()
+
+    def extract(self, content):
+        def extract(tree_dir):
+            self.extracted.append(content)
+            with open(os.path.join(tree_dir, 'file'), 'wb') as f:
+                f.write(content)
+            return ['file']
+        return extract
+
+    def test_tree_is_extracted_once(self):
+        self.extracted = []
+
+        for i in range(2):
+            tree_dir, paths = self.cache.get_tree('sha', self.extract(b'a'))
+
+        self.assertEqual([b'a'], self.extracted)
+        self.assertEqual(['file'], paths)
+        with open(os.path.join(tree_dir, 'file'), 'rb') as f:
+            self.assertEqual(b'a', f.read())
+
+    def test_least_recently_used_trees_are_removed(self):
+        self.extracted = []
+        first_dir, _ = self.cache.get_tree('first', self.extract(b'1234'))
+        second_dir, _ = self.cache.get_tree('second', self.extract(b'5678'))
+        os.utime(os.path.join(first_dir, '..', 'manifest.json'), (1, 1))
+        os.utime(os.path.join(second_dir, '..', 'manifest.json'), (2, 2))
+        # Using a tree makes it the most recently used.
+        self.cache.get_tree('first', self.extract(b'1234'))
+
+        self.cache.get_tree('third', self.extract(b'9012'))
+        self.cache.trim()
+
+        self.assertTrue(os.path.exists(first_dir))
+        self.assertFalse(os.path.exists(second_dir))
+        self.assertEqual([b'1234', b'5678', b'9012'], self.extracted)
+
+
+class GetCacheTestCase(tests.TestCase):
+
+    def test_default_size(self):
+        self.assertEqual(2048 * 1024 * 1024, debcache.get_cache().max_size)
+
+    def test_size_from_environment(self):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SNAPCRAFT_DEB_CACHE_SIZE', '10'))
+
+        self.assertEqual(10 * 1024 * 1024, debcache.get_cache().max_size)
+
+    def test_disabled(self):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SNAPCRAFT_DEB_CACHE_SIZE', '0'))
+
+        self.assertIsNone(debcache.get_cache())
+
+    def test_invalid_size(self):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SNAPCRAFT_DEB_CACHE_SIZE', 'big'))
+
+        with self.assertRaises(EnvironmentError) as raised:
+            debcache.get_cache()
+
+        self.assertEqual(
+            "SNAPCRAFT_DEB_CACHE_SIZE must be a number of megabytes, not "
+            "'big'", str(raised.exception))
@@ -0,0 +1,296 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import http.server
+import json
+import os
+import re
+import threading
+from unittest import mock
+
+import fixtures
+import requests
+
+from snapcraft.internal import download, indicators
+from snapcraft import tests
+
+
+_DATA = bytes(range(256)) * 8192
+
+
+class FakeFileRequestHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        if server.statuses:
+            self.send_response(server.statuses.pop(0))
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        start = 0
+        match = re.match(r'bytes=(\d+)-$', self.headers.get('Range', ''))
+        if match and self.headers.get('If-Range') == server.etag:
+            start = int(match.group(1))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes {}-{}/{}'.format(
+                start, len(_DATA) - 1, len(_DATA)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(_DATA) - start))
+        self.send_header('ETag', server.etag)
+        self.end_headers()
+
+        data = _DATA[start:]
+        if server.drops:
+            # Let the connection drop halfway through.
+            server.drops -= 1
+            data = data[:len(data) // 2]
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        # Overwritten so the test does not write to stderr.
+        pass
+
+
+class DownloadTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.useFixture(fixtures.EnvironmentVariable(
+            'no_proxy', 'localhost,127.0.0.1'))
+        self.server = http.server.HTTPServer(
+            ('127.0.0.1', 0), FakeFileRequestHandler)
+        self.server.requests = []
+        self.server.statuses = []
+        self.server.drops = 0
+        self.server.etag = '"1"'
+        server_thread = threading.Thread(target=self.server.serve_forever)
+        self.addCleanup(server_thread.join)
+        self.addCleanup(self.server.server_close)
+        self.addCleanup(self.server.shutdown)
+        server_thread.start()
+
+        self.url = 'http://127.0.0.1:{}/file.tar'.format(
+            self.server.server_port)
+
+        patcher = mock.patch('time.sleep')
+        self.sleep_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def assert_downloaded(self, path):
+        with open(path, 'rb') as f:
+            self.assertEqual(_DATA, f.read())
+        self.assertFalse(os.path.exists(path + '.partial'))
+        self.assertFalse(os.path.exists(path + '.partial.json'))
+
+    def test_download_computes_digests(self):
+        result = download.download(
+            self.url, 'file.tar', hash_names=['sha512', 'sha256'])
+
+        self.assert_downloaded('file.tar')
+        self.assertEqual({'sha512': hashlib.sha512(_DATA).hexdigest(),
+                          'sha256': hashlib.sha256(_DATA).hexdigest()},
+                         result.digests)
+        self.assertEqual('"1"', result.headers['ETag'])
+
+    def test_dropped_connection_is_resumed(self):
+        self.server.drops = 1
+
+        result = download.download(self.url, 'file.tar', hash_names=['md5'])
+
+        self.assert_downloaded('file.tar')
+        self.assertEqual(hashlib.md5(_DATA).hexdigest(), result.digests['md5'])
+        self.assertEqual(2, len(self.server.requests))
+        self.assertEqual('bytes={}-'.format(len(_DATA) // 2),
+                         self.server.requests[1]['Range'])
+        self.sleep_mock.assert_called_once_with(1)
+
+    def test_partial_download_of_previous_run_is_resumed(self):
+        with open('file.tar.partial', 'wb') as f:
+            f.write(_DATA[:1000])
+        with open('file.tar.partial.json', 'w') as f:
+            json.dump({'url': self.url, 'validator': '"1"'}, f)
+
+        result = download.download(self.url, 'file.tar', hash_names=['md5'])
+
+        self.assert_downloaded('file.tar')
+        self.assertEqual(hashlib.md5(_DATA).hexdigest(), result.digests['md5'])
+        self.assertEqual('bytes=1000-', self.server.requests[0]['Range'])
+
+    def test_partial_download_of_changed_file_is_replaced(self):
+        with open('file.tar.partial', 'wb') as f:
+            f.write(b'old data')
+        with open('file.tar.partial.json', 'w') as f:
+            json.dump({'url': self.url, 'validator': '"0"'}, f)
+
+        download.download(self.url, 'file.tar')
+
+        self.assert_downloaded('file.tar')
+
+    def test_partial_download_without_validator_is_not_resumed(self):
+        with open('file.tar.partial', 'wb') as f:
+            f.write(b'old data')
+
+        download.download(self.url, 'file.tar')
+
+        self.assert_downloaded('file.tar')
+        self.assertNotIn('Range', self.server.requests[0])
+
+    def test_server_errors_are_retried_with_backoff(self):
+        self.server.statuses = [503, 502]
+
+        download.download(self.url, 'file.tar')
+
+        self.assert_downloaded('file.tar')
+        self.assertEqual([mock.call(1), mock.call(2)],
+                         self.sleep_mock.call_args_list)
+
+    def test_unsatisfiable_range_is_retried(self):
+        with open('file.tar.partial', 'wb') as f:
+            f.write(_DATA[:10])
+        with open('file.tar.partial.json', 'w') as f:
+            json.dump({'url': self.url, 'validator': '"1"'}, f)
+        self.server.statuses = [416]
+
+        download.download(self.url, 'file.tar')
+
+        self.assert_downloaded('file.tar')
+        self.assertNotIn('Range', self.server.requests[1])
+
+    def test_unsatisfiable_range_without_partial_file_is_retried(self):
+        self.server.statuses = [416]
+
+        download.download(self.url, 'file.tar')
+
+        self.assert_downloaded('file.tar')
+
+    def test_persistent_failure_raises(self):
+        self.server.statuses = [503] * 5
+
+        with self.assertRaises(download.DownloadError) as raised:
+            download.download(self.url, 'file.tar')
+
+        self.assertIn('after 5 attempts', str(raised.exception))
+        self.assertFalse(os.path.exists('file.tar'))
+
+    def test_client_errors_are_not_retried(self):
+        self.server.statuses = [404]
+
+        with self.assertRaises(requests.HTTPError):
+            download.download(self.url, 'file.tar')
+
+        self.assertEqual(1, len(self.server.requests))
+
+    def test_not_modified(self):
+        self.server.statuses = [304]
+
+        self.assertIsNone(download.download(
+            self.url, 'file.tar', headers={'If-None-Match': '"1"'}))
+        self.assertFalse(os.path.exists('file.tar'))
+
+    def test_digests_are_saved(self):
+        download.download(self.url, 'file.tar', hash_names=['sha512'])
+
+        with mock.patch('snapcraft.internal.download._update_hashes') as \
+                update_mock:
+            digests = download.get_digests('file.tar', ['sha512'])
+        self.assertFalse(update_mock.called)
+        self.assertEqual(
+            {'sha512': hashlib.sha512(_DATA).hexdigest()}, digests)
+
+    def test_digest_mismatch_raises(self):
+        with open('file.tar', 'wb') as f:
+            f.write(b'previous')
+
+        with self.assertRaises(download.DigestMismatchError) as raised:
+            download.download(self.url, 'file.tar',
+                              expected_digests={'sha512': 'abc'})
+
+        self.assertEqual(hashlib.sha512(_DATA).hexdigest(),
+                         raised.exception.actual)
+        with open('file.tar', 'rb') as f:
+            self.assertEqual(b'previous', f.read())
+        self.assertFalse(os.path.exists('file.tar.partial'))
+
+    def test_corrupted_partial_download_is_downloaded_again(self):
+        with open('file.tar.partial', 'wb') as f:
+            f.write(b'x' * 1000)
+        with open('file.tar.partial.json', 'w') as f:
+            json.dump({'url': self.url, 'validator': '"1"'}, f)
+
+        result = download.download(
+            self.url, 'file.tar',
+            expected_digests={'sha512': hashlib.sha512(_DATA).hexdigest()})
+
+        self.assert_downloaded('file.tar')
+        self.assertEqual(hashlib.sha512(_DATA).hexdigest(),
+                         result.digests['sha512'])
+        self.assertEqual(2, len(self.server.requests))
+        self.assertNotIn('Range', self.server.requests[1])
+
+    def test_session_is_shared(self):
+        self.assertIs(download.get_session(), download.get_session())
+
+
+class GetDigestsTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        with open('file', 'wb') as f:
+            f.write(b'data')
+
+    def test_digests_are_computed_once(self):
+        self.assertEqual({'md5': hashlib.md5(b'data').hexdigest()},
+                         download.get_digests('file', ['md5']))
+
+        with mock.patch('snapcraft.internal.download._update_hashes') as \
+                update_mock:
+            self.assertEqual({'md5': hashlib.md5(b'data').hexdigest()},
+                             download.get_digests('file', ['md5']))
+        self.assertFalse(update_mock.called)
+
+    def test_changed_file_is_hashed_again(self):
+        download.get_digests('file', ['md5'])
+        with open('file', 'ab') as f:
+            f.write(b' and more')
+
+        self.assertEqual({'md5': hashlib.md5(b'data and more').hexdigest()},
+                         download.get_digests('file', ['md5']))
+
+    def test_missing_file_raises(self):
+        with self.assertRaises(FileNotFoundError):
+            download.get_digests('missing', ['md5'])
+
+
+class DownloadProgressTestCase(tests.TestCase):
+
+    @mock.patch('time.monotonic')
+    def test_updates_are_rate_limited(self, monotonic_mock):
+        monotonic_mock.return_value = 10
+        progress = indicators.DownloadProgress('Downloading', 100)
+        with mock.patch.object(progress._progress_bar, 'update') as update:
+            progress.start()
+            for read in range(1, 50):
+                progress.update(read)
+            monotonic_mock.return_value = 10.5
+            progress.update(50)
+            progress.update(200)
+
+        self.assertEqual([mock.call(0), mock.call(50)],
+                         update.call_args_list)
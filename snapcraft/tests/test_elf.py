@@ -0,0 +1,247 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import struct
+from unittest import mock
+
+from snapcraft.internal import elf
+from snapcraft import tests
+
+
+_X86_64 = 62
+_ARMHF = 40
+_VADDR = 0x400000
+
+
+def make_elf(path, needed=(), interpreter=None, soname=None, rpath=None,
+             runpath=None, machine=_X86_64, bits=64, little_endian=True,
+             flags=0):
+    """Write a minimal ELF file with a dynamic section to path."""
+    endian = '<' if little_endian else '>'
+    if bits == 64:
+        header_format, ph_format, dyn_format = ('HHIQQQIHHHHHH', 'IIQQQQQQ',
+                                                'qQ')
+    else:
+        header_format, ph_format, dyn_format = ('HHIIIIIHHHHHH', 'IIIIIIII',
+                                                'iI')
+    header_size = 16 + struct.calcsize(header_format)
+    ph_size = struct.calcsize(ph_format)
+    phnum = 3 if interpreter else 2
+
+    strtab = b'\0'
+    offsets = {}
+    strings = list(needed) + [s for s in (soname, rpath, runpath) if s]
+    for string in strings:
+        offsets[string] = len(strtab)
+        strtab += string.encode() + b'\0'
+    interp = (interpreter.encode() + b'\0') if interpreter else b''
+
+    interp_offset = header_size + phnum * ph_size
+    strtab_offset = interp_offset + len(interp)
+    dynamic_offset = strtab_offset + len(strtab)
+
+    entries = [(1, offsets[n]) for n in needed]
+    for tag, value in ((14, soname), (15, rpath), (29, runpath)):
+        if value:
+            entries.append((tag, offsets[value]))
+    entries.append((5, _VADDR + strtab_offset))
+    entries.append((0, 0))
+    dynamic = b''.join(struct.pack(endian + dyn_format, *e) for e in entries)
+    size = dynamic_offset + len(dynamic)
+
+    def program_header(p_type, offset, filesz, vaddr):
+        if bits == 64:
+            return struct.pack(endian + ph_format, p_type, 4, offset, vaddr,
+                               vaddr, filesz, filesz, 8)
+        return struct.pack(endian + ph_format, p_type, offset, vaddr, vaddr,
+                           filesz, filesz, 4, 4)
+
+    program_headers = program_header(1, 0, size, _VADDR)
+    if interpreter:
+        program_headers += program_header(
+            3, interp_offset, len(interp), _VADDR + interp_offset)
+    program_headers += program_header(
+        2, dynamic_offset, len(dynamic), _VADDR + dynamic_offset)
+
+    ident = b'\x7fELF' + bytes([1 if bits == 32 else 2,
+                                1 if little_endian else 2, 1]) + bytes(9)
+    header = ident + struct.pack(
+        endian + header_format, 3, machine, 1, 0, header_size, 0, flags,
+        header_size, ph_size, phnum, 0, 0, 0)
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(header + program_headers + interp + strtab + dynamic)
+
+
+class ReadTestCase(tests.TestCase):
+
+    scenarios = [
+        ('64-bit little endian', dict(bits=64, little_endian=True)),
+        ('32-bit little endian', dict(bits=32, little_endian=True)),
+        ('64-bit big endian', dict(bits=64, little_endian=False)),
+        ('32-bit big endian', dict(bits=32, little_endian=False)),
+    ]
+
+    def test_read(self):
+        make_elf('bin/foo', needed=['libfoo.so.1', 'libbar.so.2'],
+                 interpreter='/lib/ld.so', soname='foo.so', rpath='$ORIGIN/a',
+                 runpath='/b:${ORIGIN}/../c', bits=self.bits,
+                 little_endian=self.little_endian)
+
+        elf_file = elf.read('bin/foo')
+
+        origin = os.path.abspath('bin')
+        self.assertEqual(['libfoo.so.1', 'libbar.so.2'], elf_file.needed)
+        self.assertEqual('/lib/ld.so', elf_file.interpreter)
+        self.assertEqual('foo.so', elf_file.soname)
+        self.assertEqual([origin + '/a'], elf_file.rpath)
+        self.assertEqual(['/b', origin + '/../c'], elf_file.runpath)
+        self.assertEqual('x86_64-linux-gnu', elf_file.triplet)
+
+
+class ReadErrorsTestCase(tests.TestCase):
+
+    def test_not_elf(self):
+        with open('foo', 'w') as f:
+            f.write('#!/bin/sh\necho this is not an ELF file\n')
+
+        self.assertRaises(elf.ElfError, elf.read, 'foo')
+
+    def test_empty(self):
+        open('foo', 'w').close()
+
+        self.assertRaises(elf.ElfError, elf.read, 'foo')
+
+    def test_truncated(self):
+        make_elf('foo', needed=['libfoo.so.1'])
+        with open('foo', 'r+b') as f:
+            f.truncate(80)
+
+        self.assertRaises(elf.ElfError, elf.read, 'foo')
+
+    def test_armhf_triplet(self):
+        make_elf('foo', machine=_ARMHF, bits=32, flags=0x5000400)
+
+        self.assertEqual('arm-linux-gnueabihf', elf.read('foo').triplet)
+
+
+class GetDependenciesTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        patcher = mock.patch('snapcraft.internal.elf._get_system_dirs')
+        self.get_system_dirs_mock = patcher.start()
+        self.get_system_dirs_mock.return_value = [os.path.abspath('system')]
+        self.addCleanup(patcher.stop)
+
+        patcher = mock.patch.multiple(
+            'snapcraft.internal.elf', _elf_files={}, _resolved={})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_needed_libraries_are_found_recursively(self):
+        make_elf('bin/foo', needed=['libfoo.so.1'], interpreter='/lib/ld.so')
+        make_elf('system/libfoo.so.1', needed=['libbar.so.2', 'ld.so'])
+        make_elf('system/libbar.so.2')
+
+        self.assertEqual(
+            [os.path.abspath('system/libfoo.so.1'),
+             os.path.abspath('system/libbar.so.2')],
+            elf.get_dependencies('bin/foo'))
+
+    def test_missing_libraries_are_skipped(self):
+        make_elf('bin/foo', needed=['libmissing.so.1', 'libfoo.so.1'])
+        make_elf('system/libfoo.so.1')
+
+        self.assertEqual([os.path.abspath('system/libfoo.so.1')],
+                         elf.get_dependencies('bin/foo'))
+
+    def test_library_path_comes_before_system_dirs(self):
+        make_elf('bin/foo', needed=['libfoo.so.1'])
+        make_elf('system/libfoo.so.1')
+        make_elf('stage/lib/libfoo.so.1')
+
+        self.assertEqual(
+            [os.path.abspath('stage/lib/libfoo.so.1')],
+            elf.get_dependencies('bin/foo', [os.path.abspath('stage/lib')]))
+
+    def test_rpath_comes_before_library_path(self):
+        make_elf('bin/foo', needed=['libfoo.so.1'], rpath='$ORIGIN/../lib')
+        make_elf('lib/libfoo.so.1')
+        make_elf('stage/lib/libfoo.so.1')
+
+        self.assertEqual(
+            [os.path.join(os.path.abspath('bin'), '..', 'lib', 'libfoo.so.1')],
+            elf.get_dependencies('bin/foo', [os.path.abspath('stage/lib')]))
+
+    def test_runpath_comes_after_library_path(self):
+        make_elf('bin/foo', needed=['libfoo.so.1'], runpath='$ORIGIN/../lib')
+        make_elf('lib/libfoo.so.1')
+        make_elf('stage/lib/libfoo.so.1')
+
+        self.assertEqual(
+            [os.path.abspath('stage/lib/libfoo.so.1')],
+            elf.get_dependencies('bin/foo', [os.path.abspath('stage/lib')]))
+
+    def test_rpath_applies_to_needed_libraries(self):
+        make_elf('bin/foo', needed=['libfoo.so.1'],
+                 rpath=os.path.abspath('lib'))
+        make_elf('lib/libfoo.so.1', needed=['libbar.so.2'])
+        make_elf('lib/libbar.so.2')
+
+        self.assertEqual(
+            [os.path.abspath('lib/libfoo.so.1'),
+             os.path.abspath('lib/libbar.so.2')],
+            elf.get_dependencies('bin/foo'))
+
+    def test_libraries_of_other_architectures_are_skipped(self):
+        make_elf('bin/foo', needed=['libfoo.so.1'], machine=_ARMHF, bits=32)
+        make_elf('stage/lib/libfoo.so.1')
+        make_elf('system/libfoo.so.1', machine=_ARMHF, bits=32)
+
+        self.assertEqual(
+            [os.path.abspath('system/libfoo.so.1')],
+            elf.get_dependencies('bin/foo', [os.path.abspath('stage/lib')]))
+
+    def test_resolved_libraries_are_cached(self):
+        make_elf('bin/foo', needed=['libfoo.so.1'])
+        make_elf('bin/bar', needed=['libfoo.so.1'])
+        make_elf('system/libfoo.so.1')
+
+        with mock.patch('snapcraft.internal.elf._read_compatible',
+                        wraps=elf._read_compatible) as read_mock:
+            elf.get_dependencies('bin/foo')
+            elf.get_dependencies('bin/bar')
+
+        self.assertEqual(1, read_mock.call_count)
+
+
+class ReadLdSoConfTestCase(tests.TestCase):
+
+    def test_includes(self):
+        os.makedirs('ld.so.conf.d')
+        with open('ld.so.conf', 'w') as f:
+            f.write('# comment\n/first\ninclude ld.so.conf.d/*.conf\n/last\n')
+        with open(os.path.join('ld.so.conf.d', 'b.conf'), 'w') as f:
+            f.write('/b\n')
+        with open(os.path.join('ld.so.conf.d', 'a.conf'), 'w') as f:
+            f.write('/a # comment\n')
+
+        self.assertEqual(['/first', '/a', '/b', '/last'],
+                         elf._read_ld_so_conf('ld.so.conf'))
@@ -0,0 +1,158 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from unittest import mock
+
+from snapcraft.internal import fingerprint
+from snapcraft import tests
+
+
+class FingerprintTreeTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.tree = os.path.join(self.path, 'tree')
+        os.makedirs(os.path.join(self.tree, 'dir'))
+        self._write('file', 'file')
+        self._write(os.path.join('dir', 'nested'), 'nested')
+        os.symlink('file', os.path.join(self.tree, 'link'))
+        self.index_file = os.path.join(self.path, 'index')
+
+    def _write(self, name, contents):
+        with open(os.path.join(self.tree, name), 'w') as f:
+            f.write(contents)
+
+    def _fingerprint(self, **kwargs):
+        return fingerprint.fingerprint_tree(
+            self.tree, self.index_file, **kwargs)
+
+    def test_unchanged_tree(self):
+        self.assertEqual(self._fingerprint(), self._fingerprint())
+
+    def test_unchanged_files_are_not_read_again(self):
+        self._fingerprint()
+
+        with mock.patch('snapcraft.internal.fingerprint._hash_file',
+                        wraps=fingerprint._hash_file) as mock_hash_file:
+            self._write('file', 'changed')
+            self._fingerprint()
+
+        mock_hash_file.assert_called_once_with(
+            os.path.join(self.tree, 'file'))
+
+    def test_touched_file_keeps_fingerprint(self):
+        before = self._fingerprint()
+
+        os.utime(os.path.join(self.tree, 'file'), ns=(0, 0))
+
+        self.assertEqual(before, self._fingerprint())
+
+    def test_changed_file(self):
+        before = self._fingerprint()
+
+        self._write(os.path.join('dir', 'nested'), 'changed')
+
+        self.assertNotEqual(before, self._fingerprint())
+
+    def test_added_file(self):
+        before = self._fingerprint()
+
+        self._write('new', '')
+
+        self.assertNotEqual(before, self._fingerprint())
+
+    def test_removed_file(self):
+        before = self._fingerprint()
+
+        os.remove(os.path.join(self.tree, 'dir', 'nested'))
+
+        self.assertNotEqual(before, self._fingerprint())
+
+    def test_changed_mode(self):
+        before = self._fingerprint()
+
+        os.chmod(os.path.join(self.tree, 'file'), 0o755)
+
+        self.assertNotEqual(before, self._fingerprint())
+
+    def test_changed_link(self):
+        before = self._fingerprint()
+
+        os.remove(os.path.join(self.tree, 'link'))
+        os.symlink('dir', os.path.join(self.tree, 'link'))
+
+        self.assertNotEqual(before, self._fingerprint())
+
+    def test_ignored_names(self):
+        before = self._fingerprint(ignore=['parts'])
+
+        os.makedirs(os.path.join(self.tree, 'parts'))
+        self._write(os.path.join('parts', 'ignored'), '')
+
+        self.assertEqual(before, self._fingerprint(ignore=['parts']))
+
+    def test_ignored_names_only_apply_to_the_root(self):
+        before = self._fingerprint(ignore=['nested'])
+
+        self._write(os.path.join('dir', 'nested'), 'changed')
+
+        self.assertNotEqual(before, self._fingerprint(ignore=['nested']))
+
+    def test_invalid_index_is_ignored(self):
+        before = self._fingerprint()
+
+        with open(self.index_file, 'w') as f:
+            f.write('invalid')
+
+        self.assertEqual(before, self._fingerprint())
+
+
+class DigestCacheTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        with open('file', 'w') as f:
+            f.write('contents')
+        self.index_file = os.path.join('cache', 'index')
+
+    def test_digest_is_not_computed_again(self):
+        cache = fingerprint.DigestCache(self.index_file)
+        digest = cache.get_digest('file')
+        cache.save()
+
+        cache = fingerprint.DigestCache(self.index_file)
+        with mock.patch('snapcraft.internal.fingerprint._hash_file') as \
+                mock_hash:
+            self.assertEqual(digest, cache.get_digest('file'))
+        mock_hash.assert_not_called()
+
+    def test_changed_file(self):
+        cache = fingerprint.DigestCache(self.index_file)
+        digest = cache.get_digest('file')
+
+        with open('file', 'w') as f:
+            f.write('changed contents')
+
+        self.assertNotEqual(digest, cache.get_digest('file'))
+
+    def test_nothing_saved_if_unchanged(self):
+        cache = fingerprint.DigestCache(self.index_file)
+        cache.save()
+
+        self.assertFalse(os.path.exists(self.index_file))
@@ -0,0 +1,80 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from snapcraft.internal import common, jobserver
+from snapcraft import tests
+
+
+class JobServerTestCase(tests.TestCase):
+
+    def test_serve_does_nothing_for_serial_builds(self):
+        with jobserver.serve(1):
+            self.assertIsNone(jobserver.get())
+
+    def test_serve(self):
+        with jobserver.serve(4):
+            server = jobserver.get()
+            self.assertIsNotNone(server)
+            self.assertEqual(
+                '-j --jobserver-fds={},{}'.format(*server.fds),
+                server.makeflags)
+
+        self.assertIsNone(jobserver.get())
+
+    def test_nested_serve_reuses_jobserver(self):
+        with jobserver.serve(4):
+            server = jobserver.get()
+            with jobserver.serve(8):
+                self.assertIs(server, jobserver.get())
+            self.assertIs(server, jobserver.get())
+
+    def test_token_is_returned(self):
+        server = jobserver.JobServer(1)
+        self.addCleanup(server.close)
+
+        with server.token():
+            os.set_blocking(server.fds[0], False)
+            with self.assertRaises(BlockingIOError):
+                os.read(server.fds[0], 1)
+            os.set_blocking(server.fds[0], True)
+
+        with server.token():
+            pass
+
+    def test_run_exposes_jobserver_to_make(self):
+        with open('Makefile', 'w') as f:
+            f.write('all:\n\t@echo "$(MAKEFLAGS)"\n')
+
+        with jobserver.serve(4), open('output', 'w') as output_file:
+            server = jobserver.get()
+            common.run(['make', '--no-print-directory'], stdout=output_file)
+
+        with open('output') as f:
+            output = f.read()
+        self.assertIn('jobserver', output)
+        self.assertIn('{},{}'.format(*server.fds), output)
+
+    def test_run_without_jobserver(self):
+        with open('Makefile', 'w') as f:
+            f.write('all:\n\t@echo "$(MAKEFLAGS)"\n')
+
+        with open('output', 'w') as output_file:
+            common.run(['make', '--no-print-directory'], stdout=output_file)
+
+        with open('output') as f:
+            self.assertNotIn('jobserver', f.read())
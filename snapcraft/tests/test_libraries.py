@@ -17,12 +17,11 @@
 import fixtures
 import logging
 import os
-import subprocess
 import tempfile
 
 from unittest import mock
 
-from snapcraft.internal import libraries
+from snapcraft.internal import common, elf, libraries
 from snapcraft import tests
 
 
@@ -53,16 +52,12 @@ class TestGetLibraries(tests.TestCase):
     def setUp(self):
         super().setUp()
 
-        patcher = mock.patch('snapcraft.internal.common.run_output')
-        self.run_output_mock = patcher.start()
+        patcher = mock.patch('snapcraft.internal.elf.get_dependencies')
+        self.get_dependencies_mock = patcher.start()
         self.addCleanup(patcher.stop)
 
-        lines = [
-            'foo.so.1 => /lib/foo.so.1 (0xdead)',
-            'bar.so.2 => /usr/lib/bar.so.2 (0xbeef)',
-            '/lib/baz.so.2 (0x1234)',
-        ]
-        self.run_output_mock.return_value = '\t' + '\n\t'.join(lines) + '\n'
+        self.get_dependencies_mock.return_value = [
+            '/lib/foo.so.1', '/usr/lib/bar.so.2']
 
         patcher = mock.patch('snapcraft.internal.libraries._get_system_libs')
         self.get_system_libs_mock = patcher.start()
@@ -70,12 +65,6 @@ class TestGetLibraries(tests.TestCase):
 
         self.get_system_libs_mock.return_value = frozenset()
 
-        patcher = mock.patch('os.path.exists')
-        self.path_exists_mock = patcher.start()
-        self.addCleanup(patcher.stop)
-
-        self.path_exists_mock.return_value = True
-
         self.fake_logger = fixtures.FakeLogger(level=logging.WARNING)
         self.useFixture(self.fake_logger)
 
@@ -89,9 +78,19 @@ class TestGetLibraries(tests.TestCase):
         libs = libraries.get_dependencies('foo')
         self.assertEqual(libs, ['/usr/lib/bar.so.2'])
 
-    def test_get_libraries_ldd_failure_logs_warning(self):
-        self.run_output_mock.side_effect = subprocess.CalledProcessError(
-            1, 'foo', b'bar')
+    def test_get_libraries_uses_ld_library_path(self):
+        common.set_env(['LD_LIBRARY_PATH="/stage/lib:$LD_LIBRARY_PATH"',
+                        'LD_LIBRARY_PATH="/part/lib:$LD_LIBRARY_PATH"'])
+        self.useFixture(fixtures.EnvironmentVariable('LD_LIBRARY_PATH'))
+
+        libraries.get_dependencies(b'foo')
+
+        self.get_dependencies_mock.assert_called_once_with(
+            'foo', ['/part/lib', '/stage/lib'])
+
+    def test_get_libraries_invalid_elf_logs_warning(self):
+        self.get_dependencies_mock.side_effect = elf.ElfError(
+            "'foo' is not an ELF file")
 
         self.assertEqual(libraries.get_dependencies('foo'), [])
         self.assertEqual(
@@ -122,3 +121,57 @@ class TestSystemLibsOnNewRelease(tests.TestCase):
 
     def test_fail_gracefully_if_system_libs_not_found(self):
         self.assertEqual(libraries.get_dependencies('foo'), [])
+
+
+class DependencyCacheTestCase(tests.TestCase):
+
+    def test_environment_change_drops_entries(self):
+        open('elf', 'w').close()
+        st = os.lstat('elf')
+        cache_file = os.path.join('cache', 'dependencies')
+
+        cache = libraries.DependencyCache(cache_file)
+        cache.set('elf', st, ['/lib/libfoo.so'])
+        cache.save()
+
+        cache = libraries.DependencyCache(cache_file)
+        self.assertEqual((True, ['/lib/libfoo.so']), cache.get('elf', st))
+
+        common.set_env(['LD_LIBRARY_PATH=/elsewhere'])
+        cache = libraries.DependencyCache(cache_file)
+        self.assertEqual((False, None), cache.get('elf', st))
+
+    def test_library_change_drops_entry(self):
+        open('elf', 'w').close()
+        open('libfoo.so', 'w').close()
+        st = os.lstat('elf')
+        lib = os.path.abspath('libfoo.so')
+        cache_file = os.path.join('cache', 'dependencies')
+
+        cache = libraries.DependencyCache(cache_file)
+        cache.set('elf', st, [lib])
+        cache.save()
+
+        cache = libraries.DependencyCache(cache_file)
+        self.assertEqual((True, [lib]), cache.get('elf', st))
+
+        with open(lib, 'w') as f:
+            f.write('rebuilt')
+        self.assertEqual((False, None), cache.get('elf', st))
+
+    def test_library_directory_change_drops_entries(self):
+        os.mkdir('lib')
+        open('elf', 'w').close()
+        st = os.lstat('elf')
+        cache_file = os.path.join('cache', 'dependencies')
+        common.set_env(['LD_LIBRARY_PATH={}'.format(os.path.abspath('lib'))])
+
+        cache = libraries.DependencyCache(cache_file)
+        cache.set('elf', st, ['/lib/libfoo.so'])
+        cache.save()
+
+        # A library that would be found first is added to the search path.
+        open(os.path.join('lib', 'libfoo.so'), 'w').close()
+        os.utime('lib', ns=(0, 0))
+        cache = libraries.DependencyCache(cache_file)
+        self.assertEqual((False, None), cache.get('elf', st))
@@ -15,6 +15,8 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import logging
+import os
+import time
 
 import fixtures
 from unittest import mock
@@ -124,6 +126,31 @@ confinement: strict
             'Pulling part2 \n',
             self.fake_logger.output)
 
+    def test_changed_local_source_is_pulled_again(self):
+        self.make_snapcraft_yaml("""parts:
+  part1:
+    plugin: make
+    source: src
+""")
+        os.mkdir('src')
+        with open(os.path.join('src', 'Makefile'), 'w') as f:
+            f.write('all:\n')
+
+        lifecycle.execute('pull', self.project_options)
+        lifecycle.execute('pull', self.project_options)
+        self.assertTrue(
+            'Skipping pull part1 (already ran)' in self.fake_logger.output)
+
+        with open(os.path.join('src', 'Makefile'), 'a') as f:
+            f.write('install:\n')
+        lifecycle.execute('pull', self.project_options)
+
+        self.assertTrue(
+            'Cleaning pulled source for part1 (source changed)' in
+            self.fake_logger.output)
+        with open(os.path.join('parts', 'part1', 'src', 'Makefile')) as f:
+            self.assertEqual('all:\ninstall:\n', f.read())
+
     def test_os_type_returned_by_lifecycle(self):
         self.make_snapcraft_yaml("""parts:
   part1:
@@ -535,6 +562,181 @@ confinement: strict
             "part's 'pull' step in order to rebuild", str(raised.exception))
 
 
+class ConcurrentExecutionTestCases(ExecutionTestCases):
+
+    def setUp(self):
+        super().setUp()
+
+        self.project_options = snapcraft.ProjectOptions(
+            parallel_part_count=4)
+
+    def test_output_is_grouped_in_step_order(self):
+        self.make_snapcraft_yaml("""parts:
+  part1:
+    plugin: nil
+  part2:
+    plugin: nil
+""")
+
+        lifecycle.execute('build', self.project_options)
+
+        # Independent parts are shown in the same order as a serial run.
+        self.assertEqual(
+            'Preparing to pull part2 \n'
+            'Pulling part2 \n'
+            'Preparing to pull part1 \n'
+            'Pulling part1 \n'
+            'Preparing to build part2 \n'
+            'Building part2 \n'
+            'Preparing to build part1 \n'
+            'Building part1 \n',
+            self.fake_logger.output)
+
+    def test_prerequisites_are_staged_before_dependents_build(self):
+        self.make_snapcraft_yaml("""parts:
+  part1:
+    plugin: nil
+  part2:
+    plugin: nil
+    after:
+      - part1
+""")
+
+        lifecycle.execute('build', self.project_options)
+
+        self.assertEqual(
+            'Preparing to pull part1 \n'
+            'Pulling part1 \n'
+            'Preparing to pull part2 \n'
+            'Pulling part2 \n'
+            'Preparing to build part1 \n'
+            'Building part1 \n'
+            'Staging part1 \n'
+            'Preparing to build part2 \n'
+            'Building part2 \n',
+            self.fake_logger.output)
+
+    def test_pull_does_not_stage_prerequisites(self):
+        self.make_snapcraft_yaml("""parts:
+  part1:
+    plugin: nil
+  part2:
+    plugin: nil
+    after:
+      - part1
+""")
+
+        lifecycle.execute('pull', self.project_options)
+
+        self.assertEqual(
+            'Preparing to pull part1 \n'
+            'Pulling part1 \n'
+            'Preparing to pull part2 \n'
+            'Pulling part2 \n',
+            self.fake_logger.output)
+
+    def test_dependency_recursed_correctly(self):
+        # Unlike serial runs, pulling does not need prerequisites staged.
+        self.test_pull_does_not_stage_prerequisites()
+
+    def test_prime_runs_every_step(self):
+        self.make_snapcraft_yaml("""parts:
+  part1:
+    plugin: nil
+  part2:
+    plugin: nil
+    after:
+      - part1
+""")
+
+        lifecycle.execute('prime', self.project_options)
+
+        for part in ('part1', 'part2'):
+            self.verify_state(part, 'prime')
+
+    def test_collisions_are_checked_against_built_parts_only(self):
+        self.make_snapcraft_yaml("""parts:
+  part1:
+    plugin: nil
+  part2:
+    plugin: nil
+""")
+        build = pluginhandler.PluginHandler.build
+        checked = []
+
+        def slow_build(part, force=False):
+            os.makedirs(part.installdir, exist_ok=True)
+            if part.name == 'part2':
+                # Still building while part1 is staged.
+                time.sleep(1)
+            with open(os.path.join(part.installdir, 'file'), 'w') as f:
+                f.write(part.name)
+            build(part, force=force)
+
+        def check_for_collisions(parts):
+            checked.append({p.name: p.is_clean('build') for p in parts})
+            return real_check_for_collisions(parts)
+
+        real_check_for_collisions = pluginhandler.check_for_collisions
+        with mock.patch.object(pluginhandler.PluginHandler, 'build',
+                               slow_build):
+            with mock.patch.object(pluginhandler, 'check_for_collisions',
+                                   check_for_collisions):
+                with self.assertRaises(EnvironmentError) as raised:
+                    lifecycle.execute('stage', self.project_options)
+
+        for parts in checked:
+            self.assertFalse(any(parts.values()))
+        self.assertIn('have the following file paths in common',
+                      str(raised.exception))
+
+
+class BuildCacheExecutionTestCases(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.useFixture(fixtures.FakeLogger(level=logging.INFO))
+        self.project_options = snapcraft.ProjectOptions(use_build_cache=True)
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SNAPCRAFT_BUILD_CACHE_URL', 'http://localhost:1/'))
+        self.make_snapcraft_yaml("""name: test
+version: 0
+summary: test
+description: test
+confinement: strict
+
+parts:
+  part1:
+    plugin: nil
+  part2:
+    plugin: nil
+    after: [part1]
+""")
+
+    @mock.patch('snapcraft.internal.buildcache.BuildCache.restore',
+                return_value=False)
+    @mock.patch('snapcraft.internal.buildcache.BuildCache.save')
+    @mock.patch('snapcraft.internal.buildcache.BuildCache.fetch')
+    def test_builds_are_fetched_before_building(self, mock_fetch, *args):
+        lifecycle.execute('build', self.project_options)
+
+        # part1 is fetched while being staged for part2, part2 can only be
+        # fetched once that is done.
+        self.assertEqual(2, mock_fetch.call_count)
+        for fetch_call in mock_fetch.call_args_list:
+            self.assertEqual(1, len(fetch_call[0][0]))
+
+    @mock.patch('snapcraft.internal.buildcache.BuildCache.fetch')
+    def test_nothing_fetched_without_remote(self, mock_fetch):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SNAPCRAFT_BUILD_CACHE_URL'))
+
+        lifecycle.execute('build', self.project_options)
+
+        mock_fetch.assert_not_called()
+
+
 class HumanizeListTestCases(tests.TestCase):
 
     def test_no_items(self):
@@ -16,7 +16,9 @@
 
 import io
 import logging
+import os
 import pkg_resources
+import subprocess
 import sys
 from unittest import mock
 
@@ -34,7 +36,8 @@ class TestMain(TestCase):
         with mock.patch('snapcraft.ProjectOptions') as mock_project_options:
             snapcraft.main.main([])
             mock_project_options.assert_called_once_with(
-                parallel_builds=True, target_deb_arch=None, use_geoip=False)
+                parallel_builds=True, target_deb_arch=None, use_geoip=False,
+                parallel_part_count=1, use_build_cache=False)
             self.assertTrue(mock_cmd.called, mock_cmd.called)
 
     @mock.patch('snapcraft.internal.lifecycle.snap')
@@ -43,7 +46,8 @@ class TestMain(TestCase):
             snapcraft.main.main(['--enable-geoip'])
             self.assertTrue(mock_cmd.called, mock_cmd.called)
             mock_project_options.assert_called_once_with(
-                parallel_builds=True, target_deb_arch=None, use_geoip=True)
+                parallel_builds=True, target_deb_arch=None, use_geoip=True,
+                parallel_part_count=1, use_build_cache=False)
 
     def test_command_error(self):
         fake_logger = fixtures.FakeLogger(level=logging.ERROR)
@@ -77,21 +81,42 @@ class TestMain(TestCase):
         with mock.patch('snapcraft.ProjectOptions') as mock_project_options:
             snapcraft.main.main([])
             mock_project_options.assert_called_once_with(
-                parallel_builds=True, target_deb_arch=None, use_geoip=False)
+                parallel_builds=True, target_deb_arch=None, use_geoip=False,
+                parallel_part_count=1, use_build_cache=False)
 
     @mock.patch('snapcraft.internal.lifecycle.snap')
     def test_command_disable_parallel_build(self, mock_cmd):
         with mock.patch('snapcraft.ProjectOptions') as mock_project_options:
             snapcraft.main.main(['--no-parallel-build'])
             mock_project_options.assert_called_once_with(
-                parallel_builds=False, target_deb_arch=None, use_geoip=False)
+                parallel_builds=False, target_deb_arch=None, use_geoip=False,
+                parallel_part_count=1, use_build_cache=False)
 
     @mock.patch('snapcraft.internal.lifecycle.snap')
     def test_command_with_target_deb_arch(self, mock_cmd):
         with mock.patch('snapcraft.ProjectOptions') as mock_project_options:
             snapcraft.main.main(['--target-arch', 'arm64'])
             mock_project_options.assert_called_once_with(
-                parallel_builds=True, target_deb_arch='arm64', use_geoip=False)
+                parallel_builds=True, target_deb_arch='arm64', use_geoip=False,
+                parallel_part_count=1, use_build_cache=False)
+
+    @mock.patch('snapcraft.internal.lifecycle.snap')
+    def test_command_with_jobs(self, mock_cmd):
+        with mock.patch('snapcraft.ProjectOptions') as mock_project_options:
+            snapcraft.main.main(['--jobs', '4'])
+            mock_project_options.assert_called_once_with(
+                parallel_builds=True, target_deb_arch=None, use_geoip=False,
+                parallel_part_count=4, use_build_cache=False)
+
+    def test_command_with_invalid_jobs(self):
+        fake_logger = fixtures.FakeLogger(level=logging.ERROR)
+        self.useFixture(fake_logger)
+
+        with self.assertRaises(SystemExit):
+            snapcraft.main.main(['build', '--jobs', 'many'])
+
+        self.assertEqual(
+            "--jobs expects a number, not 'many'\n", fake_logger.output)
 
     @mock.patch('pkg_resources.require')
     @mock.patch('sys.stdout', new_callable=io.StringIO)
@@ -103,3 +128,47 @@ class TestMain(TestCase):
             snapcraft.main.main()
 
         self.assertEqual(mock_stdout.getvalue(), 'devel\n')
+
+
+class StartupTestCase(TestCase):
+
+    # What must not be imported before a command needs it, to keep
+    # snapcraft quick to start.
+    slow_modules = ['apt', 'jsonschema', 'magic', 'pkg_resources',
+                    'progressbar', 'pymacaroons', 'requests',
+                    'requests_toolbelt', 'tabulate', 'snapcraft.storeapi']
+
+    def run_python(self, code, **env):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path), **env)
+        return subprocess.run(
+            [sys.executable, '-c', code], env=env, check=True,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+            universal_newlines=True)
+
+    def get_imported_modules(self, code):
+        output = self.run_python(
+            code + '\nimport sys\nprint("\\n".join(sys.modules))').stdout
+        return set(output.splitlines())
+
+    def test_slow_modules_are_not_imported(self):
+        modules = self.get_imported_modules('import snapcraft.main')
+
+        self.assertEqual([], [m for m in self.slow_modules if m in modules])
+
+    def test_list_plugins_does_not_import_plugins(self):
+        modules = self.get_imported_modules(
+            'import snapcraft.main\n'
+            'snapcraft.main.main(["list-plugins"])')
+
+        self.assertNotIn('snapcraft.plugins.nil', modules)
+        self.assertEqual([], [m for m in self.slow_modules if m in modules])
+
+    def test_import_time_report(self):
+        stderr = self.run_python(
+            'import snapcraft.main', SNAPCRAFT_IMPORT_TIME='1').stderr
+
+        self.assertIn(
+            'import time: self [us] | cumulative | imported package\n',
+            stderr)
+        self.assertRegex(
+            stderr, r'import time: +\d+ \| +\d+ \| snapcraft._baseplugin\n')
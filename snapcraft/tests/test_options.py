@@ -62,3 +62,11 @@ class OptionsTestCase(tests.TestCase):
             snapcraft.ProjectOptions()
         except KeyError:
             self.fail('Expected s390x to be supported')
+
+    def test_parallel_part_count_defaults_to_one(self):
+        self.assertEqual(1, snapcraft.ProjectOptions().parallel_part_count)
+
+    def test_parallel_part_count_is_at_least_one(self):
+        options = snapcraft.ProjectOptions(parallel_part_count=0)
+
+        self.assertEqual(1, options.parallel_part_count)
@@ -0,0 +1,162 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from unittest import mock
+
+import yaml
+
+from snapcraft.internal import parts
+from snapcraft import tests
+
+
+class RemotePartsIndexTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.parts_yaml = parts.get_remote_parts_file()
+        self.index_file = os.path.join(
+            os.path.dirname(self.parts_yaml), 'parts.db')
+
+    def test_update_builds_the_index(self):
+        parts.update()
+
+        self.assertTrue(os.path.exists(self.index_file))
+
+    def test_parts_are_read_from_the_index(self):
+        parts.update()
+
+        with mock.patch('yaml.load') as load_mock:
+            remote_part = parts.get_remote_parts().get_part('curl')
+
+        self.assertFalse(load_mock.called)
+        self.assertEqual(
+            {'plugin': 'autotools', 'source': 'http://curl.org'},
+            remote_part)
+
+    def test_missing_part(self):
+        parts.update()
+
+        self.assertRaises(
+            KeyError, parts.get_remote_parts().get_part, 'missing')
+
+    def test_nothing_is_read_until_a_part_is_needed(self):
+        with mock.patch('snapcraft.internal.parts.update') as update_mock:
+            parts.get_remote_parts()
+
+        self.assertFalse(update_mock.called)
+        self.assertFalse(os.path.exists(self.parts_yaml))
+
+    def test_missing_parts_are_downloaded_when_needed(self):
+        remote_parts = parts.get_remote_parts()
+
+        self.assertEqual('go', remote_parts.get_part('part1')['plugin'])
+        self.assertTrue(os.path.exists(self.index_file))
+
+    def test_changed_parts_yaml_is_indexed_again(self):
+        parts.update()
+        with open(self.parts_yaml, 'w') as f:
+            yaml.dump({'new-part': {
+                'plugin': 'nil', 'description': 'new', 'maintainer': 'me'}},
+                f)
+
+        remote_parts = parts.get_remote_parts()
+
+        self.assertEqual({'plugin': 'nil'}, remote_parts.get_part('new-part'))
+        self.assertRaises(KeyError, remote_parts.get_part, 'curl')
+
+    def test_corrupt_index_is_built_again(self):
+        parts.update()
+        with open(self.index_file, 'w') as f:
+            f.write('not a database')
+
+        self.assertEqual(
+            'go', parts.get_remote_parts().get_part('part1')['plugin'])
+
+
+class SearchTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        parts_yaml = parts.get_remote_parts_file()
+        os.makedirs(os.path.dirname(parts_yaml))
+        with open(parts_yaml, 'w') as f:
+            yaml.dump({
+                'curl': {
+                    'plugin': 'autotools',
+                    'description': 'a command line tool to transfer data',
+                    'maintainer': 'Jane Doe <jane@example.com>',
+                },
+                'curl-dev': {
+                    'plugin': 'autotools',
+                    'description': 'headers of curl',
+                    'maintainer': 'John Doe <john@example.com>',
+                },
+                'libcurl': {
+                    'plugin': 'make',
+                    'description': 'the library behind curl',
+                    'maintainer': 'Jane Doe <jane@example.com>',
+                },
+                'wget': {
+                    'plugin': 'autotools',
+                    'description': 'retrieves files over http with curling',
+                    'maintainer': '100%_real <real@example.com>',
+                },
+                'transfer': {
+                    'plugin': 'nil',
+                    'description': 'nothing to see',
+                    'maintainer': 'John Doe <john@example.com>',
+                },
+            }, f)
+        self.remote_parts = parts.get_remote_parts()
+
+    def get_names(self, *args, **kwargs):
+        matches, max_len = self.remote_parts.matches_for(*args, **kwargs)
+        return list(matches)
+
+    def test_best_matches_come_first(self):
+        self.assertEqual(['curl', 'libcurl', 'curl-dev', 'wget'],
+                         self.get_names('curl'))
+
+    def test_matches_descriptions(self):
+        self.assertEqual(['transfer', 'curl'], self.get_names('transfer'))
+
+    def test_matches_close_words(self):
+        self.assertEqual(['transfer', 'curl'], self.get_names('transfers'))
+
+    def test_longest_name(self):
+        matches, max_len = self.remote_parts.matches_for('curl')
+
+        self.assertEqual(len('curl-dev'), max_len)
+
+    def test_empty_query_matches_all(self):
+        self.assertEqual(5, len(self.get_names('')))
+
+    def test_no_match(self):
+        self.assertEqual([], self.get_names('gcc'))
+
+    def test_filter_by_plugin(self):
+        self.assertEqual(['libcurl'], self.get_names('curl', plugin='make'))
+        self.assertEqual(['curl', 'curl-dev', 'wget'],
+                         self.get_names('', plugin='autotools'))
+
+    def test_filter_by_maintainer(self):
+        self.assertEqual(['curl', 'libcurl'],
+                         self.get_names('curl', maintainer='jane'))
+        self.assertEqual(['wget'], self.get_names('', maintainer='100%_'))
+        self.assertEqual([], self.get_names('', maintainer='0%x'))
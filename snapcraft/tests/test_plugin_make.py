@@ -20,6 +20,7 @@ from unittest import mock
 
 import snapcraft
 from snapcraft import tests
+from snapcraft.internal import jobserver
 from snapcraft.plugins import make
 
 
@@ -88,6 +89,22 @@ class MakePluginTestCase(tests.TestCase):
                        'DESTDIR={}'.format(plugin.installdir)])
         ])
 
+    @mock.patch.object(make.MakePlugin, 'run')
+    def test_build_with_jobserver(self, run_mock):
+        plugin = make.MakePlugin('test-part', self.options,
+                                 self.project_options)
+        os.makedirs(plugin.sourcedir)
+
+        # make gets its jobs from the jobserver instead.
+        with jobserver.serve(2):
+            plugin.build()
+
+        run_mock.assert_has_calls([
+            mock.call(['make']),
+            mock.call(['make', 'install',
+                       'DESTDIR={}'.format(plugin.installdir)])
+        ])
+
     @mock.patch.object(make.MakePlugin, 'run')
     def test_build_makefile(self, run_mock):
         self.options.makefile = 'makefile.linux'
@@ -20,6 +20,7 @@ import os
 import shutil
 import tempfile
 from unittest.mock import (
+    ANY,
     call,
     Mock,
     MagicMock,
@@ -27,10 +28,12 @@ from unittest.mock import (
 )
 
 import fixtures
+import yaml
 
 import snapcraft
 from snapcraft.internal import (
     common,
+    libraries,
     lifecycle,
     pluginhandler,
     states,
@@ -271,6 +274,64 @@ class PluginTestCase(tests.TestCase):
             self.assertEqual(f.read(), 'installed',
                              "Expected migrated 'bar' to be a copy of 'foo'")
 
+    def test_migrate_files_leaves_existing_symlinks_alone(self):
+        os.makedirs(os.path.join('install', 'dir'))
+        os.makedirs(os.path.join('stage', 'dir'))
+
+        for name in ('foo', 'bar'):
+            with open(os.path.join('install', 'dir', name), 'w') as f:
+                f.write('installed')
+        os.symlink('elsewhere', os.path.join('stage', 'dir', 'foo'))
+        with open(os.path.join('stage', 'dir', 'bar'), 'w') as f:
+            f.write('staged')
+
+        files, dirs = pluginhandler._migratable_filesets(['*'], 'install')
+        pluginhandler._migrate_files(files, dirs, 'install', 'stage')
+
+        self.assertEqual(
+            'elsewhere', os.readlink(os.path.join('stage', 'dir', 'foo')))
+        with open(os.path.join('stage', 'dir', 'bar')) as f:
+            self.assertEqual('installed', f.read())
+
+    def test_migrate_files_creates_missing_parents(self):
+        os.makedirs(os.path.join('install', 'usr', 'lib', 'foo'))
+        open(os.path.join('install', 'usr', 'lib', 'foo', 'bar'), 'w').close()
+
+        pluginhandler._migrate_files(
+            {'usr/lib/foo/bar'}, {'usr/lib/foo'}, 'install', 'stage')
+
+        self.assertTrue(
+            os.path.isfile(os.path.join('stage', 'usr', 'lib', 'foo', 'bar')))
+
+    def test_migrate_files_fixes_up_matching_files_only(self):
+        os.makedirs(os.path.join('install', 'lib', 'pkgconfig'))
+        for name in ('foo.pc', 'foo.so'):
+            open(os.path.join('install', 'lib', 'pkgconfig', name),
+                 'w').close()
+        fixup_func = Mock()
+
+        files, dirs = pluginhandler._migratable_filesets(['*'], 'install')
+        pluginhandler._migrate_files(files, dirs, 'install', 'stage',
+                                     fixup_func=fixup_func,
+                                     fixup_pattern='*.pc')
+
+        fixup_func.assert_called_once_with(
+            os.path.join('stage', 'lib', 'pkgconfig', 'foo.pc'))
+
+    @patch('snapcraft.internal.pluginhandler._MIGRATE_CHUNK_SIZE', new=2)
+    def test_migrate_many_files(self):
+        os.makedirs('install')
+        for i in range(9):
+            with open(os.path.join('install', str(i)), 'w') as f:
+                f.write(str(i))
+
+        files, dirs = pluginhandler._migratable_filesets(['*'], 'install')
+        pluginhandler._migrate_files(files, dirs, 'install', 'stage')
+
+        for i in range(9):
+            with open(os.path.join('stage', str(i))) as f:
+                self.assertEqual(str(i), f.read())
+
     @patch('importlib.import_module')
     @patch('snapcraft.internal.pluginhandler._load_local')
     @patch('snapcraft.internal.pluginhandler._get_plugin')
@@ -518,6 +579,51 @@ class MigratableFilesetsTestCase(tests.TestCase):
         self.assertEqual({'foo/bar/baz/3'}, files)
         self.assertEqual({'foo', 'foo/bar', 'foo/bar/baz'}, dirs)
 
+    def test_migratable_filesets_wildcards_skip_hidden_files(self):
+        open('install/.hidden', 'w').close()
+        open('install/foo/.hidden', 'w').close()
+
+        files, dirs = pluginhandler._migratable_filesets(
+            ['*', '-*/.*'], 'install')
+        self.assertEqual({'1', 'foo/2', 'foo/bar/3', 'foo/bar/baz/4'}, files)
+
+        files, dirs = pluginhandler._migratable_filesets(['.*'], 'install')
+        self.assertEqual({'.hidden'}, files)
+
+    def test_migratable_filesets_exclude_whole_directory(self):
+        files, dirs = pluginhandler._migratable_filesets(
+            ['*', '-foo/bar'], 'install')
+        self.assertEqual({'1', 'foo/2'}, files)
+        self.assertEqual({'foo'}, dirs)
+
+    def test_migratable_filesets_exclude_in_included_directory(self):
+        files, dirs = pluginhandler._migratable_filesets(
+            ['foo', '-*/*/3'], 'install')
+        self.assertEqual({'foo/2', 'foo/bar/baz/4'}, files)
+        self.assertEqual({'foo', 'foo/bar', 'foo/bar/baz'}, dirs)
+
+    def test_migratable_filesets_missing_literal_include(self):
+        files, dirs = pluginhandler._migratable_filesets(
+            ['foo/missing'], 'install')
+        self.assertEqual({'foo/missing'}, files)
+        self.assertEqual({'foo'}, dirs)
+
+    def test_migratable_filesets_do_not_descend_into_symlinks(self):
+        os.symlink('foo', 'install/link')
+
+        files, dirs = pluginhandler._migratable_filesets(['*'], 'install')
+        self.assertEqual(
+            {'1', 'link', 'foo/2', 'foo/bar/3', 'foo/bar/baz/4'}, files)
+        self.assertEqual({'foo', 'foo/bar', 'foo/bar/baz'}, dirs)
+
+    def test_migratable_filesets_wildcards_go_through_symlinks(self):
+        os.symlink('foo', 'install/link')
+
+        files, dirs = pluginhandler._migratable_filesets(
+            ['link/*'], 'install')
+        self.assertEqual({'link/2', 'link/bar/3', 'link/bar/baz/4'}, files)
+        self.assertEqual({'link', 'link/bar', 'link/bar/baz'}, dirs)
+
 
 class RealStageTestCase(tests.TestCase):
 
@@ -673,14 +779,15 @@ class StateTestCase(tests.TestCase):
                 handler = pluginhandler.load_plugin('foo', 'nil')
                 handler.makedirs()
 
-                for later_step in common.COMMAND_ORDER[index+1:]:
-                    open(handler._step_state_file(later_step), 'w').close()
+                for any_step in common.COMMAND_ORDER:
+                    handler.mark_done(any_step)
 
                 handler.mark_done(step)
 
+                self.assertEqual(step, handler.last_step())
                 for later_step in common.COMMAND_ORDER[index+1:]:
-                    self.assertFalse(
-                        os.path.exists(handler._step_state_file(later_step)),
+                    self.assertIsNone(
+                        handler.get_state(later_step),
                         'Expected later step states to be cleared')
 
     def test_state_file_migration(self):
@@ -696,6 +803,25 @@ class StateTestCase(tests.TestCase):
                 handler = pluginhandler.load_plugin(part_name, 'nil')
                 self.assertEqual(step, handler.last_step())
 
+    def test_state_directory_migration(self):
+        state_dir = os.path.join(self.parts_dir, 'foo', 'state')
+        os.makedirs(state_dir)
+        with open(os.path.join(state_dir, 'pull'), 'w') as f:
+            f.write(yaml.dump(states.PullState({'source'})))
+        with open(os.path.join(state_dir, 'stage'), 'w') as f:
+            f.write(yaml.dump(states.StageState({'bin/1'}, {'bin'})))
+
+        handler = pluginhandler.load_plugin('foo', 'nil')
+
+        self.assertFalse(os.path.exists(state_dir))
+        self.assertEqual('stage', handler.last_step())
+        self.assertEqual(states.PullState({'source'}),
+                         handler.get_state('pull'))
+        self.assertIsNone(handler.get_state('build'))
+        state = handler.get_state('stage')
+        self.assertEqual({'bin/1'}, state.files)
+        self.assertEqual({'bin'}, state.directories)
+
     @patch('snapcraft.internal.repo.Ubuntu')
     def test_pull_state(self, ubuntu_mock):
         self.assertEqual(None, self.handler.last_step())
@@ -763,6 +889,18 @@ class StateTestCase(tests.TestCase):
         self.assertTrue(type(state.project_options) is dict)
         self.assertTrue('deb_arch' in state.project_options)
 
+    def test_clean_build_incremental_keeps_build_dir(self):
+        self.handler.build()
+        open(os.path.join(self.handler.code.builddir, 'built'), 'w').close()
+        open(os.path.join(self.handler.installdir, 'installed'), 'w').close()
+
+        self.handler.clean_build(incremental=True)
+
+        self.assertEqual(None, self.handler.last_step())
+        self.assertTrue(os.path.exists(
+            os.path.join(self.handler.code.builddir, 'built')))
+        self.assertFalse(os.path.exists(self.handler.installdir))
+
     @patch('importlib.import_module')
     @patch('snapcraft.internal.pluginhandler._load_local')
     @patch('snapcraft.internal.pluginhandler._get_plugin')
@@ -949,7 +1087,8 @@ class StateTestCase(tests.TestCase):
         self.handler.prime()
 
         self.assertEqual('prime', self.handler.last_step())
-        mock_find_dependencies.assert_called_once_with(self.handler.snapdir)
+        mock_find_dependencies.assert_called_once_with(
+            self.handler.snapdir, {'bin/1', 'bin/2'}, ANY)
         self.assertFalse(mock_copy.called)
 
         state = self.handler.get_state('prime')
@@ -992,7 +1131,8 @@ class StateTestCase(tests.TestCase):
         self.handler.prime()
 
         self.assertEqual('prime', self.handler.last_step())
-        mock_find_dependencies.assert_called_once_with(self.handler.snapdir)
+        mock_find_dependencies.assert_called_once_with(
+            self.handler.snapdir, {'bin/1', 'bin/2'}, ANY)
         mock_migrate_files.assert_has_calls([
             call({'bin/1', 'bin/2'}, {'bin'}, self.handler.stagedir,
                  self.handler.snapdir),
@@ -1040,7 +1180,8 @@ class StateTestCase(tests.TestCase):
         self.handler.prime()
 
         self.assertEqual('prime', self.handler.last_step())
-        mock_find_dependencies.assert_called_once_with(self.handler.snapdir)
+        mock_find_dependencies.assert_called_once_with(
+            self.handler.snapdir, {'bin/1'}, ANY)
         self.assertFalse(mock_copy.called)
 
         state = self.handler.get_state('prime')
@@ -1132,6 +1273,63 @@ class StateTestCase(tests.TestCase):
             "This won't work until a complete clean has occurred.")
 
 
+class BuildCacheTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.fake_logger = fixtures.FakeLogger(level=logging.INFO)
+        self.useFixture(self.fake_logger)
+
+        self.handler = pluginhandler.load_plugin(
+            'test-part', 'nil',
+            project_options=snapcraft.ProjectOptions(use_build_cache=True))
+        self.handler.makedirs()
+
+        def build():
+            with open(os.path.join(self.handler.installdir, 'built'), 'w'):
+                pass
+        patcher = patch.object(self.handler.code, 'build', side_effect=build)
+        self.build_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_build_is_restored_from_cache(self):
+        self.handler.build()
+        self.handler.clean_build()
+        self.assertFalse(os.path.exists(self.handler.installdir))
+        self.build_mock.reset_mock()
+
+        self.handler.build()
+
+        self.build_mock.assert_not_called()
+        self.assertTrue(os.path.exists(
+            os.path.join(self.handler.installdir, 'built')))
+        self.assertEqual('build', self.handler.last_step())
+        self.assertTrue(
+            'Building test-part (restored from cache)\n' in
+            self.fake_logger.output)
+
+    def test_changed_source_is_not_restored_from_cache(self):
+        self.handler.build()
+        self.handler.clean_build()
+        self.build_mock.reset_mock()
+
+        open(os.path.join(self.handler.code.sourcedir, 'new'), 'w').close()
+        self.handler.build()
+
+        self.build_mock.assert_called_once_with()
+
+    def test_cache_disabled(self):
+        self.handler = pluginhandler.load_plugin(
+            'test-part', 'nil', project_options=snapcraft.ProjectOptions())
+        self.handler.makedirs()
+
+        with patch('snapcraft.internal.buildcache.BuildCache') as mock_cache:
+            self.handler.build()
+
+        mock_cache.assert_not_called()
+
+
 class IsDirtyTestCase(tests.TestCase):
 
     def setUp(self):
@@ -1730,8 +1928,19 @@ class PerStepCleanTestCase(tests.TestCase):
         self.manager_mock.assert_has_calls([
             call.clean_prime({}, 'foo'),
             call.clean_stage({}, 'foo'),
-            call.clean_build('foo'),
-            call.clean_pull('foo'),
+            call.clean_build('foo', False),
+            call.clean_pull('foo', False),
+        ])
+
+    def test_clean_incremental(self):
+        handler = pluginhandler.load_plugin('test_part', 'nil')
+        handler.clean(step='pull', incremental=True)
+
+        self.manager_mock.assert_has_calls([
+            call.clean_prime({}, ''),
+            call.clean_stage({}, ''),
+            call.clean_build('', True),
+            call.clean_pull('', True),
         ])
 
     def test_clean_pull_order(self):
@@ -1743,8 +1952,8 @@ class PerStepCleanTestCase(tests.TestCase):
         self.manager_mock.assert_has_calls([
             call.clean_prime({}, ''),
             call.clean_stage({}, ''),
-            call.clean_build(''),
-            call.clean_pull(''),
+            call.clean_build('', False),
+            call.clean_pull('', False),
         ])
 
     def test_clean_build_order(self):
@@ -1756,7 +1965,7 @@ class PerStepCleanTestCase(tests.TestCase):
         self.manager_mock.assert_has_calls([
             call.clean_prime({}, ''),
             call.clean_stage({}, ''),
-            call.clean_build(''),
+            call.clean_build('', False),
         ])
 
     def test_clean_stage_order(self):
@@ -1832,6 +2041,40 @@ class CollisionTestCase(tests.TestCase):
             "Parts 'part2' and 'part3' have the following file paths in "
             "common which have different contents:\n1\na/2")
 
+    def test_collision_reported_against_first_owner(self):
+        with open(self.part1.installdir + '/1', mode='w') as f:
+            f.write('1')
+
+        with self.assertRaises(EnvironmentError) as raised:
+            pluginhandler.check_for_collisions(
+                [self.part1, self.part2, self.part3])
+
+        self.assertEqual(
+            raised.exception.__str__(),
+            "Parts 'part1' and 'part3' have the following file paths in "
+            "common which have different contents:\n1")
+
+    def test_identical_files_are_not_read_again(self):
+        with open(self.part3.installdir + '/1', mode='w') as f:
+            f.write('1')
+        shutil.copy(self.part2.installdir + '/a/2',
+                    self.part3.installdir + '/a/2')
+        parts = [self.part1, self.part2, self.part3]
+
+        pluginhandler.check_for_collisions(parts)
+        with patch('snapcraft.internal.fingerprint._hash_file') as \
+                mock_hash_file:
+            pluginhandler.check_for_collisions(parts)
+
+        mock_hash_file.assert_not_called()
+
+    def test_files_only_in_one_part_are_not_read(self):
+        with patch('snapcraft.internal.fingerprint._hash_file') as \
+                mock_hash_file:
+            pluginhandler.check_for_collisions([self.part1, self.part2])
+
+        mock_hash_file.assert_not_called()
+
 
 class StageEnvTestCase(tests.TestCase):
 
@@ -2023,10 +2266,13 @@ class StagePackagesTestCase(tests.TestCase):
     def setUp(self):
         super().setUp()
 
-        patcher = patch('snapcraft.internal.repo._setup_apt_cache')
-        self.setup_apt_mock = patcher.start()
-        self.setup_apt_mock.return_value = ({}, None)
+        patcher = patch('snapcraft.internal.repo._get_apt_index')
+        get_apt_index_mock = patcher.start()
         self.addCleanup(patcher.stop)
+        apt_index = get_apt_index_mock.return_value
+        apt_index.get_cache.return_value = ({}, None)
+        apt_index.get_kept_names.return_value = (set(), set())
+        apt_index.load_resolution.return_value = None
 
     def test_missing_stage_package_displays_nice_error(self):
         part_schema = {
@@ -2185,6 +2431,70 @@ class FindDependenciesTestCase(tests.TestCase):
             dependencies,
             'statically linked files should not have library dependencies')
 
+    @patch('magic.open')
+    @patch('snapcraft.internal.libraries.get_dependencies')
+    def test_find_dependencies_of_given_files_only(self, mock_dependencies,
+                                                   mock_magic):
+        workdir = os.path.join(os.getcwd(), 'workdir')
+        os.makedirs(workdir)
+        open(os.path.join(workdir, 'mine'), 'w').close()
+        open(os.path.join(workdir, 'other'), 'w').close()
+
+        mock_ms = Mock()
+        mock_magic.return_value = mock_ms
+        mock_ms.load.return_value = 0
+        mock_ms.file.return_value = 'JPEG image data, Exif standard: ...'
+
+        pluginhandler._find_dependencies(workdir, {'mine'})
+
+        mock_ms.file.assert_called_once_with(
+            bytes(os.path.join(workdir, 'mine'), 'utf-8'))
+
+    @patch('magic.open')
+    @patch('snapcraft.internal.libraries.get_dependencies')
+    def test_find_dependencies_uses_cache(self, mock_dependencies,
+                                          mock_magic):
+        workdir = os.path.join(os.getcwd(), 'workdir')
+        os.makedirs(workdir)
+        open(os.path.join(workdir, 'linked'), 'w').close()
+        open(os.path.join(workdir, 'not-elf'), 'w').close()
+        open('libDepends.so', 'w').close()
+        lib = os.path.abspath('libDepends.so')
+
+        mock_ms = Mock()
+        mock_magic.return_value = mock_ms
+        mock_ms.load.return_value = 0
+        mock_ms.file.side_effect = lambda path: (
+            'ELF 64-bit LSB executable, dynamically linked'
+            if path.endswith(b'linked') else 'ASCII text')
+        mock_dependencies.return_value = [lib]
+        cache_file = os.path.join('cache', 'dependencies')
+
+        cache = libraries.DependencyCache(cache_file)
+        dependencies = pluginhandler._find_dependencies(
+            workdir, {'linked', 'not-elf'}, cache)
+        cache.save()
+        self.assertEqual({lib}, dependencies)
+
+        mock_ms.file.reset_mock()
+        mock_dependencies.reset_mock()
+        cache = libraries.DependencyCache(cache_file)
+        dependencies = pluginhandler._find_dependencies(
+            workdir, {'linked', 'not-elf'}, cache)
+
+        self.assertEqual({lib}, dependencies)
+        mock_ms.file.assert_not_called()
+        mock_dependencies.assert_not_called()
+
+        # Changed files are looked at again.
+        with open(os.path.join(workdir, 'linked'), 'w') as f:
+            f.write('changed')
+        pluginhandler._find_dependencies(
+            workdir, {'linked', 'not-elf'}, cache)
+
+        mock_ms.file.assert_called_once_with(
+            bytes(os.path.join(workdir, 'linked'), 'utf-8'))
+
     @patch('magic.open')
     def test_fail_to_load_magic_raises_exception(self, mock_magic):
         mock_magic.return_value.load.return_value = 1
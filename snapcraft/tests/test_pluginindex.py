@@ -0,0 +1,88 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from unittest import mock
+
+from snapcraft.internal import pluginindex
+from snapcraft import tests
+
+
+class PluginIndexTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.plugins_dir = os.path.abspath('plugins')
+        os.makedirs(os.path.join(self.plugins_dir, 'package'))
+        self.make_plugin('__init__.py', '')
+        self.make_plugin('documented.py', '"""Some documentation."""\n')
+        self.make_plugin('undocumented.py', 'import something_missing\n')
+        self.make_plugin(os.path.join('package', '__init__.py'),
+                         "'''A package.'''\n")
+        self.make_plugin('README', 'not a plugin\n')
+
+        patcher = mock.patch(
+            'snapcraft.internal.pluginindex._get_plugins_dir',
+            return_value=self.plugins_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_plugin(self, name, content):
+        with open(os.path.join(self.plugins_dir, name), 'w') as f:
+            f.write(content)
+
+    def test_plugin_names(self):
+        self.assertEqual(['documented', 'package', 'undocumented'],
+                         pluginindex.get_plugin_names())
+
+    def test_plugin_doc(self):
+        self.assertEqual('Some documentation.',
+                         pluginindex.get_plugin_doc('documented'))
+        self.assertEqual('A package.',
+                         pluginindex.get_plugin_doc('package'))
+        self.assertIsNone(pluginindex.get_plugin_doc('undocumented'))
+
+    def test_missing_plugin(self):
+        self.assertRaises(KeyError, pluginindex.get_plugin_doc, 'missing')
+
+    def test_index_is_reused(self):
+        pluginindex.get_plugin_names()
+
+        with mock.patch('snapcraft.internal.pluginindex._read_doc') as \
+                read_doc_mock:
+            self.assertEqual('Some documentation.',
+                             pluginindex.get_plugin_doc('documented'))
+
+        self.assertFalse(read_doc_mock.called)
+
+    def test_changed_plugin_is_read_again(self):
+        pluginindex.get_plugin_names()
+
+        self.make_plugin('documented.py', '"""Other documentation."""\n')
+        self.make_plugin('new.py', '"""New."""\n')
+
+        self.assertEqual('Other documentation.',
+                         pluginindex.get_plugin_doc('documented'))
+        self.assertEqual('New.', pluginindex.get_plugin_doc('new'))
+
+
+class BundledPluginsTestCase(tests.TestCase):
+
+    def test_bundled_plugins(self):
+        self.assertIn('nil', pluginindex.get_plugin_names())
+        self.assertTrue(pluginindex.get_plugin_doc('nil').startswith(
+            'The nil plugin is'))
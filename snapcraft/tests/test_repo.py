@@ -15,14 +15,17 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 import fixtures
+import hashlib
 import logging
 import os
 import stat
+import subprocess
 import tempfile
 import unittest.mock
 
 import snapcraft
 from snapcraft import repo
+from snapcraft.internal import debcache
 from snapcraft import tests
 
 
@@ -247,3 +250,359 @@ class BuildPackagesTestCase(tests.TestCase):
             "Could not find a required package in 'build-packages': "
             '"The cache has no package named \'package-does-not-exist\'"',
             str(raised.exception))
+
+
+class AptIndexTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = unittest.mock.patch('snapcraft.repo._setup_apt_cache')
+        self.setup_apt_mock = patcher.start()
+        self.setup_apt_mock.side_effect = lambda rootdir, sources: (
+            unittest.mock.MagicMock(), unittest.mock.Mock())
+        self.addCleanup(patcher.stop)
+
+        patcher = unittest.mock.patch('snapcraft.repo._update_apt_cache')
+        self.update_apt_mock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = unittest.mock.patch('snapcraft.repo._get_sources_list')
+        sources_mock = patcher.start()
+        sources_mock.side_effect = lambda sources, project_options: (
+            sources or 'local sources')
+        self.addCleanup(patcher.stop)
+
+        patcher = unittest.mock.patch('apt.apt_pkg.config')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def make_ubuntu(self, part_name='part', sources=None):
+        return repo.Ubuntu(os.path.join('parts', part_name, 'ubuntu'),
+                           sources=sources)
+
+    def make_package(self, name, version='1.0', priority='optional'):
+        pkg = unittest.mock.Mock(marked_install=True, shortname=name)
+        pkg.name = name
+        pkg.candidate.version = version
+        pkg.candidate.architecture = 'amd64'
+        pkg.candidate.priority = priority
+        pkg.candidate.sha256 = '{}-sha256'.format(name)
+        pkg.candidate.uri = 'http://archive/{}.deb'.format(name)
+        return pkg
+
+    def set_up_index(self, ubuntu, packages, release='release'):
+        # What updating the indexes leaves in the lists directory.
+        lists_dir = os.path.join(
+            ubuntu._index.rootdir, 'var', 'lib', 'apt', 'lists')
+        os.makedirs(lists_dir, exist_ok=True)
+        with open(os.path.join(lists_dir, 'archive_InRelease'), 'w') as f:
+            f.write(release)
+
+        apt_cache, _ = ubuntu._index.get_cache()
+        apt_cache.get_changes.return_value = packages
+        apt_cache.__iter__.side_effect = lambda: iter(packages)
+        apt_cache.__getitem__.side_effect = lambda name: {
+            pkg.name: pkg for pkg in packages}[name]
+        apt_cache.__contains__.side_effect = lambda name: name in {
+            pkg.name for pkg in packages}
+        return apt_cache
+
+    def test_parts_with_the_same_sources_share_the_index(self):
+        first = self.make_ubuntu('first')
+        second = self.make_ubuntu('second')
+        other = self.make_ubuntu('other', sources='other sources')
+
+        self.assertIs(first._index, second._index)
+        self.assertIsNot(first._index, other._index)
+        self.assertFalse(self.setup_apt_mock.called)
+
+    def test_get_forgets_the_packages_of_other_parts(self):
+        ubuntu = self.make_ubuntu()
+
+        ubuntu.get(['foo'])
+
+        apt_cache, _ = ubuntu._index.get_cache()
+        calls = apt_cache.mock_calls
+        self.assertEqual(unittest.mock.call.clear(), calls[0])
+        self.assertIn(unittest.mock.call.__getitem__().mark_install(), calls)
+
+    def test_indexes_are_updated_once(self):
+        self.make_ubuntu('first').get(['foo'])
+        self.make_ubuntu('second').get(['bar'])
+
+        self.assertEqual(1, self.update_apt_mock.call_count)
+
+    def test_resolution(self):
+        ubuntu = self.make_ubuntu()
+        foo = self.make_package('foo', '1:1.0')
+        apt_cache = self.set_up_index(ubuntu, [foo])
+
+        ubuntu.get(['foo'])
+
+        self.assertEqual([{
+            'name': 'foo',
+            'version': '1:1.0',
+            'filename': 'foo_1%3a1.0_amd64.deb',
+            'sha256': 'foo-sha256',
+            'uri': 'http://archive/foo.deb',
+        }], ubuntu._index.load_resolution(['foo'], ubuntu._deb_arch))
+        self.assertTrue(apt_cache.fetch_archives.called)
+
+    def test_kept_packages_are_not_staged(self):
+        ubuntu = self.make_ubuntu()
+        packages = [self.make_package('foo'), self.make_package('libc6'),
+                    self.make_package('base-files')]
+        self.set_up_index(ubuntu, packages)
+
+        ubuntu.get(['foo'])
+
+        packages[0].mark_keep.assert_not_called()
+        packages[1].mark_keep.assert_called_once_with()
+        packages[2].mark_keep.assert_called_once_with()
+
+    def test_kept_names_are_found_once(self):
+        ubuntu = self.make_ubuntu()
+        apt_cache = self.set_up_index(
+            ubuntu, [self.make_package('foo'), self.make_package('bar')])
+
+        ubuntu.get(['foo'])
+        ubuntu.get(['bar'])
+
+        self.assertEqual(1, apt_cache.__iter__.call_count)
+
+    def test_resolved_packages_already_fetched(self):
+        ubuntu = self.make_ubuntu()
+        apt_cache = self.set_up_index(ubuntu, [self.make_package('foo')])
+        ubuntu.get(['foo'])
+        open(os.path.join(ubuntu.downloaddir, 'foo_1.0_amd64.deb'),
+             'w').close()
+        apt_cache.reset_mock()
+        # As in the next run.
+        repo._apt_indexes.clear()
+
+        ubuntu = self.make_ubuntu()
+        apt_cache = self.set_up_index(ubuntu, [self.make_package('foo')])
+        apt_cache.reset_mock()
+        ubuntu.get(['foo'])
+
+        self.assertEqual(2, self.update_apt_mock.call_count)
+        self.assertFalse(apt_cache.get_changes.called)
+        self.assertFalse(apt_cache.fetch_archives.called)
+
+    def test_resolved_packages_are_fetched_without_resolving(self):
+        ubuntu = self.make_ubuntu()
+        packages = [self.make_package('foo')]
+        self.set_up_index(ubuntu, packages)
+        ubuntu.get(['foo'])
+        repo._apt_indexes.clear()
+
+        ubuntu = self.make_ubuntu()
+        apt_cache = self.set_up_index(ubuntu, packages)
+        ubuntu.get(['foo'])
+
+        self.assertEqual(2, self.update_apt_mock.call_count)
+        self.assertFalse(apt_cache.get_changes.called)
+        packages[0].mark_install.assert_called_with(
+            auto_fix=False, auto_inst=False)
+        self.assertTrue(apt_cache.fetch_archives.called)
+
+    def test_changed_indexes_are_resolved_again(self):
+        ubuntu = self.make_ubuntu()
+        self.set_up_index(ubuntu, [self.make_package('foo')])
+        ubuntu.get(['foo'])
+        repo._apt_indexes.clear()
+
+        ubuntu = self.make_ubuntu()
+        self.set_up_index(
+            ubuntu, [self.make_package('foo', '2.0')], 'new release')
+        ubuntu.get(['foo'])
+
+        self.assertEqual(2, self.update_apt_mock.call_count)
+        self.assertEqual(
+            '2.0', ubuntu._index.load_resolution(
+                ['foo'], ubuntu._deb_arch)[0]['version'])
+
+    def test_indexes_changed_by_the_update_are_resolved_again(self):
+        ubuntu = self.make_ubuntu()
+        self.set_up_index(ubuntu, [self.make_package('foo')])
+        ubuntu.get(['foo'])
+        open(os.path.join(ubuntu.downloaddir, 'foo_1.0_amd64.deb'),
+             'w').close()
+        repo._apt_indexes.clear()
+
+        ubuntu = self.make_ubuntu()
+        apt_cache = self.set_up_index(
+            ubuntu, [self.make_package('foo', '2.0')])
+        lists_dir = os.path.join(
+            ubuntu._index.rootdir, 'var', 'lib', 'apt', 'lists')
+
+        def update_apt_cache(rootdir, apt_cache, progress):
+            # The archive got a new release since the last run.
+            with open(os.path.join(lists_dir, 'archive_InRelease'),
+                      'w') as f:
+                f.write('new release')
+        self.update_apt_mock.side_effect = update_apt_cache
+        ubuntu.get(['foo'])
+
+        self.assertTrue(apt_cache.get_changes.called)
+        self.assertEqual(
+            '2.0', ubuntu._index.load_resolution(
+                ['foo'], ubuntu._deb_arch)[0]['version'])
+
+    def test_packages_are_linked_from_the_deb_cache(self):
+        ubuntu = self.make_ubuntu()
+        foo = self.make_package('foo')
+        foo.candidate.sha256 = hashlib.sha256(b'foo').hexdigest()
+        apt_cache = self.set_up_index(ubuntu, [foo])
+        with open('foo.deb', 'wb') as f:
+            f.write(b'foo')
+        debcache.get_cache().save(foo.candidate.sha256, 'foo.deb')
+
+        ubuntu.get(['foo'])
+
+        self.assertTrue(os.path.exists(
+            os.path.join(ubuntu.downloaddir, 'foo_1.0_amd64.deb')))
+        self.assertFalse(apt_cache.fetch_archives.called)
+
+    def test_fetched_packages_are_saved_in_the_deb_cache(self):
+        ubuntu = self.make_ubuntu()
+        foo = self.make_package('foo')
+        foo.candidate.sha256 = hashlib.sha256(b'foo').hexdigest()
+        apt_cache = self.set_up_index(ubuntu, [foo])
+
+        def fetch_archives(progress):
+            with open(os.path.join(
+                    ubuntu.downloaddir, 'foo_1.0_amd64.deb'), 'wb') as f:
+                f.write(b'foo')
+        apt_cache.fetch_archives.side_effect = fetch_archives
+
+        ubuntu.get(['foo'])
+
+        self.assertTrue(debcache.get_cache().restore(
+            foo.candidate.sha256, 'restored.deb'))
+
+
+class UnpackTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = unittest.mock.patch('snapcraft.repo._get_apt_index')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.ubuntu = repo.Ubuntu(os.path.join('parts', 'part', 'ubuntu'))
+        os.makedirs(self.ubuntu.downloaddir)
+        self.installdir = os.path.join('parts', 'part', 'install')
+
+    def make_deb(self, name, files):
+        pkgdir = os.path.join('debs', name)
+        os.makedirs(os.path.join(pkgdir, 'DEBIAN'))
+        with open(os.path.join(pkgdir, 'DEBIAN', 'control'), 'w') as f:
+            f.write('Package: {}\nVersion: 1.0\nArchitecture: all\n'
+                    'Maintainer: Nobody <nobody@example.com>\n'
+                    'Description: {}\n'.format(name, name))
+        for path, content in files.items():
+            path = os.path.join(pkgdir, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(content)
+        deb = os.path.join(self.ubuntu.downloaddir, '{}.deb'.format(name))
+        subprocess.check_call(['dpkg-deb', '--build', pkgdir, deb],
+                              stdout=subprocess.DEVNULL)
+        return deb
+
+    def test_unpack_extracts_all_packages(self):
+        self.make_deb('foo', {'usr/bin/foo': 'foo'})
+        self.make_deb('bar', {'usr/lib/pkgconfig/bar.pc': 'prefix=/usr\n'})
+
+        self.ubuntu.unpack(self.installdir)
+
+        self.assertTrue(os.path.exists(
+            os.path.join(self.installdir, 'usr', 'bin', 'foo')))
+        with open(os.path.join(
+                self.installdir, 'usr', 'lib', 'pkgconfig', 'bar.pc')) as f:
+            self.assertEqual('prefix={}/usr\n'.format(self.installdir),
+                             f.read())
+
+    def test_unpacked_packages_are_not_extracted_again(self):
+        self.make_deb('foo', {'usr/bin/foo': 'foo'})
+        self.make_deb('bar', {'usr/lib/pkgconfig/bar.pc': 'prefix=/usr\n'})
+        self.ubuntu.unpack(self.installdir)
+
+        with unittest.mock.patch('subprocess.check_output') as extract_mock:
+            self.ubuntu.unpack(self.installdir)
+
+        self.assertFalse(extract_mock.called)
+
+    def test_new_packages_are_extracted_and_fixed_alone(self):
+        self.make_deb('bar', {'usr/lib/pkgconfig/bar.pc': 'prefix=/usr\n'})
+        self.ubuntu.unpack(self.installdir)
+        self.make_deb('foo', {'usr/bin/foo': 'foo'})
+
+        self.ubuntu.unpack(self.installdir)
+
+        self.assertTrue(os.path.exists(
+            os.path.join(self.installdir, 'usr', 'bin', 'foo')))
+        # The pkg-config file of bar is not prefixed twice.
+        with open(os.path.join(
+                self.installdir, 'usr', 'lib', 'pkgconfig', 'bar.pc')) as f:
+            self.assertEqual('prefix={}/usr\n'.format(self.installdir),
+                             f.read())
+
+    def test_removed_files_are_extracted_again(self):
+        self.make_deb('foo', {'usr/bin/foo': 'foo'})
+        self.ubuntu.unpack(self.installdir)
+        os.remove(os.path.join(self.installdir, 'usr', 'bin', 'foo'))
+
+        self.ubuntu.unpack(self.installdir)
+
+        self.assertTrue(os.path.exists(
+            os.path.join(self.installdir, 'usr', 'bin', 'foo')))
+
+    def test_trees_are_copied_from_the_deb_cache(self):
+        self.make_deb('foo', {'usr/bin/foo': 'foo',
+                              'usr/lib/pkgconfig/foo.pc': 'prefix=/usr\n'})
+        self.ubuntu.unpack(self.installdir)
+
+        with unittest.mock.patch('subprocess.check_output') as extract_mock:
+            self.ubuntu.unpack('other')
+
+        self.assertFalse(extract_mock.called)
+        with open(os.path.join('other', 'usr', 'bin', 'foo')) as f:
+            self.assertEqual('foo', f.read())
+        # pkg-config files are fixed for each directory.
+        for rootdir in (self.installdir, 'other'):
+            path = os.path.join(rootdir, 'usr', 'lib', 'pkgconfig', 'foo.pc')
+            with open(path) as f:
+                self.assertEqual('prefix={}/usr\n'.format(rootdir), f.read())
+
+    def test_changing_unpacked_files_leaves_the_deb_cache_alone(self):
+        self.make_deb('foo', {'usr/bin/foo': 'foo'})
+        self.ubuntu.unpack(self.installdir)
+
+        path = os.path.join(self.installdir, 'usr', 'bin', 'foo')
+        self.assertEqual(1, os.stat(path).st_nlink)
+        with open(path, 'r+') as f:
+            f.write('bar')
+        self.ubuntu.unpack('other')
+
+        with open(os.path.join('other', 'usr', 'bin', 'foo')) as f:
+            self.assertEqual('foo', f.read())
+
+    def test_unpack_without_deb_cache(self):
+        self.useFixture(fixtures.EnvironmentVariable(
+            'SNAPCRAFT_DEB_CACHE_SIZE', '0'))
+        ubuntu = repo.Ubuntu(self.ubuntu.rootdir)
+        self.make_deb('foo', {'usr/bin/foo': 'foo'})
+
+        ubuntu.unpack(self.installdir)
+
+        self.assertEqual(1, os.stat(
+            os.path.join(self.installdir, 'usr', 'bin', 'foo')).st_nlink)
+
+    def test_unpack_error(self):
+        with open(os.path.join(self.ubuntu.downloaddir, 'bad.deb'), 'w') as f:
+            f.write('not a deb')
+
+        with self.assertRaises(repo.UnpackError):
+            self.ubuntu.unpack(self.installdir)
@@ -0,0 +1,146 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+import threading
+
+import fixtures
+
+from snapcraft.internal import common, scheduler
+from snapcraft import tests
+
+
+class _FakePart:
+
+    def __init__(self, name):
+        self.name = name
+
+
+def _make_task(part_name, step, *prerequisites):
+    task = scheduler.Task(_FakePart(part_name), step)
+    task.prerequisites = set(prerequisites)
+    return task
+
+
+class SchedulerTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.fake_logger = fixtures.FakeLogger(level=logging.INFO)
+        self.useFixture(self.fake_logger)
+
+    def test_prerequisites_run_first(self):
+        pull = _make_task('part1', 'pull')
+        build = _make_task('part1', 'build', pull)
+        other_pull = _make_task('part2', 'pull')
+
+        finished = []
+        scheduler.Scheduler(4).run(
+            [pull, other_pull, build], lambda t: finished.append(t))
+
+        self.assertEqual(3, len(finished))
+        self.assertLess(finished.index(pull), finished.index(build))
+
+    def test_independent_tasks_run_concurrently(self):
+        # Both tasks wait for each other, so this only finishes if they run
+        # at the same time.
+        barrier = threading.Barrier(2, timeout=5)
+        tasks = [_make_task('part1', 'pull'), _make_task('part2', 'pull')]
+
+        scheduler.Scheduler(2).run(tasks, lambda t: barrier.wait())
+
+    def test_output_is_replayed_in_task_order(self):
+        slow = _make_task('part1', 'pull')
+        fast = _make_task('part2', 'pull')
+        fast_done = threading.Event()
+
+        def _run(task):
+            if task is slow:
+                fast_done.wait(timeout=5)
+            logging.getLogger(__name__).info('Running %s', task.name)
+            common.run(['echo', 'output of {}'.format(task.name)])
+            if task is fast:
+                fast_done.set()
+
+        stream = _FakeStream()
+        with fixtures.MonkeyPatch('sys.stdout', stream):
+            scheduler.Scheduler(2).run([slow, fast], _run)
+
+        self.assertEqual(
+            'Running part1:pull\nRunning part2:pull\n',
+            self.fake_logger.output)
+        self.assertEqual(
+            'output of part1:pull\noutput of part2:pull\n',
+            stream.getvalue())
+
+    def test_tasks_get_their_own_environment(self):
+        environments = {}
+        lock = threading.Lock()
+
+        def _run(task):
+            common.set_env(['PART={}'.format(task.part.name)])
+            with lock:
+                environments[task.name] = common.assemble_env()
+
+        common.set_env(['GLOBAL=1'])
+        scheduler.Scheduler(2).run(
+            [_make_task('part1', 'pull'), _make_task('part2', 'pull')], _run)
+
+        self.assertEqual({'part1:pull': 'export PART=part1',
+                          'part2:pull': 'export PART=part2'}, environments)
+        self.assertEqual('export GLOBAL=1', common.assemble_env())
+
+    def test_failure_stops_scheduling(self):
+        pull = _make_task('part1', 'pull')
+        build = _make_task('part1', 'build', pull)
+        finished = []
+
+        def _run(task):
+            if task is pull:
+                raise RuntimeError('pull failed')
+            finished.append(task)
+
+        with self.assertRaises(RuntimeError) as raised:
+            scheduler.Scheduler(2).run([pull, build], _run)
+
+        self.assertEqual('pull failed', str(raised.exception))
+        self.assertEqual([], finished)
+
+    def test_unsatisfiable_prerequisites_raise(self):
+        task = _make_task('part1', 'build', _make_task('part1', 'pull'))
+
+        with self.assertRaises(RuntimeError) as raised:
+            scheduler.Scheduler(2).run([task], lambda t: None)
+
+        self.assertEqual(
+            'Cannot schedule part1:build: unsatisfiable prerequisites',
+            str(raised.exception))
+
+
+class _FakeStream:
+
+    def __init__(self):
+        self._data = []
+
+    def write(self, text):
+        self._data.append(text)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return ''.join(self._data)
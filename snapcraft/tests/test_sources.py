@@ -485,6 +485,77 @@ class TestLocal(tests.TestCase):
         self.assertGreater(
             os.stat(os.path.join('destination', 'dir', 'file')).st_nlink, 1)
 
+    def test_pulling_again_only_updates_changes(self):
+        os.makedirs(os.path.join('src', 'dir'))
+        open(os.path.join('src', 'dir', 'file'), 'w').close()
+        open(os.path.join('src', 'removed'), 'w').close()
+        open(os.path.join('src', 'replaced'), 'w').close()
+
+        local = sources.Local('src', 'destination')
+        local.pull()
+
+        unchanged = os.stat(os.path.join('destination', 'dir', 'file'))
+        os.remove(os.path.join('src', 'removed'))
+        os.remove(os.path.join('src', 'replaced'))
+        with open(os.path.join('src', 'replaced'), 'w') as f:
+            f.write('new')
+        open(os.path.join('src', 'added'), 'w').close()
+
+        with unittest.mock.patch('os.link', wraps=os.link) as mock_link:
+            local.pull()
+
+        self.assertEqual(['added', 'dir', 'replaced'],
+                         sorted(os.listdir('destination')))
+        self.assertEqual(2, mock_link.call_count)
+        self.assertEqual(
+            unchanged.st_ino,
+            os.stat(os.path.join('destination', 'dir', 'file')).st_ino)
+        self.assertTrue(os.path.samefile(
+            os.path.join('src', 'replaced'),
+            os.path.join('destination', 'replaced')))
+
+    def test_fingerprint_ignores_snapcraft_specific_data(self):
+        os.makedirs(os.path.join('src', 'dir'))
+        open(os.path.join('src', 'dir', 'file'), 'w').close()
+        local = sources.Local('src', 'destination')
+        fingerprint = local.fingerprint('index')
+
+        os.makedirs(os.path.join('src', 'parts'))
+        open(os.path.join('src', 'snapcraft.yaml'), 'w').close()
+        open(os.path.join('src', 'foo.snap'), 'w').close()
+
+        self.assertEqual(fingerprint, local.fingerprint('index'))
+
+        with open(os.path.join('src', 'dir', 'file'), 'w') as f:
+            f.write('changed')
+
+        self.assertNotEqual(fingerprint, local.fingerprint('index'))
+
+
+class TestGetFingerprint(tests.TestCase):
+
+    def test_local_source(self):
+        os.mkdir('src')
+        options = tests.MockOptions(source='src')
+
+        self.assertTrue(sources.get_fingerprint('dummy', options, 'index'))
+
+    def test_missing_local_source(self):
+        options = tests.MockOptions(source='src')
+
+        self.assertIsNone(sources.get_fingerprint('dummy', options, 'index'))
+
+    def test_remote_source(self):
+        options = tests.MockOptions(
+            source='https://github.com/ubuntu-core/snapcraft.git')
+
+        self.assertIsNone(sources.get_fingerprint('dummy', options, 'index'))
+
+    def test_no_source(self):
+        options = tests.MockOptions(source=None)
+
+        self.assertIsNone(sources.get_fingerprint('dummy', options, 'index'))
+
 
 class TestUri(tests.TestCase):
 
@@ -41,7 +41,7 @@ class PullStateTestCase(tests.TestCase):
 
     def test_representation(self):
         expected = ('PullState(project_options: {}, properties: {}, '
-                    'schema_properties: {})').format(
+                    'schema_properties: {}, source_fingerprint: None)').format(
             self.project.__dict__, self.options.__dict__,
             self.schema_properties)
         self.assertEqual(expected, repr(self.state))
@@ -59,7 +59,10 @@ class PullStateTestCase(tests.TestCase):
             snapcraft.internal.states.PullState(
                 self.schema_properties, None, self.project),
             snapcraft.internal.states.PullState(
-                self.schema_properties, self.options, None)
+                self.schema_properties, self.options, None),
+            snapcraft.internal.states.PullState(
+                self.schema_properties, self.options, self.project,
+                'fingerprint'),
         ]
 
         for index, other in enumerate(others):
@@ -0,0 +1,114 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import shutil
+from unittest import mock
+
+from snapcraft.internal import states
+from snapcraft.internal.states import _store
+from snapcraft import tests
+
+
+class StateStoreTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        self.store = states.get_store('parts')
+
+    def test_store_is_shared(self):
+        self.assertIs(self.store,
+                      states.get_store(os.path.abspath('parts')))
+
+    def test_no_database_is_created_by_reads(self):
+        self.assertIsNone(self.store.get_last_step('foo'))
+        self.assertIsNone(self.store.get_state('foo', 'pull'))
+        self.store.clear_state('foo', 'pull')
+
+        self.assertFalse(os.path.exists('parts'))
+
+    def test_last_step(self):
+        self.store.set_state('foo', 'pull', {})
+        self.store.set_state('foo', 'build', {})
+        self.store.set_state('bar', 'pull', {})
+
+        self.assertEqual('build', self.store.get_last_step('foo'))
+        self.assertEqual('pull', self.store.get_last_step('bar'))
+
+    def test_set_state_clears_later_steps(self):
+        for step in ('pull', 'build', 'stage'):
+            self.store.set_state('foo', step, {})
+
+        self.store.set_state('foo', 'build', {'again': True})
+
+        self.assertEqual('build', self.store.get_last_step('foo'))
+        self.assertEqual({'again': True},
+                         self.store.get_state('foo', 'build'))
+        self.assertIsNone(self.store.get_state('foo', 'stage'))
+
+    def test_clear_state(self):
+        self.store.set_state('foo', 'pull', {})
+        self.store.set_state('foo', 'build', {})
+
+        self.store.clear_state('foo', 'build')
+
+        self.assertEqual('pull', self.store.get_last_step('foo'))
+
+    def test_state_round_trip(self):
+        state = states.PrimeState(
+            {'bin/foo', 'bin/foobar', 'lib/libfoo.so', 'lib/libfoo.so.1'},
+            {'bin', 'lib'}, {'/usr/lib'})
+
+        self.store.set_state('foo', 'prime', state)
+
+        self.assertEqual(state, self.store.get_state('foo', 'prime'))
+
+    def test_path_sets_are_decoded_when_used(self):
+        self.store.set_state('foo', 'stage', states.StageState(
+            {'bin/foo'}, {'bin'}, mock.Mock(stage=['bin'])))
+
+        with mock.patch('snapcraft.internal.states._store._decode_paths',
+                        wraps=_store._decode_paths) as decode_mock:
+            state = self.store.get_state('foo', 'stage')
+            self.assertEqual({'stage': ['bin']}, state.properties)
+            self.assertFalse(decode_mock.called)
+
+            self.assertEqual({'bin/foo'}, state.files)
+            self.assertEqual({'bin'}, state.directories)
+
+    def test_removed_database_is_not_used(self):
+        self.store.set_state('foo', 'pull', {})
+
+        shutil.rmtree('parts')
+
+        self.assertIsNone(self.store.get_last_step('foo'))
+        self.store.set_state('bar', 'pull', {})
+        self.assertEqual('pull', self.store.get_last_step('bar'))
+
+
+class EncodePathsTestCase(tests.TestCase):
+
+    def test_round_trip(self):
+        paths = {'usr/lib/libfoo.so', 'usr/lib/libfoo.so.1', 'usr/bin/a b',
+                 'usr', '\udcff-undecodable', ''}
+
+        self.assertEqual(paths, _store._decode_paths(
+            _store._encode_paths(paths)))
+
+    def test_empty(self):
+        self.assertEqual(set(), _store._decode_paths(
+            _store._encode_paths(set())))
@@ -0,0 +1,108 @@
+# -*- Mode:Python; indent-tabs-mode:nil; tab-width:4 -*-
+#
+# Copyright (C) 2016 Canonical Ltd
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License version 3 as
+# published by the Free Software Foundation.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from unittest import mock
+
+from snapcraft.internal import sync
+from snapcraft import tests
+
+
+class SyncTreeTestCase(tests.TestCase):
+
+    def setUp(self):
+        super().setUp()
+
+        os.makedirs(os.path.join('src', 'dir'))
+        self._write(os.path.join('src', 'file'), 'file')
+        self._write(os.path.join('src', 'dir', 'nested'), 'nested')
+        os.symlink('file', os.path.join('src', 'link'))
+
+    def _write(self, path, contents):
+        with open(path, 'w') as f:
+            f.write(contents)
+
+    def _read(self, path):
+        with open(path) as f:
+            return f.read()
+
+    def test_sync_to_new_destination(self):
+        sync.sync_tree('src', 'dst')
+
+        self.assertEqual('file', self._read(os.path.join('dst', 'file')))
+        self.assertEqual(
+            'nested', self._read(os.path.join('dst', 'dir', 'nested')))
+        self.assertEqual('file', os.readlink(os.path.join('dst', 'link')))
+        self.assertEqual(
+            os.stat(os.path.join('src', 'file')).st_mtime_ns,
+            os.stat(os.path.join('dst', 'file')).st_mtime_ns)
+
+    def test_unchanged_files_are_not_copied(self):
+        sync.sync_tree('src', 'dst')
+        self._write(os.path.join('src', 'file'), 'changed')
+
+        mock_copy = mock.Mock()
+        sync.sync_tree('src', 'dst', copy_function=mock_copy)
+
+        mock_copy.assert_called_once_with(
+            os.path.join('src', 'file'), os.path.join('dst', 'file'))
+
+    def test_changed_types_are_replaced(self):
+        sync.sync_tree('src', 'dst')
+        os.remove(os.path.join('src', 'link'))
+        os.mkdir(os.path.join('src', 'link'))
+        os.remove(os.path.join('src', 'file'))
+        os.symlink('dir', os.path.join('src', 'file'))
+
+        sync.sync_tree('src', 'dst')
+
+        self.assertTrue(os.path.isdir(os.path.join('dst', 'link')))
+        self.assertEqual('dir', os.readlink(os.path.join('dst', 'file')))
+
+    def test_everything_else_is_removed_without_manifest(self):
+        sync.sync_tree('src', 'dst')
+        self._write(os.path.join('dst', 'dir', 'extra'), '')
+        os.remove(os.path.join('src', 'file'))
+
+        sync.sync_tree('src', 'dst')
+
+        self.assertEqual(['dir', 'link'], sorted(os.listdir('dst')))
+        self.assertEqual(['nested'], os.listdir(os.path.join('dst', 'dir')))
+
+    def test_only_removed_files_are_removed_with_manifest(self):
+        sync.sync_tree('src', 'dst', manifest='manifest')
+        self._write(os.path.join('dst', 'dir', 'extra'), '')
+        os.remove(os.path.join('src', 'file'))
+
+        sync.sync_tree('src', 'dst', manifest='manifest')
+
+        self.assertEqual(['dir', 'link'], sorted(os.listdir('dst')))
+        self.assertEqual(['extra', 'nested'],
+                         sorted(os.listdir(os.path.join('dst', 'dir'))))
+
+    def test_removed_directories_are_removed_with_manifest(self):
+        sync.sync_tree('src', 'dst', manifest='manifest')
+        os.remove(os.path.join('src', 'dir', 'nested'))
+        os.rmdir(os.path.join('src', 'dir'))
+
+        sync.sync_tree('src', 'dst', manifest='manifest')
+
+        self.assertEqual(['file', 'link'], sorted(os.listdir('dst')))
+
+    def test_ignore(self):
+        sync.sync_tree('src', 'dst', ignore=lambda d, names: ['file'])
+
+        self.assertEqual(['dir', 'link'], sorted(os.listdir('dst')))
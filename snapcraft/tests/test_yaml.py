@@ -25,7 +25,7 @@ import unittest.mock
 import fixtures
 
 import snapcraft
-from snapcraft.internal import dirs, parts
+from snapcraft.internal import common, dirs, parts
 from snapcraft.internal import yaml as internal_yaml
 from snapcraft import tests
 from snapcraft._schema import SnapcraftSchemaError
@@ -186,10 +186,10 @@ parts:
 
         call1 = unittest.mock.call('part1', 'go', {
             'stage': [], 'snap': [], 'stage-packages': ['fswebcam']},
-            project_options, self.part_schema)
+            project_options, self.part_schema, True)
         call2 = unittest.mock.call('curl', 'autotools', {
             'source': 'http://curl.org'},
-            project_options, self.part_schema)
+            project_options, self.part_schema, True)
 
         mock_load.assert_has_calls([call1, call2])
 
@@ -1392,13 +1392,10 @@ class TestValidation(tests.TestCase):
                          msg=self.data)
 
     def test_schema_file_not_found(self):
-        mock_the_open = unittest.mock.mock_open()
-        mock_the_open.side_effect = FileNotFoundError()
+        common.set_schemadir(os.path.join('nonexistent', 'schema'))
 
-        with unittest.mock.patch('snapcraft._schema.open',
-                                 mock_the_open, create=True):
-            with self.assertRaises(SnapcraftSchemaError) as raised:
-                internal_yaml.Validator(self.data).validate()
+        with self.assertRaises(SnapcraftSchemaError) as raised:
+            internal_yaml.Validator(self.data).validate()
 
         expected_message = ('snapcraft validation file is missing from '
                             'installation path')